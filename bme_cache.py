@@ -0,0 +1,219 @@
+import glob
+import hashlib
+import json
+import os
+import time
+
+# Cache výsledků celého běhu: vedle výstupů se ukládá manifest s hashem vstupu,
+# efektivním nastavením a verzí nástroje. Stejný vstup se stejným nastavením
+# se pak nezpracovává znovu, použijí se existující výstupy.
+
+CACHE_FORMAT = 1
+# Kolik bajtů ze začátku a konce souboru se čte pro rychlou kontrolu.
+PARTIAL_HASH_BYTES = 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+# Verze nástroje se počítá ze všech modulů projektu (*.py vedle tohoto souboru),
+# takže žádný nový modul, který mění výstupy, nezůstane mimo klíč cache.
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+_tool_version = None
+
+
+def tool_version():
+    # Verze = hash zdrojových kódů, takže každá změna nástroje cache zneplatní.
+    global _tool_version
+    if _tool_version is None:
+        digest = hashlib.blake2b(digest_size=8)
+        for module in sorted(glob.glob(os.path.join(_SOURCE_DIR, "*.py"))):
+            try:
+                with open(module, "rb") as file:
+                    source = file.read()
+            except OSError:
+                continue
+            digest.update(os.path.basename(module).encode("utf-8"))
+            digest.update(len(source).to_bytes(8, "big"))
+            digest.update(source)
+        _tool_version = digest.hexdigest()
+    return _tool_version
+
+
+def manifest_path(file_name):
+    return os.path.join("output", f"{file_name}_cache.json")
+
+
+def _json_default(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, "fieldnames") and hasattr(value, "positions"):
+        # ColumnMapping
+        return {"fieldnames": value.fieldnames, "positions": value.positions}
+    raise TypeError(f"Nelze serializovat {type(value).__name__}")
+
+
+def options_key(options):
+    return json.loads(json.dumps(options or {}, sort_keys=True, default=_json_default))
+
+
+def partial_hash(file_path, size):
+    # Začátek + konec souboru + velikost, bez čtení celého souboru.
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(file_path, "rb") as file:
+        digest.update(file.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            file.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(file.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Souborový objekt pro ET.iterparse, který během parsování počítá hash přečtených bajtů.
+# Vstup se tak čte jen jednou.
+class HashingReader:
+
+    def __init__(self, file_path):
+        self.name = file_path
+        self._file = open(file_path, "rb")
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._digest.update(data)
+        return data
+
+    def hexdigest(self):
+        # Parser nemusí dočíst konec souboru (bílé znaky za rootem) - dočte se zde.
+        while chunk := self.read(_CHUNK_SIZE):
+            pass
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _load_manifest(file_name, logger):
+    path = manifest_path(file_name)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning("Cache manifest %s nelze načíst: %s", path, exc)
+        return None
+    return manifest if isinstance(manifest, dict) and manifest.get("format") == CACHE_FORMAT else None
+
+
+def _outputs_intact(outputs):
+    for output in outputs:
+        try:
+            stat = os.stat(os.path.join("output", output["name"]))
+        except (OSError, KeyError, TypeError):
+            return False
+        if stat.st_size != output.get("size"):
+            return False
+    return bool(outputs)
+
+
+def lookup(file_path, file_name, options, logger):
+    """
+    Vrátí True, pokud pro vstup existují platné výstupy z dřívějšího běhu.
+
+    Rychlá cesta: shodná velikost, mtime a hash začátku a konce souboru.
+    Při jiném mtime (soubor znovu nahraný/zkopírovaný) se porovná hash celého souboru.
+    """
+    manifest = _load_manifest(file_name, logger)
+    if manifest is None:
+        return False
+    if manifest.get("tool_version") != tool_version() or manifest.get("options") != options_key(options):
+        logger.debug("Cache: jiná verze nástroje nebo jiné nastavení.")
+        return False
+
+    recorded = manifest.get("input") or {}
+    stat = os.stat(file_path)
+    if stat.st_size != recorded.get("size"):
+        return False
+    if partial_hash(file_path, stat.st_size) != recorded.get("partial_hash"):
+        return False
+    if not _outputs_intact(manifest.get("outputs") or []):
+        logger.info("Cache: výstupy z předchozího běhu chybí nebo byly změněny.")
+        return False
+
+    if stat.st_mtime_ns != recorded.get("mtime_ns"):
+        start_time = time.perf_counter()
+        if file_digest(file_path) != recorded.get("sha256"):
+            return False
+        logger.debug("Cache: hash celého souboru ověřen za %.2f s", time.perf_counter() - start_time)
+        recorded["mtime_ns"] = stat.st_mtime_ns
+        _write_manifest(file_name, manifest)
+
+    logger.info(
+        "Vstup se od předchozího běhu nezměnil (sha256 %s…), použity uložené výstupy: %s",
+        recorded.get("sha256", "")[:12],
+        ", ".join(output["name"] for output in manifest["outputs"]),
+    )
+    return True
+
+
+def _write_manifest(file_name, manifest):
+    path = manifest_path(file_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def invalidate(file_name):
+    # Před novým během: rozpracované nebo selhané výstupy nesmí projít jako platná cache.
+    try:
+        os.remove(manifest_path(file_name))
+    except FileNotFoundError:
+        pass
+
+
+def store(file_path, file_name, options, input_sha256, output_files, logger):
+    """
+    Zapíše manifest po úspěšném běhu. output_files = cesty souborů, které zapsaly
+    writery tohoto běhu (ne podle prefixu názvu - souběžný běh katalog_2.xml
+    v --watch by se jinak připsal k výstupům katalog.xml).
+    """
+    outputs = {}
+    for path in output_files:
+        name = os.path.relpath(path, "output")
+        try:
+            outputs[name] = {"name": name, "size": os.stat(os.path.join("output", name)).st_size}
+        except OSError as exc:
+            logger.warning("Cache: výstup %s nelze zapsat do manifestu: %s", path, exc)
+            return
+    if not outputs:
+        return
+
+    stat = os.stat(file_path)
+    manifest = {
+        "format": CACHE_FORMAT,
+        "tool_version": tool_version(),
+        "options": options_key(options),
+        "input": {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "partial_hash": partial_hash(file_path, stat.st_size),
+            "sha256": input_sha256,
+        },
+        "outputs": sorted(outputs.values(), key=lambda output: output["name"]),
+    }
+    try:
+        _write_manifest(file_name, manifest)
+    except OSError as exc:
+        logger.warning("Cache manifest se nepodařilo zapsat: %s", exc)
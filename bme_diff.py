@@ -0,0 +1,170 @@
+import csv
+import os
+import uuid
+from itertools import groupby
+from operator import itemgetter
+
+# local imports
+import bme_parser
+
+
+# Pole, která jsou na všech řádcích sekce stejná a do porovnání nevstupují.
+_IGNORED_FIELDS = {"SUPPLIER_PID", "EAN"}
+
+_DIFF_FIELDNAMES = ["SUPPLIER_PID", "CHANGE", "SECTION", "FIELD", "OLD_VALUE", "NEW_VALUE"]
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _put(fields, key, value):
+    # Vícenásobné hodnoty pod stejným klíčem (např. více FVALUE) se sbírají a spojí v _joined.
+    fields.setdefault(key, []).append(_text(value))
+
+
+def _joined(fields):
+    # Hodnoty se řadí, aby změna pořadí opakovaných prvků v XML nebyla hlášena jako změna.
+    return {key: " | ".join(sorted(set(values))) for key, values in fields.items()}
+
+
+def flatten_bundle(bundle):
+    """
+    Převede bundle z parse_BME_product_bundle na {sekce: {pole: hodnota}}.
+    Klíče polí jsou stabilní napříč verzemi katalogu, takže je lze porovnat 1:1.
+    """
+    flat = {}
+
+    product = {}
+    for row in bundle.get("products", []):
+        for key, value in row.items():
+            if key not in _IGNORED_FIELDS:
+                _put(product, key, value)
+    flat["product"] = _joined(product)
+
+    # Features: klíč = FNAME (+ jazyk hodnoty).
+    features = {}
+    for row in bundle.get("features", []):
+        feature_key = _text(row.get("FNAME"))
+        if row.get("FVALUE_LANG"):
+            feature_key = f"{feature_key} @lang:{row['FVALUE_LANG']}"
+        for key in ("FVALUE", "FUNIT", "FVALUE_DETAILS", "FORDER"):
+            if row.get(key) is not None:
+                _put(features, f"{feature_key}.{key}", row[key])
+        if row.get("REFERENCE_FEATURE_GROUP_ID") is not None:
+            _put(features, "REFERENCE_FEATURE_GROUP_ID", row["REFERENCE_FEATURE_GROUP_ID"])
+    flat["features"] = _joined(features)
+
+    # MIME: klíč = zdroj souboru.
+    mimes = {}
+    for row in bundle.get("mimes", []):
+        source = _text(row.get("MIME_SOURCE") or row.get("UDX.EDXF.MIME_SOURCE"))
+        for key, value in row.items():
+            if key not in _IGNORED_FIELDS and value is not None:
+                _put(mimes, f"{source}.{key}", value)
+    flat["mimes"] = _joined(mimes)
+
+    keywords = {}
+    for row in bundle.get("keywords", []):
+        _put(keywords, _text(row.get("keyword_tag")), row.get("keyword_value"))
+    flat["keywords"] = _joined(keywords)
+
+    for section in ("packing", "udx_logistics"):
+        fields = {}
+        for index, row in enumerate(bundle.get(section, [])):
+            for key, value in row.items():
+                if key not in _IGNORED_FIELDS and value is not None:
+                    _put(fields, f"{index}.{key}", value)
+        flat[section] = _joined(fields)
+
+    return flat
+
+
+def sort_catalog(elements, name, logger, run_size=50_000):
+    """
+    Naplní ExternalSorter záznamy [SUPPLIER_PID, zploštělý bundle] z proudu XML elementů.
+    V paměti je najednou nejvýše run_size produktů.
+    """
+    sorter = bme_parser.ExternalSorter(name, logger, key=itemgetter(0), run_size=run_size)
+    try:
+        for element in elements:
+            bundle = bme_parser.parse_BME_product_bundle(element, logger)
+            sorter.add([_text(bundle.get("supplier_pid")), flatten_bundle(bundle)])
+    except BaseException:
+        sorter.cleanup()
+        raise
+    return sorter
+
+
+def _iter_grouped(sorter):
+    # Duplicitní SUPPLIER_PID v jedné verzi se slučují (poslední výskyt vyhrává).
+    for supplier_pid, records in groupby(sorter.iter_sorted(), key=itemgetter(0)):
+        flat = {}
+        for _, record in records:
+            for section, fields in record.items():
+                flat.setdefault(section, {}).update(fields)
+        yield supplier_pid, flat
+
+
+def _iter_changes(supplier_pid, old_flat, new_flat):
+    for section in sorted(set(old_flat) | set(new_flat)):
+        old_fields = old_flat.get(section, {})
+        new_fields = new_flat.get(section, {})
+        for field in sorted(set(old_fields) | set(new_fields)):
+            old_value = old_fields.get(field)
+            new_value = new_fields.get(field)
+            if old_value != new_value:
+                yield [supplier_pid, "changed", section, field, old_value, new_value]
+
+
+def diff_sorted_catalogs(old_sorter, new_sorter, output_name, logger):
+    """
+    Sorted-merge dvou setříděných katalogů. Zapíše output/<output_name>.csv
+    s přidanými, odebranými a změněnými produkty (změny po jednotlivých polích).
+    """
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    os.makedirs("output", exist_ok=True)
+    csv_file = os.path.join("output", f"{output_name}.csv")
+    tmp_csv = f"{csv_file}.{uuid.uuid4().hex}.tmp"
+
+    old_iter = _iter_grouped(old_sorter)
+    new_iter = _iter_grouped(new_sorter)
+    old_item = next(old_iter, None)
+    new_item = next(new_iter, None)
+
+    try:
+        with open(tmp_csv, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(_DIFF_FIELDNAMES)
+
+            while old_item is not None or new_item is not None:
+                if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+                    writer.writerow([old_item[0], "removed", "", "", "", ""])
+                    counts["removed"] += 1
+                    old_item = next(old_iter, None)
+                elif old_item is None or new_item[0] < old_item[0]:
+                    writer.writerow([new_item[0], "added", "", "", "", ""])
+                    counts["added"] += 1
+                    new_item = next(new_iter, None)
+                else:
+                    changes = list(_iter_changes(old_item[0], old_item[1], new_item[1]))
+                    writer.writerows(changes)
+                    counts["changed" if changes else "unchanged"] += 1
+                    old_item = next(old_iter, None)
+                    new_item = next(new_iter, None)
+
+        os.replace(tmp_csv, csv_file)
+    except BaseException:
+        if os.path.exists(tmp_csv):
+            os.remove(tmp_csv)
+        raise
+
+    logger.info(f"Uložen soubor: {csv_file}")
+    logger.info(
+        "Rozdíl katalogů: přidáno=%s, odebráno=%s, změněno=%s, beze změny=%s",
+        counts["added"],
+        counts["removed"],
+        counts["changed"],
+        counts["unchanged"],
+    )
+    return counts
@@ -0,0 +1,292 @@
+import csv
+import io
+import json
+import math
+import os
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+
+# local imports
+import bme_metrics
+import bme_parser
+
+DEFAULT_WINDOWS = 16
+DEFAULT_WINDOW_RECORDS = 100
+# Kolik řádků vzorku každého výstupu se ponechá pro změření rychlosti dopsání (finalize).
+FINALIZE_SAMPLE_ROWS = 20_000
+
+# Sekce bundlu -> přípona výstupu (stejně jako BMEStreamProcessor bez --mime-assets).
+_SECTION_OUTPUTS = (
+    ("products", "produkty"),
+    ("mimes", "soubory"),
+    ("keywords", "klicova_slova"),
+    ("packing", "jednotky_balení"),
+    ("udx_logistics", "udx_logistics"),
+    ("features", "features"),
+    ("catalog_groups", "produkty_skupiny"),
+    ("references", "reference"),
+)
+
+# Kvantily Studentova t-rozdělení pro 95% oboustranný interval podle počtu stupňů volnosti.
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042}
+
+
+def _t95(degrees):
+    for limit in sorted(_T95):
+        if degrees <= limit:
+            return _T95[limit]
+    return 1.96
+
+
+def ratio_estimate(values, sizes, population):
+    """
+    Poměrový odhad úhrnu ze vzorku oken (cluster sampling): hodnota na bajt ve vzorku
+    krát velikost celé oblasti. Vrací (odhad, dolní mez, horní mez) 95% intervalu.
+    Rozptyl se počítá z odchylek mezi okny, s korekcí na konečnou populaci
+    (když se přečte celý soubor, interval se zúží na odhad).
+    """
+    total_size = sum(sizes)
+    if not total_size:
+        return 0.0, 0.0, 0.0
+    ratio = sum(values) / total_size
+    estimate = ratio * population
+    windows = len(sizes)
+    if windows < 2:
+        return estimate, estimate, estimate
+    mean_size = total_size / windows
+    residuals = sum((value - ratio * size) ** 2 for value, size in zip(values, sizes)) / (windows - 1)
+    correction = max(0.0, 1.0 - total_size / population) if population else 0.0
+    margin = _t95(windows - 1) * math.sqrt(residuals / windows * correction) / mean_size * population
+    return estimate, max(0.0, estimate - margin), estimate + margin
+
+
+def _bounds(estimate, low, high, digits=0):
+    return {
+        "estimate": round(estimate, digits) if digits else int(round(estimate)),
+        "low": round(low, digits) if digits else int(round(low)),
+        "high": round(high, digits) if digits else int(round(high)),
+    }
+
+
+def chao1(incidence, observed):
+    # Odhad počtu sloupců včetně dosud neviděných (Chao1 s korekcí zkreslení):
+    # sloupce, které se ve vzorku objevily jen u jednoho nebo dvou záznamů, ukazují na další vzácné sloupce.
+    singletons = sum(1 for count in incidence.values() if count == 1)
+    doubletons = sum(1 for count in incidence.values() if count == 2)
+    return observed + singletons * (singletons - 1) / (2 * (doubletons + 1))
+
+
+# Statistiky jednoho výstupu ve vzorku: řádky, spool a CSV bajty po oknech, výskyt sloupců.
+class _OutputSample:
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = defaultdict(int)
+        self.spool_bytes = defaultdict(int)
+        self.line_bytes = defaultdict(int)
+        self.values = defaultdict(int)
+        self.incidence = Counter()
+        self._field_ids = {}
+        self._spool_lines = []
+        self._csv_buffer = io.StringIO()
+        self._csv_writer = csv.writer(self._csv_buffer)
+
+    def observe(self, window, rows):
+        columns = set()
+        for row in rows:
+            record = []
+            values = []
+            if not row:
+                continue
+            for key, value in row.items():
+                # Sloupec vzniká i pro klíč s hodnotou None, do spoolu se ale nezapisuje (jako v DynamicCsvBuffer).
+                field_id = self._field_ids.setdefault(key, len(self._field_ids))
+                columns.add(key)
+                if value is not None:
+                    record.append(field_id)
+                    record.append(value)
+                    values.append(value)
+            # Stejná serializace jako spool v DynamicCsvBuffer.
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            self.spool_bytes[window] += len(line.encode("utf-8")) + 1
+            if len(self._spool_lines) < FINALIZE_SAMPLE_ROWS:
+                self._spool_lines.append(line)
+            self._csv_writer.writerow(values)
+            self.line_bytes[window] += len(self._csv_buffer.getvalue().encode("utf-8"))
+            self._csv_buffer.seek(0)
+            self._csv_buffer.truncate()
+            self.values[window] += len(values)
+            self.rows[window] += 1
+        self.incidence.update(columns)
+
+    def finalize_seconds_per_spool_byte(self):
+        # Dopsání výstupu = načtení spoolu, doplnění prázdných buněk a zápis CSV; měří se na vzorku.
+        if not self._spool_lines:
+            return 0.0
+        width = len(self._field_ids)
+        start_time = time.perf_counter()
+        sink = io.StringIO()
+        writer = csv.writer(sink)
+        for line in self._spool_lines:
+            record = json.loads(line)
+            out = [None] * width
+            for index in range(0, len(record), 2):
+                out[record[index]] = record[index + 1]
+            writer.writerow(out)
+        seconds = time.perf_counter() - start_time
+        return seconds / sum(len(line.encode("utf-8")) + 1 for line in self._spool_lines)
+
+
+def estimate_catalog(reader, file_name, logger, product_layout="wide"):
+    """
+    Odhad nákladů převodu (--estimate) ze vzorku záznamů: počet záznamů, doba běhu,
+    špičková paměť, velikost spoolu a velikost a počet sloupců jednotlivých výstupů,
+    vše s 95% intervalem. Vzorek dodává xml_utils.SampledRecordReader, záznamy prochází
+    skutečný parse_BME_product_bundle. Zapíše output/{file_name}_odhad.json a vrací ho jako dict.
+    """
+    start_time = time.perf_counter()
+    baseline_rss = bme_metrics.peak_rss_bytes()
+    outputs = {
+        section: _OutputSample(suffix if section != "products" or product_layout != "long" else "produkty_eav")
+        for section, suffix in _SECTION_OUTPUTS
+    }
+    window_bytes = defaultdict(int)
+    window_records = defaultdict(int)
+    window_parse_seconds = defaultdict(float)
+    window_seconds = defaultdict(float)
+    tags = Counter()
+    largest = (0, None)
+
+    for window, tag, element, record_bytes, parse_seconds in reader:
+        record_start = time.perf_counter()
+        bundle = bme_parser.parse_BME_product_bundle(element, logger, product_layout=product_layout)
+        for section, output in outputs.items():
+            output.observe(window, bundle.get(section) or [])
+        window_seconds[window] += parse_seconds + time.perf_counter() - record_start
+        window_parse_seconds[window] += parse_seconds
+        window_bytes[window] += record_bytes
+        window_records[window] += 1
+        tags[tag] += 1
+        if record_bytes > largest[0]:
+            largest = (record_bytes, ET.tostring(element))
+
+    windows = sorted(window_bytes)
+    sizes = [window_bytes[window] for window in windows]
+    region = reader.region_end - reader.region_start
+    sampled_records = sum(window_records.values())
+    if not sampled_records:
+        raise ValueError("V souboru nebyl nalezen žádný načitatelný PRODUCT/ARTICLE.")
+
+    def estimate(values):
+        return ratio_estimate([values[window] for window in windows], sizes, region)
+
+    records = estimate(window_records)
+    records = (records[0], max(records[1], sampled_records), records[2])
+    process_seconds = estimate(window_seconds)
+    # Prolog (HEADER, CATALOG_GROUP_SYSTEM) se čte stejnou rychlostí jako záznamy.
+    prolog_seconds = reader.region_start * sum(window_parse_seconds.values()) / sum(sizes)
+
+    output_estimates = {}
+    spool_total = [0.0, 0.0, 0.0]
+    finalize_total = [0.0, 0.0, 0.0]
+    for output in outputs.values():
+        if not output.incidence:
+            continue
+        observed = len(output.incidence)
+        # Přečtený celý soubor už žádné neviděné sloupce nemá.
+        width = observed if reader.sampled_bytes >= region else math.ceil(chao1(output.incidence, observed))
+        rows = estimate(output.rows)
+        spool = estimate(output.spool_bytes)
+        # Řádek CSV = vyplněné hodnoty + čárka za každou prázdnou buňku do plné šířky.
+        csv_bytes = ratio_estimate(
+            [output.line_bytes[window] + output.rows[window] * width - output.values[window] for window in windows],
+            sizes,
+            region,
+        )
+        header_bytes = sum(len(str(field).encode("utf-8")) + 1 for field in output.incidence) + (width - observed)
+        rate = output.finalize_seconds_per_spool_byte()
+        for index in range(3):
+            spool_total[index] += spool[index]
+            finalize_total[index] += spool[index] * rate
+        output_estimates[f"{file_name}_{output.name}"] = {
+            "rows": _bounds(*rows),
+            "columns": {"observed": observed, "estimate": width},
+            "csv_bytes": _bounds(*(value + header_bytes for value in csv_bytes)),
+            "spool_bytes": _bounds(*spool),
+        }
+
+    seconds = [process_seconds[index] + finalize_total[index] + prolog_seconds for index in range(3)]
+
+    # Paměť: proces bez dat + špička zpracování největšího záznamu ve vzorku.
+    # Spool i výstupy jsou na disku, takže paměť nezávisí na počtu záznamů.
+    record_peak = 0
+    if largest[1] is not None:
+        tracemalloc.start()
+        try:
+            element = ET.fromstring(largest[1])
+            bme_parser.parse_BME_product_bundle(element, logger, product_layout=product_layout)
+            record_peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    summary = {
+        "file_size": reader.file_size,
+        "records_region_bytes": region,
+        "windows": len(windows),
+        "sampled_records": sampled_records,
+        "sampled_bytes": reader.sampled_bytes,
+        "sampled_fraction": round(reader.sampled_bytes / region, 6) if region else 1.0,
+        "sample_rejects": reader.reject_count,
+        "sampled_tags": dict(tags),
+        "records": _bounds(*records),
+        "seconds": {
+            **_bounds(*seconds, digits=2),
+            "parse": round(process_seconds[0] + prolog_seconds, 2),
+            "finalize": round(finalize_total[0], 2),
+        },
+        "peak_rss_bytes": {
+            "estimate": (baseline_rss or 0) + record_peak,
+            "baseline": baseline_rss,
+            "largest_record": record_peak,
+            "largest_record_bytes": largest[0],
+        },
+        "spool_bytes": _bounds(*spool_total),
+        "outputs": output_estimates,
+        "estimate_seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+    os.makedirs("output", exist_ok=True)
+    json_file = os.path.join("output", f"{file_name}_odhad.json")
+    with open(json_file, "w", encoding="utf-8") as file:
+        json.dump(summary, file, ensure_ascii=False, indent=2)
+    logger.info(f"Uložen soubor: {json_file}")
+
+    logger.info(
+        "Odhad: záznamů %s (%s-%s), doba %.1f s (%.1f-%.1f), spool %s MB, paměť %s MB; vzorek %s záznamů z %s oken (%.2f %% souboru) za %.2f s",
+        summary["records"]["estimate"],
+        summary["records"]["low"],
+        summary["records"]["high"],
+        seconds[0],
+        seconds[1],
+        seconds[2],
+        round(spool_total[0] / 1_000_000, 1),
+        round(summary["peak_rss_bytes"]["estimate"] / 1_000_000, 1),
+        sampled_records,
+        len(windows),
+        summary["sampled_fraction"] * 100,
+        summary["estimate_seconds"],
+    )
+    for output_name, values in output_estimates.items():
+        logger.info(
+            "Odhad výstupu %s: řádků %s (%s-%s), sloupců %s, %s MB",
+            output_name,
+            values["rows"]["estimate"],
+            values["rows"]["low"],
+            values["rows"]["high"],
+            values["columns"]["estimate"],
+            round(values["csv_bytes"]["estimate"] / 1_000_000, 1),
+        )
+    return summary
@@ -0,0 +1,171 @@
+import csv
+import functools
+import os
+import re
+import sqlite3
+import uuid
+
+# Indexovaný slovník ETIM (kódy EC/EF/EU/EV/EG -> popis v jazyce).
+# Export slovníku (CSV/TSV) se jednou převede do SQLite indexu vedle souboru,
+# další běhy index jen otevřou. Index se přestaví, když se změní velikost nebo mtime exportu.
+
+INDEX_FORMAT = 1
+LOOKUP_CACHE_SIZE = 100_000
+_BATCH_SIZE = 10_000
+
+_ETIM_CODE = re.compile(r"^E[CFUVG][A-Z0-9]{6}$")
+# Podporované názvy sloupců exportu (bez ohledu na velikost písmen).
+_CODE_COLUMNS = ("code", "etim_code", "id", "artclassid", "featureid", "unitid", "valueid", "groupid")
+_LANG_COLUMNS = ("lang", "language", "language_code", "languagecode")
+_DESCRIPTION_COLUMNS = ("description", "desc", "name", "translation", "label")
+
+# Sloupce feature řádku -> sloupec s popisem.
+FEATURE_DESCRIPTIONS = (
+    ("REFERENCE_FEATURE_GROUP_ID", "REFERENCE_FEATURE_GROUP_DESC"),
+    ("FNAME", "FNAME_DESC"),
+    ("FUNIT", "FUNIT_DESC"),
+    ("FVALUE", "FVALUE_DESC"),
+)
+
+
+def is_etim_code(value):
+    return isinstance(value, str) and _ETIM_CODE.match(value) is not None
+
+
+def dictionary_signature(path):
+    # Součást klíče cache výsledků: jiný export slovníku = jiné výstupy.
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _primary_lang(value):
+    return str(value or "").strip().lower().replace("_", "-").split("-", 1)[0]
+
+
+def _find_column(header, candidates):
+    normalized = [column.strip().lower() for column in header]
+    return next((normalized.index(name) for name in candidates if name in normalized), None)
+
+
+def _iter_dictionary_rows(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        sample = file.read(65536)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(file, dialect)
+        header = next(reader, None) or []
+        code_index = _find_column(header, _CODE_COLUMNS)
+        description_index = _find_column(header, _DESCRIPTION_COLUMNS)
+        lang_index = _find_column(header, _LANG_COLUMNS)
+        if code_index is None or description_index is None:
+            raise ValueError(
+                f"Slovník ETIM {path}: hlavička musí obsahovat sloupec kódu ({', '.join(_CODE_COLUMNS)}) "
+                f"a popisu ({', '.join(_DESCRIPTION_COLUMNS)})."
+            )
+        width = max(code_index, description_index, lang_index or 0) + 1
+        for row in reader:
+            if len(row) < width:
+                continue
+            code = row[code_index].strip().upper()
+            description = row[description_index].strip()
+            if code and description:
+                lang = _primary_lang(row[lang_index]) if lang_index is not None else ""
+                yield code, lang, description
+
+
+def build_index(path, index_path, logger):
+    signature = dictionary_signature(path)
+    tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("CREATE TABLE meta (k TEXT PRIMARY KEY, v TEXT) WITHOUT ROWID")
+        db.execute("CREATE TABLE terms (code TEXT, lang TEXT, description TEXT, PRIMARY KEY (code, lang)) WITHOUT ROWID")
+        count = 0
+        batch = []
+        for row in _iter_dictionary_rows(path):
+            batch.append(row)
+            if len(batch) >= _BATCH_SIZE:
+                db.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?)", batch)
+                count += len(batch)
+                batch.clear()
+        db.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?)", batch)
+        count += len(batch)
+        db.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("format", str(INDEX_FORMAT)), ("size", str(signature["size"])), ("mtime_ns", str(signature["mtime_ns"]))],
+        )
+        db.commit()
+    except BaseException:
+        db.close()
+        os.remove(tmp_path)
+        raise
+    db.close()
+    # Atomická výměna - souběžné běhy (--watch, --serve) vidí starý nebo nový index, nikdy rozpracovaný.
+    os.replace(tmp_path, index_path)
+    logger.info("Index slovníku ETIM vytvořen: %s (%s popisů)", index_path, count)
+
+
+def _index_is_current(index_path, path):
+    if not os.path.exists(index_path):
+        return False
+    signature = dictionary_signature(path)
+    try:
+        db = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            meta = dict(db.execute("SELECT k, v FROM meta").fetchall())
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return False
+    return meta == {"format": str(INDEX_FORMAT), "size": str(signature["size"]), "mtime_ns": str(signature["mtime_ns"])}
+
+
+class EtimDictionary:
+
+    def __init__(self, path, logger, langs, cache_size=LOOKUP_CACHE_SIZE):
+        """
+        langs: povolené zápisy jazyka popisů (např. {"cs", "ces", "cze"}).
+        Když popis v jazyce chybí, použije se popis bez jazyka.
+        """
+        self.path = path
+        self.logger = logger
+        self.index_path = f"{path}.idx.sqlite"
+        if not _index_is_current(self.index_path, path):
+            build_index(path, self.index_path, logger)
+        else:
+            logger.debug("Používám existující index slovníku ETIM: %s", self.index_path)
+
+        self._db = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False)
+        self._langs = sorted(set(langs or ())) + [""]
+        placeholders = ", ".join("?" for _ in self._langs)
+        # Pořadí jazyků: požadovaný jazyk má přednost před popisem bez jazyka.
+        self._query = (
+            f"SELECT description FROM terms WHERE code = ? AND lang IN ({placeholders}) "
+            "ORDER BY lang = '' LIMIT 1"
+        )
+        self.describe = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, code):
+        row = self._db.execute(self._query, (code, *self._langs)).fetchone()
+        return row[0] if row else None
+
+    def enrich_feature_row(self, row, columns=FEATURE_DESCRIPTIONS):
+        for source, target in columns:
+            code = row.get(source)
+            # Běžné hodnoty (čísla, texty) do LRU cache vůbec nejdou.
+            if not is_etim_code(code):
+                continue
+            description = self.describe(code)
+            if description is not None:
+                row[target] = description
+        return row
+
+    def close(self):
+        info = self.describe.cache_info()
+        self.logger.debug("Slovník ETIM: %s dotazů, %s z cache", info.hits + info.misses, info.hits)
+        self._db.close()
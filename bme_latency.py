@@ -0,0 +1,154 @@
+import heapq
+import logging
+import math
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter
+from xml.sax.saxutils import quoteattr
+
+# local imports
+from bme_logging import log_limited
+
+DEFAULT_SLOW_PRODUCT_MS = 20.0
+
+
+# Histogram latencí s log-lineárními koši (princip HdrHistogram): 2^sub_bucket_bits košů
+# na každou mocninu dvou, relativní chyba percentilů < 1/2^sub_bucket_bits.
+# Paměť je daná rozsahem hodnot, ne počtem záznamů.
+class LatencyHistogram:
+
+    def __init__(self, sub_bucket_bits=7):
+        self._sub_bucket_bits = sub_bucket_bits
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _bucket(self, value):
+        # Dolní mez koše; malé hodnoty mají každá vlastní koš.
+        shift = value.bit_length() - self._sub_bucket_bits - 1
+        if shift <= 0:
+            return value, value
+        lower = (value >> shift) << shift
+        return lower, lower + (1 << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1_000_000))  # mikrosekundy
+        self.counts[self._bucket(value)[0]] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        # Horní mez koše, ve kterém leží percentil (nejvýš skutečné maximum), v sekundách.
+        if not self.count:
+            return 0.0
+        threshold = max(1, math.ceil(percent / 100 * self.count))
+        cumulative = 0
+        for lower in sorted(self.counts):
+            cumulative += self.counts[lower]
+            if cumulative >= threshold:
+                return min(self._bucket(lower)[1], self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p95_ms": round(self.percentile(95) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max / 1000, 3),
+        }
+
+
+def _comment_text(value):
+    # "--" není v XML komentáři povoleno.
+    return str(value).replace("--", "- -")
+
+
+# Měření doby zpracování produktů: histogram, varování nad prahem
+# a karanténa s XML nejpomalejších produktů (output/{file_name}_pomale_produkty.xml).
+class ProductTimings:
+
+    def __init__(self, file_name, logger, slow_product_ms=DEFAULT_SLOW_PRODUCT_MS, slow_products=0):
+        self.file_name = file_name
+        self.logger = logger
+        self.slow_product_ms = slow_product_ms
+        self.slow_products = max(0, int(slow_products or 0))
+        self.histogram = LatencyHistogram()
+        self.slow_count = 0
+        # Min-heap (doba, pořadí, SUPPLIER_PID, XML) - na vrcholu nejrychlejší z uložených.
+        self._slowest = []
+        self._serial = 0
+
+    def observe(self, seconds, bundle, product_element=None, product_tag=None):
+        self.histogram.record(seconds)
+        self._serial += 1
+        duration_ms = seconds * 1000
+        supplier_pid = bundle.get("supplier_pid", "N/A") if bundle else "N/A"
+
+        if self.slow_product_ms is not None and duration_ms >= self.slow_product_ms:
+            self.slow_count += 1
+            log_limited(
+                self.logger,
+                logging.WARNING,
+                "Dlouhá doba zpracování produktu",
+                "Dlouhá doba zpracování produktu: %.2f ms, SUPPLIER_PID=%s",
+                duration_ms,
+                supplier_pid,
+            )
+
+        if product_element is not None and self.slow_products:
+            # XML se serializuje jen u produktů, které se do top-N skutečně dostanou.
+            if len(self._slowest) < self.slow_products or seconds > self._slowest[0][0]:
+                entry = (seconds, self._serial, supplier_pid, ET.tostring(product_element, encoding="unicode").strip())
+                if len(self._slowest) < self.slow_products:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heapreplace(self._slowest, entry)
+
+        if bundle:
+            self.logger.debug(
+                "Produkt zpracován: tag=%s, SUPPLIER_PID=%s, duration=%.2f ms",
+                bundle.get("record_tag", product_tag),
+                supplier_pid,
+                duration_ms,
+            )
+
+    def report(self):
+        if not self.histogram.count:
+            return
+        summary = self.histogram.summary()
+        self.logger.info(
+            "Doba zpracování produktu: p50=%.2f ms, p95=%.2f ms, p99=%.2f ms, max=%.2f ms, průměr=%.2f ms (produktů %s, nad %s ms: %s)",
+            summary["p50_ms"],
+            summary["p95_ms"],
+            summary["p99_ms"],
+            summary["max_ms"],
+            summary["mean_ms"],
+            summary["count"],
+            self.slow_product_ms,
+            self.slow_count,
+        )
+        if self._slowest:
+            return self.save_slowest()
+
+    def save_slowest(self):
+        os.makedirs("output", exist_ok=True)
+        output_file = os.path.join("output", f"{self.file_name}_pomale_produkty.xml")
+        with open(output_file, "w", encoding="utf-8") as file:
+            file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            file.write(f"<SLOW_PRODUCTS source={quoteattr(self.file_name)}>\n")
+            slowest = sorted(self._slowest, key=lambda entry: (-entry[0], entry[1]))
+            for rank, (seconds, serial, supplier_pid, xml_text) in enumerate(slowest, start=1):
+                file.write(
+                    f"<!-- {rank}. {seconds * 1000:.2f} ms, záznam č. {serial}, "
+                    f"SUPPLIER_PID={_comment_text(supplier_pid)} -->\n"
+                )
+                file.write(xml_text)
+                file.write("\n")
+            file.write("</SLOW_PRODUCTS>\n")
+        self.logger.info(f"Uložen soubor: {output_file}")
+        return output_file
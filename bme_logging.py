@@ -0,0 +1,167 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+# Kolikrát se zpráva se stejným klíčem skutečně zaloguje, než se začne jen počítat.
+RATE_LIMIT = 10
+# Horní mez počtu sledovaných klíčů (např. klíče s MIME kódem), aby počitadla nerostla bez omezení.
+MAX_RATE_KEYS = 10_000
+_OVERFLOW_KEY = "Ostatní opakované zprávy"
+
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None))
+
+
+# Omezovač opakovaných zpráv podle klíče. Je připojený k loggeru jako filtr,
+# takže počitadla patří jednomu běhu (loggeru), ne modulu.
+class RateLimiter(logging.Filter):
+
+    def __init__(self, limit=RATE_LIMIT, max_keys=MAX_RATE_KEYS):
+        super().__init__()
+        self.limit = limit
+        self.max_keys = max_keys
+        self.counts = {}
+
+    def hit(self, key):
+        # Započítá výskyt a vrátí True, pokud se má zpráva ještě zalogovat.
+        if key not in self.counts and len(self.counts) >= self.max_keys:
+            key = _OVERFLOW_KEY
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        return count <= self.limit
+
+    def filter(self, record):
+        # Záznamy s extra={"rate_key": ...} podléhají stejnému limitu jako log_limited().
+        key = getattr(record, "rate_key", None)
+        return True if key is None else self.hit(key)
+
+    def summary(self):
+        return [(key, count) for key, count in self.counts.items() if count > self.limit]
+
+
+# QueueHandler, který neformátuje zprávu ve vlákně parseru.
+# Formátování proběhne až v QueueListeneru; okamžitě se formátují jen záznamy,
+# jejichž argumenty by se mohly do té doby změnit (dict, list, ...) nebo nesou výjimku.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        if record.exc_info or not all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in _record_args(record)):
+            return super().prepare(record)
+        return record
+
+
+def _record_args(record):
+    if isinstance(record.args, dict):
+        return record.args.values()
+    return record.args or ()
+
+
+# QueueListener s vlastním příznakem běhu (stop() je pak idempotentní).
+class _QueueListener(logging.handlers.QueueListener):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = False
+
+    def start(self):
+        super().start()
+        self.running = True
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            super().stop()
+
+
+# Běžící listenery procesu. Pojistka atexit se registruje jen jednou, takže v --watch a --serve
+# nepřibývá s každou úlohou další callback; ukončené listenery se z množiny odebírají.
+_active_listeners = set()
+_listeners_lock = threading.Lock()
+_atexit_registered = False
+
+
+def _stop_listener(listener):
+    with _listeners_lock:
+        _active_listeners.discard(listener)
+    listener.stop()
+
+
+def _stop_all_listeners():
+    with _listeners_lock:
+        listeners = list(_active_listeners)
+    for listener in listeners:
+        _stop_listener(listener)
+
+
+def get_rate_limiter(logger):
+    for log_filter in logger.filters:
+        if isinstance(log_filter, RateLimiter):
+            return log_filter
+    return None
+
+
+def log_limited(logger, level, key, msg, *args):
+    """
+    Zaloguje zprávu nejvýše RATE_LIMIT× pro daný klíč, další výskyty jen počítá.
+    Pokud úroveň není povolena, nevytváří se ani LogRecord.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    limiter = get_rate_limiter(logger)
+    if limiter is None:
+        logger.log(level, msg, *args)
+        return
+    if limiter.hit(key):
+        logger.log(level, msg, *args)
+        if limiter.counts.get(key) == limiter.limit:
+            logger.log(level, "Další opakování zprávy '%s' bude potlačeno.", key)
+
+
+def attach_queue_listener(logger, handlers, rate_limit=RATE_LIMIT):
+    """
+    Připojí k loggeru QueueHandler a spustí QueueListener s předanými handlery.
+    Zápis do konzole a souboru pak běží v samostatném vlákně mimo parsovací smyčku.
+    """
+    global _atexit_registered
+    log_queue = queue.SimpleQueue()
+    listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
+    logger.addFilter(RateLimiter(limit=rate_limit))
+    listener.start()
+    with _listeners_lock:
+        _active_listeners.add(listener)
+        # Pojistka pro předčasný konec procesu - fronty se vždy dopíšou.
+        if not _atexit_registered:
+            atexit.register(_stop_all_listeners)
+            _atexit_registered = True
+    return listener
+
+
+def log_rate_summary(logger):
+    limiter = get_rate_limiter(logger)
+    if limiter is None:
+        return
+    for key, count in limiter.summary():
+        logger.info("Opakovaná zpráva '%s': %s× (zalogováno prvních %s)", key, f"{count:,}".replace(",", " "), limiter.limit)
+
+
+def shutdown_logging(logger, summary=True):
+    """
+    Zaloguje souhrn potlačených zpráv, dopíše frontu a odpojí handlery i filtry.
+    """
+    if summary:
+        log_rate_summary(logger)
+    for handler in logger.handlers[:]:
+        listener = getattr(handler, "listener", None)
+        if listener is not None:
+            _stop_listener(listener)
+            for target in listener.handlers:
+                target.close()
+        handler.close()
+        logger.removeHandler(handler)
+    for log_filter in logger.filters[:]:
+        if isinstance(log_filter, RateLimiter):
+            logger.removeFilter(log_filter)
@@ -0,0 +1,205 @@
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Metriky běhu pro node_exporter (textfile collector), textový formát Prometheus.
+# Soubor se přepisuje atomicky (tmp + os.replace), aby scrape nikdy neviděl rozepsaný stav.
+# Během fází bez produktů (finalize, řazení, slévání) zapisuje metriky vlákno časovače.
+
+DEFAULT_INTERVAL = 15.0
+# Hranice histogramu doby zpracování jednoho produktu (sekundy).
+PRODUCT_SECONDS_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def metrics_path(target, file_name):
+    # Složka = jeden soubor na vstup (souběžné běhy v --watch si nepřepisují metriky).
+    if os.path.isdir(target):
+        return os.path.join(target, f"bme_{file_name}.prom")
+    return target
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux vrací KiB, macOS bajty.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Počítá ERROR záznamy loggeru během běhu (filtr nic nezahazuje).
+class ErrorCounter(logging.Filter):
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            self.count += 1
+        return True
+
+
+class RunMetrics:
+
+    def __init__(self, path, file_name, logger, interval=DEFAULT_INTERVAL):
+        self.path = path
+        self.file_name = file_name
+        self.logger = logger
+        self.interval = max(1.0, float(interval))
+        self.stage_seconds = {}
+        self.product_buckets = [0] * len(PRODUCT_SECONDS_BUCKETS)
+        self.product_count = 0
+        self.product_seconds_sum = 0.0
+        self.cache_hit = False
+        self.success = None
+        self._source = None
+        self._processor = None
+        self._stage = None
+        self._stage_start = None
+        self._next_flush = time.monotonic() + self.interval
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = None
+        self._errors = ErrorCounter()
+        logger.addFilter(self._errors)
+
+    def attach(self, processor=None, source=None):
+        # processor: objekt s metric_counts(), source: čtečka vstupu s bytes_read.
+        if processor is not None:
+            self._processor = processor
+        if source is not None:
+            self._source = source
+
+    def start_stage(self, stage):
+        self.end_stage()
+        self._stage = stage
+        self._stage_start = time.perf_counter()
+        self.flush()
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name=f"bme-metrics-{self.file_name}", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while not self._stopped.wait(max(0.0, self._next_flush - time.monotonic())):
+            if time.monotonic() >= self._next_flush:
+                self.flush()
+
+    def end_stage(self):
+        if self._stage is None:
+            return
+        elapsed = time.perf_counter() - self._stage_start
+        self.stage_seconds[self._stage] = self.stage_seconds.get(self._stage, 0.0) + elapsed
+        self._stage = None
+
+    def observe_product(self, seconds):
+        index = bisect.bisect_left(PRODUCT_SECONDS_BUCKETS, seconds)
+        if index < len(self.product_buckets):
+            self.product_buckets[index] += 1
+        self.product_count += 1
+        self.product_seconds_sum += seconds
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def finish(self, success):
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.end_stage()
+        self.success = success
+        self.flush()
+        self.logger.removeFilter(self._errors)
+
+    def _stage_snapshot(self):
+        # Čte se i z vlákna časovače - fáze a její začátek se berou najednou.
+        stage, stage_start = self._stage, self._stage_start
+        stages = dict(self.stage_seconds)
+        if stage is not None:
+            stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - stage_start
+        return stages
+
+    def render(self):
+        labels = {"file": self.file_name}
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, extra_labels, value in samples:
+                lines.append(f"{name}{suffix}{_labels({**labels, **extra_labels})} {value}")
+
+        records, rows = self._processor.metric_counts() if self._processor is not None else ({}, {})
+        metric("bme_records_processed_total", "counter", "Zpracované záznamy podle typu.", [
+            ("", {"type": record_type}, count) for record_type, count in sorted(records.items())
+        ])
+        metric("bme_output_rows_total", "counter", "Zapsané řádky podle výstupu.", [
+            ("", {"output": output}, count) for output, count in sorted(rows.items())
+        ])
+        if self._source is not None:
+            metric("bme_input_bytes_total", "counter", "Přečtené bajty vstupu.", [("", {}, self._source.bytes_read)])
+        metric("bme_stage_seconds_total", "counter", "Doba jednotlivých fází běhu.", [
+            ("", {"stage": stage}, round(seconds, 6)) for stage, seconds in sorted(self._stage_snapshot().items())
+        ])
+
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(PRODUCT_SECONDS_BUCKETS, self.product_buckets):
+            cumulative += count
+            buckets.append(("_bucket", {"le": repr(bound)}, cumulative))
+        buckets.append(("_bucket", {"le": "+Inf"}, self.product_count))
+        buckets.append(("_sum", {}, round(self.product_seconds_sum, 6)))
+        buckets.append(("_count", {}, self.product_count))
+        metric("bme_product_duration_seconds", "histogram", "Doba zpracování jednoho produktu.", buckets)
+
+        peak = peak_rss_bytes()
+        if peak is not None:
+            metric("bme_peak_rss_bytes", "gauge", "Špičková paměť procesu (RSS).", [("", {}, peak)])
+        metric("bme_errors_total", "counter", "Počet chyb zalogovaných během běhu.", [("", {}, self._errors.count)])
+        metric("bme_cache_hit", "gauge", "1 = výstupy použity z cache výsledků.", [("", {}, int(self.cache_hit))])
+        if self.success is not None:
+            metric("bme_last_run_success", "gauge", "1 = poslední běh skončil úspěšně.", [("", {}, int(self.success))])
+        metric("bme_last_update_timestamp_seconds", "gauge", "Čas posledního zápisu metrik.", [("", {}, round(time.time(), 3))])
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        # Zapisuje hlavní vlákno i časovač; zámek chrání společný tmp soubor.
+        with self._flush_lock:
+            self._next_flush = time.monotonic() + self.interval
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8", newline="\n") as file:
+                    file.write(self.render())
+                os.replace(tmp_path, self.path)
+            except OSError as exc:
+                self.logger.warning("Metriky se nepodařilo zapsat do %s: %s", self.path, exc)
+
+
+# Čtečka vstupu pro iterparse, která počítá přečtené bajty.
+class CountingReader:
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
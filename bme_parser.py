@@ -1,11 +1,25 @@
 import time
 import csv
+import functools
+import hashlib
+import heapq
 import json
 import os
+import sqlite3
+import sys
 import uuid
+import logging
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote, unquote
 
+# local imports
+import bme_etim
+import bme_latency
+import bme_types
+import xlsx_writer
+from bme_logging import log_limited
+
 
 # Slovník MIME kódů 
 _VALID_MIME_CODES = {
@@ -77,25 +91,6 @@ _VALID_MIME_CODES = {
     "MD99": "Ostatní",  # Others
 }
 
-# Limit repetitive debug spam for frequently occurring parser situations.
-_DEBUG_EVENT_COUNTS = {}
-_DEBUG_EVENT_LIMIT = 10
-
-
-def _debug_limited(logger, event_key, message):
-    count = _DEBUG_EVENT_COUNTS.get(event_key, 0)
-    if count < _DEBUG_EVENT_LIMIT:
-        logger.debug(message)
-        count += 1
-        _DEBUG_EVENT_COUNTS[event_key] = count
-        if count == _DEBUG_EVENT_LIMIT:
-            logger.debug(
-                "Další opakování zprávy '%s' bude potlačeno.",
-                event_key,
-            )
-    else:
-        _DEBUG_EVENT_COUNTS[event_key] = count + 1
-
 # Remove namespace from tag
 def clean_tag(tag):
     return tag.split("}", 1)[-1] if isinstance(tag, str) else tag
@@ -111,8 +106,90 @@ def create_key(tag, attributes):
     return f"{tag} {' '.join(attr_parts)}"
 
 
+# Jazykové kódy: BMEcat používá ISO 639-2 (deu, ces), uživatel často zadá ISO 639-1 (de, cs).
+_LANG_ALIASES = (
+    ("cs", "ces", "cze"),
+    ("sk", "slk", "slo"),
+    ("de", "deu", "ger"),
+    ("en", "eng"),
+    ("pl", "pol"),
+    ("hu", "hun"),
+    ("fr", "fra", "fre"),
+    ("it", "ita"),
+    ("es", "spa"),
+    ("pt", "por"),
+    ("nl", "nld", "dut"),
+    ("da", "dan"),
+    ("sv", "swe"),
+    ("no", "nor", "nob", "nb"),
+    ("fi", "fin"),
+    ("et", "est"),
+    ("lv", "lav"),
+    ("lt", "lit"),
+    ("sl", "slv"),
+    ("hr", "hrv"),
+    ("ro", "ron", "rum"),
+    ("bg", "bul"),
+    ("el", "ell", "gre"),
+    ("ru", "rus"),
+    ("uk", "ukr"),
+    ("tr", "tur"),
+    ("zh", "zho", "chi"),
+)
+_LANG_ALIAS_INDEX = {code: group for group in _LANG_ALIASES for code in group}
+_LANG_ATTRIBUTES = ("lang", "xml:lang", "{http://www.w3.org/XML/1998/namespace}lang")
+
+
+def _primary_lang(value):
+    # "de-AT" / "de_AT" / "DEU" -> "de" / "deu"
+    return str(value).strip().lower().replace("_", "-").split("-", 1)[0]
+
+
+def lang_codes(lang):
+    # Všechny zápisy jednoho jazyka, např. "cs" -> {"cs", "ces", "cze"}.
+    code = _primary_lang(lang)
+    return frozenset(_LANG_ALIAS_INDEX.get(code, (code,)))
+
+
+def parse_langs(text):
+    """
+    "cs,de" -> ("cs", "de"). Prázdný seznam je chyba nastavení.
+    """
+    langs = tuple(dict.fromkeys(part.strip() for part in str(text).split(",") if part.strip()))
+    if not langs:
+        raise ValueError("Seznam jazyků je prázdný.")
+    return langs
+
+
+def element_lang(attrs):
+    return next((attrs[name] for name in _LANG_ATTRIBUTES if name in attrs), None)
+
+
+def lang_allowed(attrs, langs):
+    # Uzel bez jazyka je jazykově neutrální a zůstává vždy.
+    lang = element_lang(attrs)
+    return lang is None or _primary_lang(lang) in langs
+
+
+def filter_lang_nodes(data, langs):
+    """
+    Kopie dictu z parse_element() bez klíčů v jiném než zadaném jazyce.
+    Používá se pro rozdělení jednoho naparsovaného produktu do výstupů po jazycích.
+    """
+    if isinstance(data, list):
+        return [filter_lang_nodes(item, langs) for item in data]
+    if not isinstance(data, dict):
+        return data
+    filtered = {}
+    for key, value in data.items():
+        if "lang:" in key and not lang_allowed(split_key(key)[1], langs):
+            continue
+        filtered[key] = filter_lang_nodes(value, langs)
+    return filtered
+
+
 # Recursive XML Parsing
-def parse_element(element, logger):
+def parse_element(element, logger, langs=None):
     if element is None:
         logger.warning("Element nenalezen (None).")
         return None
@@ -120,10 +197,13 @@ def parse_element(element, logger):
     parsed_data = {}
     # Process a single child element.
     for child in element:
+        # Uzly v nevyžádaném jazyce se vůbec nepřevádí do dictu.
+        if langs is not None and child.attrib and not lang_allowed(child.attrib, langs):
+            continue
         tag = clean_tag(child.tag)
         combined_key = create_key(tag, child.attrib)
         # Recursively parse child elements
-        child_data = parse_element(child, logger) if len(child) else (child.text.strip() if child.text else None)
+        child_data = parse_element(child, logger, langs) if len(child) else (child.text.strip() if child.text else None)
         # Handle multiple occurrences of the same key
         if combined_key in parsed_data:
             if not isinstance(parsed_data[combined_key], list):
@@ -150,37 +230,145 @@ def flatten_dict(d, parent_key="", sep="_"):
     return dict(items)
 
 # Disk-backed CSV writer for streamed XML processing.
+# Spool je kompaktní: sloupce mají celočíselné ID v registru a každý řádek
+# se ukládá jako řídký JSON seznam [id, hodnota, id, hodnota, ...].
 class DynamicCsvBuffer:
 
-    def __init__(self, file_name, logger, priority_fields=("SUPPLIER_PID",)):
+    def __init__(
+        self,
+        file_name,
+        logger,
+        priority_fields=("SUPPLIER_PID",),
+        sort_by=None,
+        sort_run_size=100_000,
+        output_format="csv",
+        column_map=None,
+        typed=False,
+    ):
         self.file_name = file_name
         self.logger = logger
         self.priority_fields = tuple(priority_fields)
+        # Odvození typů sloupců, normalizace čísel/dat a schéma vedle výstupu (--typed).
+        self._types = bme_types.ColumnTypeTracker() if typed else None
+        # Volitelné deterministické pořadí řádků (externí merge sort při finalize).
+        self.sort_by = sort_by
+        self.sort_run_size = sort_run_size
         self.fieldnames = set()
-        self._seen_fieldnames = set()
         self.row_count = 0
+        # Registr sloupců: název -> ID a ID -> název (v pořadí objevení).
+        self._field_ids = {}
+        self._field_names = []
+
+        # Projekce sloupců (ColumnMapping): pevné schéma, nenamapované klíče se zahodí.
+        self.column_map = column_map
+        if column_map is not None:
+            self._field_names = list(column_map.fieldnames)
+            self._field_ids = {field: position for position, field in enumerate(self._field_names)}
+            self.fieldnames = set(self._field_names)
+            if sort_by in column_map.positions:
+                self.sort_by = column_map.fieldnames[column_map.positions[sort_by]]
 
         os.makedirs("output", exist_ok=True)
-        self.csv_file = os.path.join("output", f"{file_name}.csv")
+        # Výstupní formát: "csv" nebo "xlsx" (stejné sloupce, jiný zápis ve finalize).
+        self.output_format = output_format
+        self.output_file = os.path.join("output", f"{file_name}.{output_format}")
+        # Soubory zapsané ve finalize (výstup, případně schéma) - pro manifest cache.
+        self.written_files = []
         self._tmp_file = os.path.join("output", f".{file_name}.{uuid.uuid4().hex}.rows.jsonl")
-        self._handle = open(self._tmp_file, "w", encoding="utf-8", newline="")
-        self._closed = False
+        self._tmp_output = f"{self.output_file}.{uuid.uuid4().hex}.tmp"
+        # Při pevném schématu a bez řazení se zapisuje rovnou do výstupu, bez spoolu.
+        # S odvozením typů ne - normalizace hodnot závisí na typu celého sloupce.
+        self._direct = column_map is not None and sort_by is None and not typed
+        self._direct_handle = None
+        self._direct_writer = None
+        self._handle = None if self._direct else open(self._tmp_file, "w", encoding="utf-8", newline="")
+        self._closed = self._direct
+
+    def _field_id(self, field):
+        field_id = self._field_ids.get(field)
+        if field_id is None:
+            field_id = len(self._field_names)
+            self._field_ids[field] = field_id
+            self._field_names.append(field)
+            self.fieldnames.add(field)
+        return field_id
+
+    def _writerow_mapped(self, row):
+        positions = self.column_map.positions
+        mapped = [(positions[key], value) for key, value in row.items() if key in positions]
+        if not mapped:
+            return
+        if self._types is not None:
+            for position, value in mapped:
+                if value is not None:
+                    self._types.observe(position, value)
+
+        if self._direct:
+            out = [None] * len(self._field_names)
+            for position, value in mapped:
+                if value is not None:
+                    out[position] = value
+            if self._direct_writer is None:
+                self._open_direct_writer()
+            self._direct_writer.writerow(out)
+        else:
+            record = []
+            for position, value in mapped:
+                if value is not None:
+                    record.append(position)
+                    record.append(value)
+            self._handle.write(json.dumps(record, ensure_ascii=False, default=str))
+            self._handle.write("\n")
+        self.row_count += 1
+
+    def _open_direct_writer(self):
+        fieldnames = self._ordered_fieldnames()
+        if self.output_format == "xlsx":
+            self._direct_writer = xlsx_writer.XlsxStreamWriter(self._tmp_output, fieldnames, logger=self.logger)
+        else:
+            self._direct_handle = open(self._tmp_output, "w", newline="", encoding="utf-8")
+            self._direct_writer = csv.writer(self._direct_handle)
+            self._direct_writer.writerow(fieldnames)
+
+    def _close_direct_writer(self, abort=False):
+        if self._direct_handle is not None:
+            self._direct_handle.close()
+            self._direct_handle = None
+        elif self._direct_writer is not None:
+            if abort:
+                self._direct_writer.abort()
+            else:
+                self._direct_writer.close()
+        self._direct_writer = None
 
     def writerow(self, row):
         if not row:
             return
-        normalized_row = {str(key): value for key, value in row.items()}
-        new_fields = sorted(field for field in normalized_row.keys() if field not in self._seen_fieldnames)
-        if new_fields:
+        if self.column_map is not None:
+            self._writerow_mapped(row)
+            return
+        field_ids = self._field_ids
+        known_fields = len(self._field_names)
+        types = self._types
+        record = []
+        for key, value in row.items():
+            field_id = field_ids.get(key)
+            if field_id is None:
+                field_id = self._field_id(str(key))
+            # None se v CSV zapisuje jako prázdná buňka, do spoolu ho není třeba ukládat.
+            if value is not None:
+                record.append(field_id)
+                record.append(value)
+                if types is not None:
+                    types.observe(field_id, value)
+        if len(self._field_names) > known_fields:
             self.logger.debug(
                 "Nové sloupce ve %s na řádku %s: %s",
                 self.file_name,
                 self.row_count + 1,
-                ", ".join(new_fields),
+                ", ".join(sorted(self._field_names[known_fields:])),
             )
-            self._seen_fieldnames.update(new_fields)
-        self.fieldnames.update(normalized_row.keys())
-        json.dump(normalized_row, self._handle, ensure_ascii=False, default=str)
+        self._handle.write(json.dumps(record, ensure_ascii=False, default=str))
         self._handle.write("\n")
         self.row_count += 1
 
@@ -189,6 +377,8 @@ class DynamicCsvBuffer:
             self.writerow(row)
 
     def _ordered_fieldnames(self):
+        if self.column_map is not None:
+            return list(self.column_map.fieldnames)
         ordered = [field for field in self.priority_fields if field in self.fieldnames]
         ordered.extend(sorted(field for field in self.fieldnames if field not in ordered))
         return ordered
@@ -203,40 +393,458 @@ class DynamicCsvBuffer:
 
         if not self.row_count:
             self.cleanup()
-            self.logger.warning(f"Žádná data k uložení: {self.file_name}.csv")
+            self.logger.warning("Žádná data k uložení: %s.%s", self.file_name, self.output_format)
             return
 
-        fieldnames = self._ordered_fieldnames()
-        tmp_csv = f"{self.csv_file}.{uuid.uuid4().hex}.tmp"
-
-        with open(tmp_csv, "w", newline="", encoding="utf-8") as csv_file, \
-                open(self._tmp_file, "r", encoding="utf-8") as rows_file:
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-            writer.writeheader()
-            for line in rows_file:
-                writer.writerow(json.loads(line))
+        if self._direct:
+            self._close_direct_writer()
+            os.replace(self._tmp_output, self.output_file)
+            self.written_files.append(self.output_file)
+            self.cleanup()
+            self.logger.info("Uložen soubor: %s", self.output_file)
+            return
 
-        os.replace(tmp_csv, self.csv_file)
+        fieldnames = self._ordered_fieldnames()
+        tmp_output = self._tmp_output
+
+        sorter = None
+        with open(self._tmp_file, "r", encoding="utf-8") as rows_file:
+            records = (json.loads(line) for line in rows_file)
+            if self.sort_by is not None and self.sort_by in self._field_ids:
+                sorter = self._sort_records(records)
+                records = sorter.iter_sorted()
+
+            try:
+                rows = self._iter_padded_rows(records, fieldnames)
+                column_types = None
+                if self._types is not None:
+                    field_ids = [self._field_ids[field] for field in fieldnames]
+                    rows = self._types.iter_normalized(rows, field_ids)
+                    column_types = [self._types.column_type(field_id) for field_id in field_ids]
+                if self.output_format == "xlsx":
+                    with xlsx_writer.XlsxStreamWriter(tmp_output, fieldnames, logger=self.logger, column_types=column_types) as writer:
+                        for row in rows:
+                            writer.writerow(row)
+                else:
+                    with open(tmp_output, "w", newline="", encoding="utf-8") as csv_file:
+                        writer = csv.writer(csv_file)
+                        writer.writerow(fieldnames)
+                        writer.writerows(rows)
+            finally:
+                if sorter is not None:
+                    sorter.cleanup()
+
+        os.replace(tmp_output, self.output_file)
+        self.written_files.append(self.output_file)
         self.cleanup()
-        self.logger.info(f"Uložen soubor: {self.csv_file}")
+        self.logger.info("Uložen soubor: %s", self.output_file)
+        if self._types is not None:
+            field_ids = [self._field_ids[field] for field in fieldnames]
+            self.written_files.append(
+                self._types.save_schema(self.output_file, fieldnames, field_ids, self.row_count, self.logger)
+            )
+
+    def _iter_padded_rows(self, records, fieldnames):
+        # ID sloupce ze spoolu -> pozice ve výstupu; řádky se skládají bez mezilehlých dictů.
+        column_positions = {field: position for position, field in enumerate(fieldnames)}
+        positions = [column_positions[field] for field in self._field_names]
+        width = len(fieldnames)
+        for record in records:
+            out = [None] * width
+            for index in range(0, len(record), 2):
+                out[positions[record[index]]] = record[index + 1]
+            yield out
+
+    def _sort_records(self, records):
+        # Řadí řídké záznamy ze spoolu podle hodnoty sloupce sort_by.
+        # V paměti je najednou nejvýše sort_run_size řádků, běhy leží v output/.
+        sort_field_id = self._field_ids[self.sort_by]
+
+        def sort_key(record):
+            for index in range(0, len(record), 2):
+                if record[index] == sort_field_id:
+                    return str(record[index + 1])
+            return ""
+
+        sorter = ExternalSorter(self.file_name, self.logger, key=sort_key, run_size=self.sort_run_size)
+        try:
+            for record in records:
+                sorter.add(record)
+        except BaseException:
+            sorter.cleanup()
+            raise
+        return sorter
 
     def cleanup(self):
         self.close_temp()
+        self._close_direct_writer(abort=True)
+        for tmp_file in (self._tmp_file, self._tmp_output):
+            try:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+            except OSError as exc:
+                self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", tmp_file, exc)
+
+
+# Projekce a přejmenování sloupců jednoho výstupu, zkompilovaná jednou za běh.
+# positions: zdrojový klíč -> pozice výstupního sloupce, fieldnames: výstupní názvy v pořadí.
+class ColumnMapping:
+
+    def __init__(self, columns):
+        self.fieldnames = []
+        self.positions = {}
+        output_positions = {}
+        for source, name in columns:
+            position = output_positions.get(name)
+            if position is None:
+                position = len(self.fieldnames)
+                output_positions[name] = position
+                self.fieldnames.append(name)
+            # Více zdrojových klíčů může plnit stejný výstupní sloupec (vyhrává poslední neprázdná hodnota v řádku).
+            self.positions[source] = position
+
+
+def load_column_mappings(path):
+    """
+    Načte JSON soubor s mapováním sloupců pro jednotlivé výstupy.
+
+    Klíčem je přípona výstupu (např. "produkty", "features") nebo celý název výstupu.
+    Hodnota je seznam sloupců v požadovaném pořadí - buď řetězec (zdrojový klíč beze změny
+    názvu), nebo {"source": ..., "name": ...} - případně objekt {zdrojový klíč: výstupní název}.
+    """
+    with open(path, "r", encoding="utf-8") as handle:
+        raw = json.load(handle)
+    if not isinstance(raw, dict):
+        raise ValueError(f"Mapování sloupců {path} musí být JSON objekt (výstup -> sloupce).")
+
+    mappings = {}
+    for output_name, spec in raw.items():
+        if isinstance(spec, dict):
+            columns = [(str(source), str(name)) for source, name in spec.items()]
+        elif isinstance(spec, list):
+            columns = []
+            for item in spec:
+                if isinstance(item, str):
+                    columns.append((item, item))
+                elif isinstance(item, dict) and "source" in item:
+                    columns.append((str(item["source"]), str(item.get("name") or item["source"])))
+                else:
+                    raise ValueError(f"Neplatná položka mapování pro výstup '{output_name}': {item!r}")
+        else:
+            raise ValueError(f"Neplatné mapování pro výstup '{output_name}': očekáván seznam nebo objekt.")
+        if not columns:
+            raise ValueError(f"Mapování pro výstup '{output_name}' neobsahuje žádné sloupce.")
+        mappings[output_name] = ColumnMapping(columns)
+    return mappings
+
+
+# Množina klíčů s omezenou pamětí - po překročení limitu se přelévá do SQLite na disku.
+class DiskKeyIndex:
+
+    def __init__(self, name, logger, memory_limit=500_000):
+        self.name = name
+        self.logger = logger
+        self.memory_limit = max(1, int(memory_limit))
+        self._memory = set()
+        self._db = None
+        os.makedirs("output", exist_ok=True)
+        self._db_file = os.path.join("output", f".{name}.{uuid.uuid4().hex}.idx.sqlite")
+
+    def __contains__(self, key):
+        if key in self._memory:
+            return True
+        if self._db is None:
+            return False
+        return self._db.execute("SELECT 1 FROM keys WHERE k = ?", (key,)).fetchone() is not None
+
+    def add(self, key):
+        # Vrací True, pokud klíč ještě nebyl v indexu.
+        if key in self:
+            return False
+        self._memory.add(key)
+        if len(self._memory) >= self.memory_limit:
+            self._spill()
+        return True
+
+    def _spill(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self._db_file)
+            self._db.execute("PRAGMA journal_mode=OFF")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute("CREATE TABLE keys (k BLOB PRIMARY KEY) WITHOUT ROWID")
+            self.logger.debug("Index %s přesáhl %s klíčů, přelévám na disk: %s", self.name, self.memory_limit, self._db_file)
+        self._db.executemany("INSERT OR IGNORE INTO keys (k) VALUES (?)", ((key,) for key in self._memory))
+        self._db.commit()
+        self._memory.clear()
+
+    def cleanup(self):
+        self._memory.clear()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        try:
+            if os.path.exists(self._db_file):
+                os.remove(self._db_file)
+        except OSError as exc:
+            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", self._db_file, exc)
+
+
+# Strom skupin katalogu (CATALOG_STRUCTURE) na disku pro doplnění cesty skupiny k produktům.
+# V paměti je jen LRU cache vyřešených cest, ne celý strom.
+class CatalogGroupIndex:
+
+    def __init__(self, name, logger, cache_size=100_000, batch_size=10_000, max_depth=64):
+        self.name = name
+        self.logger = logger
+        self.batch_size = max(1, int(batch_size))
+        self.max_depth = max_depth
+        self.group_count = 0
+        self._pending = []
+        self._resolved = False
+        os.makedirs("output", exist_ok=True)
+        self._db_file = os.path.join("output", f".{name}.{uuid.uuid4().hex}.groups.sqlite")
+        self._db = sqlite3.connect(self._db_file)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE groups (id TEXT PRIMARY KEY, parent TEXT, name TEXT) WITHOUT ROWID")
+        self.path = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    def add(self, group_id, parent_id, name):
+        if not group_id:
+            return
+        self._pending.append((group_id, parent_id, name))
+        self.group_count += 1
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        if self._resolved:
+            # Skupina přišla až po produktech - dříve vyřešené cesty už nemusí platit.
+            self.path.cache_clear()
+            self._resolved = False
+
+    def _flush(self):
+        if self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO groups VALUES (?, ?, ?)", self._pending)
+            self._db.commit()
+            self._pending.clear()
+
+    def _resolve(self, group_id):
+        # Vrací (názvy, ID) od kořene ke skupině; neznámá skupina = prázdné n-tice.
+        self._flush()
+        self._resolved = True
+        names, ids = [], []
+        seen = set()
+        current = group_id
+        while current and current not in seen and len(ids) < self.max_depth:
+            row = self._db.execute("SELECT parent, name FROM groups WHERE id = ?", (current,)).fetchone()
+            if row is None:
+                break
+            seen.add(current)
+            ids.append(current)
+            names.append(row[1] or current)
+            current = row[0]
+        return tuple(reversed(names)), tuple(reversed(ids))
+
+    def cleanup(self):
+        self._pending.clear()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        try:
+            if os.path.exists(self._db_file):
+                os.remove(self._db_file)
+        except OSError as exc:
+            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", self._db_file, exc)
+
+
+# Graf referencí mezi produkty (PRODUCT_REFERENCE) na disku: známé SUPPLIER_PID a hrany zdroj -> cíl.
+# Hrany se zapisují po dávkách během průchodu, neplatné cíle se hledají až na konci jedním
+# anti-joinem v SQLite, takže paměť nezávisí na počtu produktů ani hran.
+# Po úspěšném běhu zůstane index jako výstup output/{name}.sqlite (tabulky products a refs).
+class ProductReferenceIndex:
+
+    def __init__(self, name, logger, batch_size=10_000):
+        self.name = name
+        self.logger = logger
+        self.batch_size = max(1, int(batch_size))
+        self.product_count = 0
+        self.edge_count = 0
+        self.dangling_targets = 0
+        self._products = []
+        self._edges = []
+        os.makedirs("output", exist_ok=True)
+        self.output_file = os.path.join("output", f"{name}.sqlite")
+        self._db_file = os.path.join("output", f".{name}.{uuid.uuid4().hex}.refs.sqlite")
+        self._db = sqlite3.connect(self._db_file)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE products (supplier_pid TEXT PRIMARY KEY) WITHOUT ROWID")
+        # Klíčem je zdrojový SUPPLIER_PID - sousedé produktu jsou jeden rozsah v B-stromu.
+        self._db.execute(
+            "CREATE TABLE refs (source TEXT NOT NULL, target TEXT NOT NULL, type TEXT NOT NULL DEFAULT '', "
+            "PRIMARY KEY (source, target, type)) WITHOUT ROWID"
+        )
+
+    def add_product(self, supplier_pid):
+        if not supplier_pid:
+            return
+        self._products.append((supplier_pid,))
+        if len(self._products) >= self.batch_size:
+            self._flush()
+
+    def add_reference(self, source, target, reference_type):
+        if not source or not target:
+            return
+        self._edges.append((source, target, reference_type or ""))
+        if len(self._edges) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._products:
+            self._db.executemany("INSERT OR IGNORE INTO products VALUES (?)", self._products)
+            self._products.clear()
+        if self._edges:
+            self._db.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?, ?)", self._edges)
+            self._edges.clear()
+        self._db.commit()
+
+    def iter_dangling(self):
+        # Index na cíl se staví až po načtení všech hran (jedno setřídění místo průběžné údržby).
+        self._flush()
+        self._db.execute("CREATE INDEX IF NOT EXISTS refs_target ON refs (target)")
+        self.product_count = self._db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        self.edge_count = self._db.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        self.dangling_targets = 0
+        previous_target = None
+        cursor = self._db.execute(
+            "SELECT source, target, NULLIF(type, '') FROM refs INDEXED BY refs_target "
+            "WHERE NOT EXISTS (SELECT 1 FROM products WHERE supplier_pid = refs.target) ORDER BY target"
+        )
+        for row in cursor:
+            if row[1] != previous_target:
+                self.dangling_targets += 1
+                previous_target = row[1]
+            yield row
+
+    def save(self):
+        self._flush()
+        self._db.close()
+        self._db = None
+        os.replace(self._db_file, self.output_file)
+        self.logger.info("Uložen soubor: %s", self.output_file)
+        return self.output_file
+
+    def cleanup(self):
+        self._products.clear()
+        self._edges.clear()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        try:
+            if os.path.exists(self._db_file):
+                os.remove(self._db_file)
+        except OSError as exc:
+            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", self._db_file, exc)
+
+
+# Externí řazení s omezenou pamětí: setříděné běhy (runs) na disku + k-cestné slučování.
+# Záznamy musí být serializovatelné do JSON.
+class ExternalSorter:
+
+    # Kolik běhů se slévá najednou; víc běhů se slévá ve více průchodech (omezí počet otevřených souborů).
+    max_fan_in = 64
+
+    def __init__(self, name, logger, key, run_size=100_000):
+        self.name = name
+        self.logger = logger
+        self.key = key
+        self.run_size = max(1, int(run_size))
+        self.record_count = 0
+        self._buffer = []
+        self._run_files = []
+
+    def add(self, record):
+        self._buffer.append(record)
+        self.record_count += 1
+        if len(self._buffer) >= self.run_size:
+            self._flush_run()
+
+    def _flush_run(self):
+        if not self._buffer:
+            return
+        self._buffer.sort(key=self.key)
+        self._write_run(self._buffer)
+        self._buffer = []
+
+    def _write_run(self, records):
+        os.makedirs("output", exist_ok=True)
+        run_file = os.path.join("output", f".{self.name}.{uuid.uuid4().hex}.run{len(self._run_files)}.jsonl")
+        self._run_files.append(run_file)
+        with open(run_file, "w", encoding="utf-8", newline="") as handle:
+            for record in records:
+                handle.write(json.dumps(record, ensure_ascii=False, default=str))
+                handle.write("\n")
+        return run_file
+
+    @staticmethod
+    def _read_run(run_file):
+        with open(run_file, "r", encoding="utf-8") as handle:
+            for line in handle:
+                yield json.loads(line)
+
+    def iter_sorted(self):
+        # Vše se vešlo do jednoho běhu - řadí se jen v paměti, bez disku.
+        if not self._run_files:
+            self._buffer.sort(key=self.key)
+            yield from self._buffer
+            return
+
+        self._flush_run()
+        self.logger.debug("Externí řazení %s: %s záznamů v %s bězích", self.name, self.record_count, len(self._run_files))
+        runs = self._merge_passes(list(self._run_files))
+        yield from heapq.merge(*(self._read_run(run_file) for run_file in runs), key=self.key)
+
+    def _merge_passes(self, runs):
+        # Sousední běhy se slévají po max_fan_in v pořadí vzniku, takže shodné klíče
+        # zůstanou v pořadí přidání (heapq.merge je stabilní vůči pořadí vstupů).
+        fan_in = max(2, int(self.max_fan_in))
+        while len(runs) > fan_in:
+            merged = []
+            for start in range(0, len(runs), fan_in):
+                group = runs[start:start + fan_in]
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                merged.append(self._write_run(heapq.merge(*(self._read_run(run_file) for run_file in group), key=self.key)))
+                for run_file in group:
+                    self._remove_run(run_file)
+            self.logger.debug("Externí řazení %s: průchod slévání %s -> %s běhů", self.name, len(runs), len(merged))
+            runs = merged
+        return runs
+
+    def _remove_run(self, run_file):
         try:
-            if os.path.exists(self._tmp_file):
-                os.remove(self._tmp_file)
+            if os.path.exists(run_file):
+                os.remove(run_file)
         except OSError as exc:
-            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", self._tmp_file, exc)
+            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", run_file, exc)
+        if run_file in self._run_files:
+            self._run_files.remove(run_file)
+
+    def cleanup(self):
+        self._buffer = []
+        for run_file in list(self._run_files):
+            self._remove_run(run_file)
+        self._run_files = []
 
 
 # Generic CSV Writing Function
-def save_to_csv(file_name, data, logger):
+def save_to_csv(file_name, data, logger, output_format="csv"):
     if not data:
-        logger.warning(f"Žádná data k uložení: {file_name}.csv")
+        logger.warning(f"Žádná data k uložení: {file_name}.{output_format}")
         return
 
     os.makedirs("output", exist_ok=True)
-    csv_file = f'output/{file_name}.csv'
+    csv_file = f'output/{file_name}.{output_format}'
 
     # Collect column headers dynamically
     fieldnames = sorted({key for row in data for key in row.keys()})
@@ -244,16 +852,22 @@ def save_to_csv(file_name, data, logger):
         fieldnames.remove('SUPPLIER_PID')  # Remove it temporarily
         fieldnames = ['SUPPLIER_PID'] + fieldnames  # Add it as the first column
 
-    with open(csv_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
+    if output_format == "xlsx":
+        with xlsx_writer.XlsxStreamWriter(csv_file, fieldnames, logger=logger) as writer:
+            for row in data:
+                writer.writerow([row.get(field) for field in fieldnames])
+    else:
+        with open(csv_file, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(data)
 
     logger.info(f"Uložen soubor: {csv_file}")
+    return csv_file
 
 
 # Parse HEADER from a streamed element
-def parse_BME_header_element(header, file_name, logger):
+def parse_BME_header_element(header, file_name, logger, output_format="csv"):
     if header is None:
         logger.warning("Nenalezen HEADER v XML souboru.")
         return
@@ -270,85 +884,430 @@ def parse_BME_header_element(header, file_name, logger):
     logger.debug("Header data: %s", parsed_header)
 
     flat_header = flatten_dict(parsed_header)
-    save_to_csv(f"{file_name}_hlavicka", [flat_header], logger)
+    return save_to_csv(f"{file_name}_hlavicka", [flat_header], logger, output_format=output_format)
+
+# Mapování produkt -> skupina: samostatné PRODUCT_TO_CATALOGGROUP_MAP (ARTICLE_TO_... v BMEcat 1.2)
+# i stejné elementy a CATALOG_GROUP_ID uvnitř produktu.
+CATALOG_GROUP_MAP_TAGS = ("PRODUCT_TO_CATALOGGROUP_MAP", "ARTICLE_TO_CATALOGGROUP_MAP")
+CATALOG_GROUP_FIELDS = ("GROUP_ID", "PARENT_ID", "GROUP_NAME", "TYPE", "GROUP_ORDER")
+PRODUCT_GROUP_FIELDS = ("SUPPLIER_PID", "CATALOG_GROUP_ID", "GROUP_ORDER", "SOURCE", "GROUP_PATH", "GROUP_PATH_IDS")
+PRODUCT_REFERENCE_TAGS = ("PRODUCT_REFERENCE", "ARTICLE_REFERENCE")
+PRODUCT_REFERENCE_FIELDS = ("SUPPLIER_PID", "REFERENCE_TYPE", "PROD_ID_TO", "QUANTITY", "CATALOG_ID", "CATALOG_VERSION", "REFERENCE_DESCR")
+DANGLING_REFERENCE_FIELDS = ("SUPPLIER_PID", "REFERENCE_TYPE", "PROD_ID_TO")
+
 
 # Writes streamed BMEcat/ETIM rows without collecting products in RAM.
 class BMEStreamProcessor:
     
-    def __init__(self, file_name, logger):
+    def __init__(
+        self,
+        file_name,
+        logger,
+        mime_assets=False,
+        normalize_features=False,
+        finalize_workers=None,
+        sort_by=None,
+        sort_run_size=100_000,
+        output_format="csv",
+        column_mappings=None,
+        product_layout="wide",
+        langs=None,
+        etim_dict=None,
+        etim_lang="en",
+        metrics=None,
+        slow_product_ms=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+        slow_products=0,
+        group_paths=False,
+        reference_index=False,
+        typed=False,
+    ):
         self.file_name = file_name
         self.logger = logger
+        self._metrics = metrics
+        self.typed = typed
+        self._timings = bme_latency.ProductTimings(file_name, logger, slow_product_ms, slow_products)
+        # Povolené jazykové kódy včetně aliasů (None = všechny jazyky).
+        self.lang_codes = frozenset().union(*(lang_codes(lang) for lang in langs)) if langs else None
+        self.finalize_workers = finalize_workers
+        self.output_format = output_format
+        # Soubory zapsané tímto během (pro manifest cache), doplňuje se ve finalize.
+        self.output_files = []
+        self.column_mappings = column_mappings or {}
+        self.product_layout = product_layout
+        self.sort_by = sort_by
+        self.sort_run_size = sort_run_size
         self.product_count = 0
         self.article_count = 0
         self.header_written = False
-        self._writers = {
-            "products": DynamicCsvBuffer(f"{file_name}_produkty", logger),
-            "mimes": DynamicCsvBuffer(f"{file_name}_soubory", logger),
-            "keywords": DynamicCsvBuffer(f"{file_name}_klicova_slova", logger),
-            "packing": DynamicCsvBuffer(f"{file_name}_jednotky_balení", logger),
-            "udx_logistics": DynamicCsvBuffer(f"{file_name}_udx_logistics", logger),
-            "features": DynamicCsvBuffer(f"{file_name}_features", logger),
-        }
+        self.mime_assets = mime_assets
+        self._feature_dimensions = FeatureDimensions() if normalize_features else None
+        self._etim = bme_etim.EtimDictionary(etim_dict, logger, lang_codes(etim_lang)) if etim_dict else None
+        # Cesta skupiny k mapování produktů (--group-paths).
+        self._group_index = CatalogGroupIndex(f"{file_name}_skupiny", logger) if group_paths else None
+        # Graf referencí mezi produkty a kontrola odkazů na neexistující produkty (--reference-index).
+        self._reference_index = ProductReferenceIndex(f"{file_name}_reference", logger) if reference_index else None
+        if product_layout == "long":
+            # Dlouhý formát má pevné sloupce - zapisuje se rovnou na disk bez spoolu a bez zjišťování sloupců.
+            self._writers = {
+                "products": self._create_writer(
+                    "produkty_eav",
+                    default_column_map=ColumnMapping((field, field) for field in PRODUCT_LONG_FIELDNAMES),
+                )
+            }
+        else:
+            self._writers = {"products": self._create_writer("produkty")}
+        self._asset_index = None
+        if mime_assets:
+            # Unikátní soubory + štíhlá vazební tabulka produkt -> soubor.
+            self._writers["mime_assets"] = self._create_writer("soubory_assety", priority_fields=("ASSET_ID",))
+            self._writers["mime_links"] = self._create_writer("soubory_vazby", priority_fields=("SUPPLIER_PID", "ASSET_ID"))
+            self._asset_index = DiskKeyIndex(f"{file_name}_soubory_assety", logger)
+        else:
+            self._writers["mimes"] = self._create_writer("soubory")
+        self._writers.update({
+            "keywords": self._create_writer("klicova_slova"),
+            "packing": self._create_writer("jednotky_balení"),
+            "udx_logistics": self._create_writer("udx_logistics"),
+            "features": self._create_writer("features"),
+        })
+
+        known_outputs = {writer.file_name for writer in self._writers.values()}
+        # Výstupy skupin a referencí vznikají, až když je katalog obsahuje.
+        known_outputs.update(f"{file_name}_{suffix}" for suffix, _ in self._LAZY_OUTPUTS.values())
+        known_outputs.update(name[len(file_name) + 1:] for name in list(known_outputs))
+        for output_name in self.column_mappings:
+            if output_name not in known_outputs:
+                self.logger.warning("Mapování sloupců pro neznámý výstup '%s' bude ignorováno.", output_name)
+
+    _LAZY_OUTPUTS = {
+        "catalog_groups": ("skupiny", CATALOG_GROUP_FIELDS),
+        "product_groups": ("produkty_skupiny", PRODUCT_GROUP_FIELDS),
+        "references": ("reference", PRODUCT_REFERENCE_FIELDS),
+        "dangling_references": ("reference_neplatne", DANGLING_REFERENCE_FIELDS),
+    }
+
+    def _lazy_writer(self, key):
+        writer = self._writers.get(key)
+        if writer is None:
+            suffix, priority_fields = self._LAZY_OUTPUTS[key]
+            writer = self._writers[key] = self._create_writer(suffix, priority_fields=priority_fields)
+        return writer
+
+    def _create_writer(self, suffix, priority_fields=("SUPPLIER_PID",), default_column_map=None):
+        output_name = f"{self.file_name}_{suffix}"
+        return DynamicCsvBuffer(
+            output_name,
+            self.logger,
+            priority_fields=priority_fields,
+            sort_by=self.sort_by,
+            sort_run_size=self.sort_run_size,
+            output_format=self.output_format,
+            column_map=self.column_mappings.get(suffix) or self.column_mappings.get(output_name) or default_column_map,
+            typed=self.typed,
+        )
 
     def process_header(self, header_element):
         if self.header_written:
             return
-        parse_BME_header_element(header_element, self.file_name, self.logger)
+        self._add_output(parse_BME_header_element(header_element, self.file_name, self.logger, output_format=self.output_format))
         self.header_written = True
 
+    def _add_output(self, path):
+        if path:
+            self.output_files.append(path)
+
+    def process_catalog_group(self, group_element):
+        group_data = parse_element(group_element, self.logger, langs=self.lang_codes)
+        self.process_catalog_group_data(group_data, group_element.attrib)
+
+    def process_catalog_group_data(self, group_data, attributes):
+        group_entry = parse_BME_catalog_group(group_data, attributes, self.logger)
+        if self._group_index is not None:
+            self._group_index.add(group_entry.get("GROUP_ID"), group_entry.get("PARENT_ID"), _first_value(group_data or {}, "GROUP_NAME"))
+        self._lazy_writer("catalog_groups").writerow(group_entry)
+
+    def process_group_map(self, map_element):
+        self.write_group_entries(parse_BME_group_map(parse_element(map_element, self.logger), self.logger))
+
+    def write_group_entries(self, entries):
+        if not entries:
+            return
+        if self._group_index is not None:
+            for entry in entries:
+                names, ids = self._group_index.path(entry["CATALOG_GROUP_ID"])
+                if not ids:
+                    log_limited(
+                        self.logger,
+                        logging.WARNING,
+                        "Neznámá skupina katalogu",
+                        "Skupina %s (SUPPLIER_PID=%s) není v CATALOG_GROUP_SYSTEM.",
+                        entry["CATALOG_GROUP_ID"],
+                        entry["SUPPLIER_PID"],
+                    )
+                entry["GROUP_PATH"] = " > ".join(names)
+                entry["GROUP_PATH_IDS"] = " > ".join(ids)
+        self._lazy_writer("product_groups").writerows(entries)
+
     def process_product_element(self, product_element):
         start_time = time.perf_counter()
+        product_tag = clean_tag(product_element.tag)
+        product_data = parse_element(product_element, self.logger, langs=self.lang_codes)
+        bundle = self.process_product_data(product_data, product_tag)
+        self.observe_product(time.perf_counter() - start_time, bundle, product_element, product_tag)
 
-        bundle = parse_BME_product_bundle(product_element, self.logger)
+    def process_product_data(self, product_data, product_tag):
+        bundle = parse_BME_product_bundle_from_data(product_data, product_tag, self.logger, product_layout=self.product_layout)
         self.write_product_bundle(bundle)
+        return bundle
 
-        duration_ms = (time.perf_counter() - start_time) * 1000
-        if duration_ms >= 20:
-            self.logger.warning("Dlouhá doba zpracování produktu: %.2f ms, SUPPLIER_PID=%s", duration_ms, bundle.get("supplier_pid", "N/A"))
-        
-        if bundle:
-            self.logger.debug(
-                "Produkt zpracován: tag=%s, SUPPLIER_PID=%s, duration=%.2f ms",
-                bundle.get("record_tag", clean_tag(product_element.tag)),
-                bundle.get("supplier_pid", "N/A"),
-                duration_ms,
-            )
+    def observe_product(self, seconds, bundle, product_element=None, product_tag=None):
+        self._timings.observe(seconds, bundle, product_element, product_tag)
+        if self._metrics is not None:
+            self._metrics.observe_product(seconds)
 
     def write_product_bundle(self, bundle):
         if not bundle:
             return
         self._writers["products"].writerows(bundle.get("products", []))
-        self._writers["mimes"].writerows(bundle.get("mimes", []))
+        if self.mime_assets:
+            self.write_mime_assets(bundle.get("mimes", []))
+        else:
+            self._writers["mimes"].writerows(bundle.get("mimes", []))
         self._writers["keywords"].writerows(bundle.get("keywords", []))
         self._writers["packing"].writerows(bundle.get("packing", []))
         self._writers["udx_logistics"].writerows(bundle.get("udx_logistics", []))
-        self._writers["features"].writerows(bundle.get("features", []))
+        features = bundle.get("features", [])
+        if self._etim is not None:
+            # V normalizovaném režimu dostanou popisy číselníky, na řádcích zůstává jen popis hodnoty.
+            columns = (("FVALUE", "FVALUE_DESC"),) if self._feature_dimensions is not None else bme_etim.FEATURE_DESCRIPTIONS
+            for row in features:
+                self._etim.enrich_feature_row(row, columns)
+        if self._feature_dimensions is not None:
+            features = [self._feature_dimensions.normalize_row(row) for row in features]
+        self._writers["features"].writerows(features)
+        self.write_group_entries(bundle.get("catalog_groups"))
+        self.write_references(bundle.get("references"), bundle.get("supplier_pid"))
         self.product_count += int(bundle.get("product_count", 0))
         self.article_count += int(bundle.get("article_count", 0))
 
+    def write_references(self, references, supplier_pid):
+        if self._reference_index is not None:
+            self._reference_index.add_product(supplier_pid)
+            for entry in references or ():
+                # Reference do jiného katalogu (CATALOG_ID) se proti tomuto katalogu neověřují.
+                if not entry.get("CATALOG_ID"):
+                    self._reference_index.add_reference(entry["SUPPLIER_PID"], entry["PROD_ID_TO"], entry.get("REFERENCE_TYPE"))
+        if references:
+            self._lazy_writer("references").writerows(references)
+
+    def check_references(self):
+        # Neplatné reference se zapisují ještě před dopsáním výstupů (vlastní výstup _reference_neplatne).
+        dangling = 0
+        for source, target, reference_type in self._reference_index.iter_dangling():
+            self._lazy_writer("dangling_references").writerow({
+                "SUPPLIER_PID": source,
+                "REFERENCE_TYPE": reference_type,
+                "PROD_ID_TO": target,
+            })
+            dangling += 1
+        index = self._reference_index
+        log = self.logger.warning if dangling else self.logger.info
+        log(
+            "Reference: produktů %s, hran %s, na neznámý produkt %s (cílů %s)",
+            index.product_count,
+            index.edge_count,
+            dangling,
+            index.dangling_targets,
+        )
+
+    def metric_counts(self):
+        # Počty pro export metrik: (záznamy podle typu, řádky podle výstupu).
+        records = {"PRODUCT": self.product_count, "ARTICLE": self.article_count}
+        # Volá se i z vlákna časovače metrik; tuple() zkopíruje hodnoty bez přerušení.
+        rows = {writer.file_name[len(self.file_name) + 1:]: writer.row_count for writer in tuple(self._writers.values())}
+        return records, rows
+
+    def write_mime_assets(self, mime_entries):
+        for entry in mime_entries:
+            asset, link = split_mime_asset(entry)
+            if self._asset_index.add(bytes.fromhex(asset["ASSET_ID"])):
+                self._writers["mime_assets"].writerow(asset)
+            self._writers["mime_links"].writerow(link)
+
     def finalize(self):
         if not self.header_written:
             self.logger.warning("Nenalezen HEADER v XML souboru.")
+        if self._reference_index is not None:
+            self.check_references()
+        self._finalize_writers()
         for writer in self._writers.values():
-            writer.finalize()
+            self.output_files.extend(writer.written_files)
+        if self._reference_index is not None:
+            self._add_output(self._reference_index.save())
+            self._reference_index = None
+        if self._asset_index is not None:
+            self.logger.info(
+                "MIME soubory: unikátních=%s, vazeb=%s",
+                self._writers["mime_assets"].row_count,
+                self._writers["mime_links"].row_count,
+            )
+            self._asset_index.cleanup()
+        if self._feature_dimensions is not None:
+            self.output_files += self._feature_dimensions.save(
+                self.file_name,
+                self.logger,
+                output_format=self.output_format,
+                describe=self._etim.describe if self._etim is not None else None,
+            )
+        if self._etim is not None:
+            self._etim.close()
+            self._etim = None
+        if self._group_index is not None:
+            info = self._group_index.path.cache_info()
+            self.logger.info("Skupiny katalogu: %s, dotazů na cestu: %s, z cache: %s", self._group_index.group_count, info.hits + info.misses, info.hits)
+            self._group_index.cleanup()
+        self._add_output(self._timings.report())
         self.logger.info(
             "Zpracováno záznamů: PRODUCT=%s, ARTICLE=%s",
             self.product_count,
             self.article_count,
         )
 
+    def _finalize_writers(self):
+        # Výstupy jsou nezávislé soubory, takže se dopisují souběžně.
+        # Konec běhu pak trvá zhruba jako dopsání největšího výstupu (obvykle features).
+        writers = list(self._writers.values())
+        max_workers = min(len(writers), self.finalize_workers or len(writers))
+        if max_workers <= 1:
+            for writer in writers:
+                writer.finalize()
+            return
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finalize") as executor:
+            futures = [executor.submit(writer.finalize) for writer in writers]
+            errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        self.logger.debug("Finalizace %s výstupů (%s vláken): %.2f s", len(writers), max_workers, time.perf_counter() - start_time)
+
     def cleanup(self):
         for writer in self._writers.values():
             writer.cleanup()
+        if self._asset_index is not None:
+            self._asset_index.cleanup()
+        if self._etim is not None:
+            self._etim.close()
+            self._etim = None
+        if self._group_index is not None:
+            self._group_index.cleanup()
+        if self._reference_index is not None:
+            self._reference_index.cleanup()
+
+
+# Jedna sada výstupů pro každý jazyk ({soubor}_{jazyk}_produkty, ...) v jednom průchodu.
+# Produkt se naparsuje jednou a každému jazyku se předá kopie bez uzlů v ostatních jazycích.
+class LanguageSplitProcessor:
+
+    def __init__(
+        self,
+        file_name,
+        logger,
+        langs,
+        output_format="csv",
+        metrics=None,
+        slow_product_ms=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+        slow_products=0,
+        **processor_kwargs,
+    ):
+        self.file_name = file_name
+        self.logger = logger
+        # Doba produktu se měří jednou za všechny jazyky, ne v každém dílčím processoru.
+        self._metrics = metrics
+        self._timings = bme_latency.ProductTimings(file_name, logger, slow_product_ms, slow_products)
+        self.output_format = output_format
+        self.header_written = False
+        # Soubory zapsané tímto během (pro manifest cache), doplňuje se ve finalize.
+        self.output_files = []
+        self._processors = {}
+        try:
+            for lang in langs:
+                self._processors[lang] = BMEStreamProcessor(
+                    f"{file_name}_{lang}",
+                    logger,
+                    output_format=output_format,
+                    langs=[lang],
+                    **processor_kwargs,
+                )
+        except BaseException:
+            self.cleanup()
+            raise
+        self.lang_codes = frozenset().union(*(processor.lang_codes for processor in self._processors.values()))
+        logger.info("Výstupy rozděleny podle jazyků: %s", ", ".join(self._processors))
+
+    def process_header(self, header_element):
+        if self.header_written:
+            return
+        header_file = parse_BME_header_element(header_element, self.file_name, self.logger, output_format=self.output_format)
+        if header_file:
+            self.output_files.append(header_file)
+        self.header_written = True
+        for processor in self._processors.values():
+            processor.header_written = True
+
+    def process_catalog_group(self, group_element):
+        group_data = parse_element(group_element, self.logger, langs=self.lang_codes)
+        for processor in self._processors.values():
+            processor.process_catalog_group_data(filter_lang_nodes(group_data, processor.lang_codes), group_element.attrib)
+
+    def process_group_map(self, map_element):
+        entries = parse_BME_group_map(parse_element(map_element, self.logger), self.logger)
+        for processor in self._processors.values():
+            processor.write_group_entries([dict(entry) for entry in entries])
 
+    def process_product_element(self, product_element):
+        start_time = time.perf_counter()
+        product_data = parse_element(product_element, self.logger, langs=self.lang_codes)
+        product_tag = clean_tag(product_element.tag)
+        bundle = None
+        for processor in self._processors.values():
+            bundle = processor.process_product_data(filter_lang_nodes(product_data, processor.lang_codes), product_tag)
+        seconds = time.perf_counter() - start_time
+        self._timings.observe(seconds, bundle, product_element, product_tag)
+        if self._metrics is not None:
+            self._metrics.observe_product(seconds)
+
+    def metric_counts(self):
+        records, rows = {}, {}
+        for lang, processor in tuple(self._processors.items()):
+            lang_records, lang_rows = processor.metric_counts()
+            records = lang_records
+            rows.update((f"{lang}_{output}", count) for output, count in lang_rows.items())
+        return records, rows
+
+    def finalize(self):
+        if not self.header_written:
+            self.logger.warning("Nenalezen HEADER v XML souboru.")
+        for processor in self._processors.values():
+            processor.finalize()
+            self.output_files.extend(processor.output_files)
+        slowest_file = self._timings.report()
+        if slowest_file:
+            self.output_files.append(slowest_file)
 
-def parse_BME_product_bundle(product, logger):
+    def cleanup(self):
+        for processor in self._processors.values():
+            processor.cleanup()
+
+
+def parse_BME_product_bundle(product, logger, product_layout="wide"):
     product_data = parse_element(product, logger)
     product_tag = clean_tag(product.tag)
-    return parse_BME_product_bundle_from_data(product_data, product_tag, logger)
+    return parse_BME_product_bundle_from_data(product_data, product_tag, logger, product_layout=product_layout)
 
 
-def parse_BME_product_bundle_from_data(product_data, product_tag, logger):
+def parse_BME_product_bundle_from_data(product_data, product_tag, logger, product_layout="wide"):
     product_entries, mime_entries, keyword_entries = [], [], []
     packing_entries, udx_logistics_entries, feature_entries = [], [], []
 
@@ -375,23 +1334,26 @@ def parse_BME_product_bundle_from_data(product_data, product_tag, logger):
     if not isinstance(product_details, dict):
         product_details = {}
 
-    logger.debug(f"Zpracovávám produkt:{supplier_pid}")
+    logger.debug("Zpracovávám produkt: %s", supplier_pid)
     if product_is_article:
-        logger.warning(f"ARTICLE zpracován jako produkt: {supplier_pid}")
+        log_limited(logger, logging.WARNING, "ARTICLE zpracován jako produkt", "ARTICLE zpracován jako produkt: %s", supplier_pid)
 
     # EAN parse
     # Normalize keys for case-insensitive matching
     product_details_lower = {key.lower(): value for key, value in product_details.items()}
     ean_keys = ["ean", "international_pid @type:ean", "international_pid @type:gtin"]
     inter_pid_ean = next((product_details_lower[key] for key in ean_keys if key in product_details_lower), None)
-    logger.debug(f"EAN: {inter_pid_ean}")
+    logger.debug("EAN: %s", inter_pid_ean)
     if not inter_pid_ean:
-        logger.debug(f"EAN nenalezen u produktu {supplier_pid}")
+        log_limited(logger, logging.DEBUG, "EAN nenalezen", "EAN nenalezen u produktu %s", supplier_pid)
 
     # Parse product details
-    for entry in parse_BME_product(product_data, logger):
-        entry["SUPPLIER_PID"] = supplier_pid
-        product_entries.append(entry)
+    if product_layout == "long":
+        product_entries.extend(parse_BME_product_long(product_data, supplier_pid, logger))
+    else:
+        for entry in parse_BME_product(product_data, logger):
+            entry["SUPPLIER_PID"] = supplier_pid
+            product_entries.append(entry)
 
     # Parse MIME data
     for entry in parse_BME_mime(product_data, logger):
@@ -417,6 +1379,12 @@ def parse_BME_product_bundle_from_data(product_data, product_tag, logger):
         udx_logistics["EAN"] = inter_pid_ean
         udx_logistics_entries.append(udx_logistics)
 
+    # Parse mapování na skupiny katalogu uvnitř produktu
+    group_entries = parse_BME_product_groups(product_data, supplier_pid, logger)
+
+    # Parse PRODUCT_REFERENCE (příslušenství, náhradní díly, nástupci, ...)
+    reference_entries = parse_BME_product_references(product_data, supplier_pid, logger)
+
     # Parse PRODUCT_FEATURES
     for fe in parse_BME_features(product_data, logger):
         fe["SUPPLIER_PID"] = supplier_pid
@@ -430,6 +1398,8 @@ def parse_BME_product_bundle_from_data(product_data, product_tag, logger):
         "packing": packing_entries,
         "udx_logistics": udx_logistics_entries,
         "features": feature_entries,
+        "catalog_groups": group_entries,
+        "references": reference_entries,
         "product_count": 0 if product_is_article else 1,
         "article_count": 1 if product_is_article else 0,
 
@@ -470,7 +1440,7 @@ def parse_BME_mime(data, logger):
             entry = dict(raw_entry)
             mime_code = entry.get("MIME_CODE") or entry.get("UDX.EDXF.MIME_CODE")
             if not mime_code:
-                _debug_limited(logger, "mime_code_missing", "MIME_CODE nenalezen, hledám v MIME_DESCR")
+                log_limited(logger, logging.DEBUG, "MIME_CODE nenalezen", "MIME_CODE nenalezen, hledám v MIME_DESCR")
                 mime_code = entry.get("MIME_DESCR")
             
             if mime_code:
@@ -478,7 +1448,7 @@ def parse_BME_mime(data, logger):
                 if mime_code_name:
                     entry["MIME_CODE_NAME"] = mime_code_name
                 else:
-                    _debug_limited(logger, f"invalid_mime_code:{mime_code}", f"Neplatný MIME_CODE: {mime_code}")
+                    log_limited(logger, logging.DEBUG, f"Neplatný MIME_CODE {mime_code}", "Neplatný MIME_CODE: %s", mime_code)
 
             mime_source = entry.get("UDX.EDXF.MIME_SOURCE")
             if isinstance(mime_source, list) and len(mime_source) == 2 and mime_source[0] == mime_source[1]:
@@ -493,6 +1463,39 @@ def parse_BME_mime(data, logger):
     return mime_entries
 
 
+# Sloupce MIME záznamu, které patří k vazbě produkt -> soubor, ne k samotnému souboru.
+_MIME_LINK_FIELDS = ("SUPPLIER_PID", "EAN", "MIME_PURPOSE", "MIME_ORDER", "UDX.EDXF.MIME_ORDER")
+
+
+def mime_asset_id(entry):
+    # Obsahový klíč souboru: hash ze zdroje, kódu a popisů (všech jazyků).
+    source = entry.get("MIME_SOURCE") or entry.get("UDX.EDXF.MIME_SOURCE") or ""
+    code = entry.get("MIME_CODE") or entry.get("UDX.EDXF.MIME_CODE") or ""
+    descriptions = [
+        f"{key}={entry[key]}"
+        for key in sorted(entry)
+        if split_key(key)[0] in ("MIME_DESCR", "UDX.EDXF.MIME_DESCR", "UDX.EDXF.MIME_DESIGNATION")
+    ]
+    raw = "\x1f".join([str(source), str(code), *descriptions])
+    # 128 bitů: kolize dvou různých souborů je i u stovek milionů záznamů zanedbatelná
+    # (index assetů porovnává jen hash, ne zdroj).
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def split_mime_asset(entry):
+    # Rozdělí MIME záznam na (asset, vazba), propojené přes ASSET_ID.
+    asset_id = mime_asset_id(entry)
+    asset = {"ASSET_ID": asset_id}
+    link = {"SUPPLIER_PID": entry.get("SUPPLIER_PID"), "EAN": entry.get("EAN"), "ASSET_ID": asset_id}
+    for key, value in entry.items():
+        if key in _MIME_LINK_FIELDS:
+            if value is not None:
+                link[key] = value
+        else:
+            asset[key] = value
+    return asset, link
+
+
 # Parse Product Details
 def parse_BME_product(product_data, logger):
     product_entry = {}
@@ -523,6 +1526,123 @@ def parse_BME_product(product_data, logger):
     return [product_entry]
 
 
+# Pevné sloupce dlouhého (EAV) formátu detailů produktu.
+PRODUCT_LONG_FIELDNAMES = ("SUPPLIER_PID", "ATTRIBUTE", "LANG", "TYPE", "QUALIFIERS", "VALUE")
+
+
+# Parse Product Details - long format
+def parse_BME_product_long(product_data, supplier_pid, logger):
+    """
+    Detaily produktu jako řádky SUPPLIER_PID / atribut / kvalifikátory (lang, type, ostatní) / hodnota.
+    Opakované elementy (seznamy) dávají více řádků místo jedné spojené hodnoty.
+    """
+    # Logistické údaje se berou stejně jako ve wide formátu.
+    logistic_entry = parse_BME_product({"PRODUCT_LOGISTIC_DETAILS": product_data.get("PRODUCT_LOGISTIC_DETAILS", {})}, logger)[0]
+    product_details = product_data.get("PRODUCT_DETAILS", {})
+    if not isinstance(product_details, dict):
+        product_details = {}
+
+    rows = []
+    for key, value in [*logistic_entry.items(), *product_details.items()]:
+        tag, attrs = split_key(key)
+        lang = next((attrs.pop(name) for name in _LANG_ATTRIBUTES if name in attrs), None)
+        value_type = attrs.pop("type", None)
+        qualifiers = "; ".join(f"{name}={attr_value}" for name, attr_value in attrs.items()) or None
+        for item in value if isinstance(value, list) else [value]:
+            if item is None:
+                continue
+            rows.append({
+                "SUPPLIER_PID": supplier_pid,
+                "ATTRIBUTE": tag,
+                "LANG": lang,
+                "TYPE": value_type,
+                "QUALIFIERS": qualifiers,
+                "VALUE": sanitize_value(item if isinstance(item, str) else str(item)),
+            })
+    return rows
+
+
+def _first_value(data, prefix):
+    # Hodnota prvního klíče s daným tagem (bez ohledu na atributy, např. GROUP_NAME @lang:deu).
+    for key, value in data.items():
+        if key == prefix or key.startswith(f"{prefix} "):
+            return value[0] if isinstance(value, list) else value
+    return None
+
+
+# Parse CATALOG_STRUCTURE
+def parse_BME_catalog_group(group_data, attributes, logger):
+    if not isinstance(group_data, dict):
+        group_data = {}
+    group_entry = {key: sanitize_value(value) for key, value in flatten_dict(group_data).items()}
+    if attributes.get("type"):
+        group_entry["TYPE"] = attributes["type"]
+    if not group_entry.get("GROUP_ID"):
+        log_limited(logger, logging.WARNING, "CATALOG_STRUCTURE bez GROUP_ID", "CATALOG_STRUCTURE bez GROUP_ID: %s", group_entry)
+    return group_entry
+
+
+def _group_map_entry(map_data, supplier_pid, source):
+    if not isinstance(map_data, dict):
+        # <CATALOG_GROUP_ID> přímo v produktu
+        return {"SUPPLIER_PID": supplier_pid, "CATALOG_GROUP_ID": map_data, "SOURCE": source}
+    return {
+        "SUPPLIER_PID": supplier_pid or _first_value(map_data, "PROD_ID") or _first_value(map_data, "ART_ID"),
+        "CATALOG_GROUP_ID": _first_value(map_data, "CATALOG_GROUP_ID"),
+        "GROUP_ORDER": _first_value(map_data, "PRODUCT_TO_CATALOGGROUP_MAP_ORDER") or _first_value(map_data, "ARTICLE_TO_CATALOGGROUP_MAP_ORDER"),
+        "SOURCE": source,
+    }
+
+
+# Parse samostatného PRODUCT_TO_CATALOGGROUP_MAP (za produkty v T_NEW_CATALOG)
+def parse_BME_group_map(map_data, logger):
+    entry = _group_map_entry(map_data, None, "map")
+    if not entry["SUPPLIER_PID"] or not entry["CATALOG_GROUP_ID"]:
+        log_limited(logger, logging.WARNING, "Neúplné mapování na skupinu", "Mapování na skupinu bez PROD_ID nebo CATALOG_GROUP_ID: %s", map_data)
+        return []
+    return [entry]
+
+
+# Parse mapování na skupiny uvnitř produktu
+def parse_BME_product_groups(product_data, supplier_pid, logger):
+    entries = []
+    for key, value in product_data.items():
+        tag = key.split(" ", 1)[0]
+        if tag not in CATALOG_GROUP_MAP_TAGS and tag != "CATALOG_GROUP_ID":
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            entry = _group_map_entry(item, supplier_pid, "product")
+            if entry["CATALOG_GROUP_ID"]:
+                entries.append(entry)
+    return entries
+
+
+# Parse PRODUCT_REFERENCE / ARTICLE_REFERENCE (BMEcat 1.2)
+def parse_BME_product_references(product_data, supplier_pid, logger):
+    entries = []
+    for key, value in product_data.items():
+        tag, attrs = split_key(key)
+        if tag not in PRODUCT_REFERENCE_TAGS:
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if not isinstance(item, dict):
+                item = {}
+            target = _first_value(item, "PROD_ID_TO") or _first_value(item, "ART_ID_TO")
+            if not target:
+                log_limited(logger, logging.WARNING, "Reference bez cíle", "%s bez PROD_ID_TO u produktu %s", tag, supplier_pid)
+                continue
+            entries.append({
+                "SUPPLIER_PID": supplier_pid,
+                "REFERENCE_TYPE": attrs.get("type"),
+                "PROD_ID_TO": target,
+                "QUANTITY": attrs.get("quantity"),
+                "CATALOG_ID": _first_value(item, "CATALOG_ID"),
+                "CATALOG_VERSION": _first_value(item, "CATALOG_VERSION"),
+                "REFERENCE_DESCR": sanitize_value(_first_value(item, "REFERENCE_DESCR")),
+            })
+    return entries
+
+
 # Parse Keywords
 def parse_BME_keyword(product_data, logger):
     supplier_pid = next((product_data[key] for key in product_data if key.startswith("SUPPLIER_PID")), "N/A")
@@ -581,6 +1701,9 @@ def parse_BME_features(product_data, logger):
         # optional meta-data on block-level
         ref_system_name, _ = get_first_value(features_block, "REFERENCE_FEATURE_SYSTEM_NAME")
         ref_group_id, _ = get_first_value(features_block, "REFERENCE_FEATURE_GROUP_ID")
+        # Metadata se opakují na každém řádku - internujeme je jednou za blok.
+        ref_system_name = intern_value(sanitize_value(ref_system_name))
+        ref_group_id = intern_value(sanitize_value(ref_group_id))
 
         for f in feature_nodes:
             if not isinstance(f, dict):
@@ -590,8 +1713,8 @@ def parse_BME_features(product_data, logger):
             fname_candidates = iter_tag_values(f, "FNAME")
             if fname_candidates:
                 fname_val, fname_attrs = fname_candidates[0]
-                fname = sanitize_value(fname_val)
-                fname_lang = fname_attrs.get("lang") or fname_attrs.get("xml:lang")
+                fname = intern_value(sanitize_value(fname_val))
+                fname_lang = intern_value(fname_attrs.get("lang") or fname_attrs.get("xml:lang"))
             else:
                 fname, fname_lang = None, None
 
@@ -600,7 +1723,7 @@ def parse_BME_features(product_data, logger):
             forder_val, _ = get_first_value(f, "FORDER")
             fvalue_details_val, _ = get_first_value(f, "FVALUE_DETAILS")
 
-            funit = sanitize_value(funit_val)
+            funit = intern_value(sanitize_value(funit_val))
             forder = sanitize_value(forder_val)
             fvalue_details = sanitize_value(fvalue_details_val)
 
@@ -609,8 +1732,8 @@ def parse_BME_features(product_data, logger):
 
             if not fvalue_items:
                 out.append({
-                    "REFERENCE_FEATURE_SYSTEM_NAME": sanitize_value(ref_system_name),
-                    "REFERENCE_FEATURE_GROUP_ID": sanitize_value(ref_group_id),
+                    "REFERENCE_FEATURE_SYSTEM_NAME": ref_system_name,
+                    "REFERENCE_FEATURE_GROUP_ID": ref_group_id,
                     "FNAME": fname,
                     "FNAME_LANG": fname_lang,
                     "FVALUE": None,
@@ -622,10 +1745,10 @@ def parse_BME_features(product_data, logger):
                 continue
 
             for fval, fattrs in fvalue_items:
-                fvalue_lang = fattrs.get("lang") or fattrs.get("xml:lang")
+                fvalue_lang = intern_value(fattrs.get("lang") or fattrs.get("xml:lang"))
                 out.append({
-                    "REFERENCE_FEATURE_SYSTEM_NAME": sanitize_value(ref_system_name),
-                    "REFERENCE_FEATURE_GROUP_ID": sanitize_value(ref_group_id),
+                    "REFERENCE_FEATURE_SYSTEM_NAME": ref_system_name,
+                    "REFERENCE_FEATURE_GROUP_ID": ref_group_id,
                     "FNAME": fname,
                     "FNAME_LANG": fname_lang,
                     "FVALUE": sanitize_value(fval),
@@ -687,6 +1810,102 @@ def sanitize_value(value):
     return value
 
 
+def intern_value(value):
+    # Opakované kódy (ETIM třídy, FNAME, jednotky, jazyky) sdílí jeden objekt.
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# Číselníky opakujících se metadat features pro normalizovaný výstup.
+class FeatureDimensions:
+
+    def __init__(self):
+        self.systems = {}
+        self.classes = {}
+        self.names = {}
+        self.units = {}
+
+    @staticmethod
+    def _lookup(table, key):
+        key_id = table.get(key)
+        if key_id is None:
+            key_id = len(table) + 1
+            table[key] = key_id
+        return key_id
+
+    def normalize_row(self, row):
+        system_name = row.get("REFERENCE_FEATURE_SYSTEM_NAME")
+        group_id = row.get("REFERENCE_FEATURE_GROUP_ID")
+        fname = row.get("FNAME")
+        funit = row.get("FUNIT")
+
+        system_id = self._lookup(self.systems, system_name) if system_name else None
+        # Systém bez skupiny dostane třídu s prázdnou skupinou, aby se název systému neztratil.
+        class_id = self._lookup(self.classes, (system_id, group_id)) if group_id or system_id else None
+        fname_id = self._lookup(self.names, (fname, row.get("FNAME_LANG"))) if fname else None
+        unit_id = self._lookup(self.units, funit) if funit else None
+
+        normalized = {
+            "SUPPLIER_PID": row.get("SUPPLIER_PID"),
+            "EAN": row.get("EAN"),
+            "CLASS_ID": class_id,
+            "FNAME_ID": fname_id,
+            "FVALUE": row.get("FVALUE"),
+            "FVALUE_LANG": row.get("FVALUE_LANG"),
+            "FVALUE_DETAILS": row.get("FVALUE_DETAILS"),
+            "UNIT_ID": unit_id,
+            "FORDER": row.get("FORDER"),
+        }
+        if "FVALUE_DESC" in row:
+            normalized["FVALUE_DESC"] = row["FVALUE_DESC"]
+        return normalized
+
+    def save(self, file_name, logger, output_format="csv", describe=None):
+        # describe: volitelný překlad ETIM kódu na popis (slovník ETIM).
+        def described(row, source, target):
+            if describe is not None and bme_etim.is_etim_code(row.get(source)):
+                description = describe(row[source])
+                if description is not None:
+                    row[target] = description
+            return row
+
+        saved = []
+        saved.append(save_to_csv(
+            f"{file_name}_features_systemy",
+            [{"SYSTEM_ID": key_id, "REFERENCE_FEATURE_SYSTEM_NAME": name} for name, key_id in self.systems.items()],
+            logger,
+            output_format=output_format,
+        ))
+        saved.append(save_to_csv(
+            f"{file_name}_features_tridy",
+            [
+                described(
+                    {"CLASS_ID": key_id, "SYSTEM_ID": system_id, "REFERENCE_FEATURE_GROUP_ID": group_id},
+                    "REFERENCE_FEATURE_GROUP_ID",
+                    "REFERENCE_FEATURE_GROUP_DESC",
+                )
+                for (system_id, group_id), key_id in self.classes.items()
+            ],
+            logger,
+            output_format=output_format,
+        ))
+        saved.append(save_to_csv(
+            f"{file_name}_features_nazvy",
+            [
+                described({"FNAME_ID": key_id, "FNAME": fname, "FNAME_LANG": lang}, "FNAME", "FNAME_DESC")
+                for (fname, lang), key_id in self.names.items()
+            ],
+            logger,
+            output_format=output_format,
+        ))
+        saved.append(save_to_csv(
+            f"{file_name}_features_jednotky",
+            [described({"UNIT_ID": key_id, "FUNIT": funit}, "FUNIT", "FUNIT_DESC") for funit, key_id in self.units.items()],
+            logger,
+            output_format=output_format,
+        ))
+        return [path for path in saved if path]
+
+
 # UDX
 def strip_udx_prefix(s: str) -> str:
     if isinstance(s, str) and s.startswith("UDX.EDXF."):
@@ -0,0 +1,302 @@
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# local imports
+import bme_logging
+import bme_parser
+import xml_utils
+
+_CONTENT_TYPES = {
+    ".csv": "text/csv; charset=utf-8",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".json": "application/json",
+}
+_BOOLEAN_OPTIONS = ("mime_assets", "normalize_features", "split_langs", "group_paths", "reference_index", "typed")
+_CHUNK_SIZE = 64 * 1024
+# Jméno uploadu jde do názvů souborů i do hlavičky Content-Disposition (latin-1), proto jen ASCII.
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def upload_name(value):
+    return _UNSAFE_NAME_CHARS.sub("_", value or "")[:100] or "upload"
+
+
+# Tělo požadavku s Content-Length.
+class _LimitedReader:
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+# Tělo požadavku s Transfer-Encoding: chunked.
+class _ChunkedReader:
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._remaining = 0
+        self._done = False
+
+    def _next_chunk(self):
+        line = self._stream.readline(1024)
+        if not line:
+            raise ValueError("Neúplné chunked tělo požadavku.")
+        self._remaining = int(line.split(b";", 1)[0].strip() or b"0", 16)
+        if self._remaining == 0:
+            # Volitelné trailery až po prázdný řádek.
+            while self._stream.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass
+            self._done = True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(_CHUNK_SIZE), b""))
+        while not self._done:
+            if self._remaining == 0:
+                self._next_chunk()
+                continue
+            data = self._stream.read(min(size, self._remaining))
+            if not data:
+                raise ValueError("Neúplné chunked tělo požadavku.")
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                # CRLF za daty chunku.
+                self._stream.readline(1024)
+            return data
+        return b""
+
+
+class ConversionServer(ThreadingHTTPServer):
+    # Při ukončení se čeká na rozběhnuté převody.
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, address, logger, options=None, workers=2, queue_size=16):
+        super().__init__(address, ConversionRequestHandler)
+        self.logger = logger
+        self.options = dict(options or {})
+        # Cache výsledků je vázaná na soubor na disku, u uploadu nemá smysl.
+        self.options.pop("cache", None)
+        # --recover potřebuje soubor na disku (mmap), upload se čte jen jako stream.
+        self.options.pop("recover", None)
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    def acquire_slot(self):
+        # False = fronta je plná. Jinak blokuje, dokud se neuvolní worker.
+        with self._lock:
+            if self._slots.acquire(blocking=False):
+                self.running += 1
+                return True
+            if self.waiting >= self.queue_size:
+                return False
+            self.waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        return True
+
+    def release_slot(self):
+        with self._lock:
+            self.running -= 1
+        self._slots.release()
+
+
+def _job_logger(server_logger, job_name):
+    # Samostatný logger pro úlohu (vlastní omezovač opakovaných zpráv), výstup jde přes handlery serveru.
+    # Nevzniká přes logging.getLogger(), aby se loggery úloh nehromadily v registru.
+    logger = logging.Logger(f"{server_logger.name}.{job_name}", level=server_logger.level)
+    logger.parent = server_logger
+    logger.addFilter(bme_logging.RateLimiter())
+    return logger
+
+
+def _job_outputs(job_name):
+    try:
+        with os.scandir("output") as entries:
+            return sorted(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.startswith(f"{job_name}_")
+            )
+    except FileNotFoundError:
+        return []
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BME-tool"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug("HTTP %s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send_json(404, {"error": "Neznámá cesta. Použijte POST /convert nebo GET /health."})
+            return
+        server = self.server
+        self._send_json(200, {"workers": server.workers, "running": server.running, "waiting": server.waiting})
+
+    def _job_options(self, query):
+        options = dict(self.server.options)
+        for name in _BOOLEAN_OPTIONS:
+            if name in query:
+                options[name] = query[name][-1].lower() in ("1", "true", "yes", "ano")
+        if "format" in query:
+            options["output_format"] = query["format"][-1]
+        if "product_layout" in query:
+            options["product_layout"] = query["product_layout"][-1]
+        if "sort_by" in query:
+            options["sort_by"] = query["sort_by"][-1] or None
+        if "langs" in query:
+            options["langs"] = bme_parser.parse_langs(query["langs"][-1])
+
+        if options.get("output_format", "csv") not in ("csv", "xlsx"):
+            raise ValueError("format musí být csv nebo xlsx.")
+        if options.get("product_layout", "wide") not in ("wide", "long"):
+            raise ValueError("product_layout musí být wide nebo long.")
+        if options.get("split_langs") and not options.get("langs"):
+            raise ValueError("split_langs vyžaduje langs.")
+        return options
+
+    def _request_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            body = _ChunkedReader(self.rfile)
+        elif self.headers.get("Content-Length"):
+            body = _LimitedReader(self.rfile, int(self.headers["Content-Length"]))
+        else:
+            return None
+        # gzip podle hlavičky nebo podle magic bajtů.
+        magic = body.read(2)
+        body = xml_utils.PrefixedReader(magic, body)
+        if magic == b"\x1f\x8b" or self.headers.get("Content-Encoding", "").lower() == "gzip":
+            return gzip.GzipFile(fileobj=body, mode="rb")
+        return body
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self._send_json(404, {"error": "Neznámá cesta. Použijte POST /convert nebo GET /health."})
+            return
+
+        query = parse_qs(url.query)
+        name = upload_name(query.get("name", ["upload"])[-1])
+        section = query.get("section", [None])[-1]
+        try:
+            options = self._job_options(query)
+        except ValueError as exc:
+            self._send_json(400, {"error": str(exc)})
+            return
+
+        server = self.server
+        if not server.acquire_slot():
+            server.logger.warning("Fronta převodů je plná, požadavek %s odmítnut.", name)
+            self._send_json(503, {"error": "Fronta převodů je plná, zkuste to později."})
+            return
+
+        job_name = f"{name}-{uuid.uuid4().hex[:8]}"
+        logger = _job_logger(server.logger, job_name)
+        try:
+            try:
+                body = self._request_body()
+                if body is None:
+                    self._send_json(411, {"error": "Chybí Content-Length nebo Transfer-Encoding: chunked."})
+                    return
+                xml_utils.xml_parse_stream(body, job_name, logger, metrics_name=name, **options)
+                bme_logging.log_rate_summary(logger)
+            except Exception as exc:
+                logger.exception("Převod %s selhal.", job_name)
+                self._send_json(422, {"error": f"Převod selhal: {exc}"})
+                return
+            finally:
+                server.release_slot()
+
+            logger.info("Převod %s dokončen, odesílám výstupy.", job_name)
+            outputs = _job_outputs(job_name)
+            if section:
+                self._send_section(job_name, outputs, section)
+            else:
+                self._send_zip(job_name, name, outputs)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("Klient %s ukončil spojení.", self.address_string())
+        finally:
+            for output in _job_outputs(job_name):
+                try:
+                    os.remove(os.path.join("output", output))
+                except OSError as exc:
+                    logger.warning("Nepodařilo se odstranit výstup %s: %s", output, exc)
+
+    def _send_section(self, job_name, outputs, section):
+        matches = [output for output in outputs if os.path.splitext(output[len(job_name) + 1:])[0] == section]
+        if not matches:
+            sections = [os.path.splitext(output[len(job_name) + 1:])[0] for output in outputs]
+            self._send_json(404, {"error": f"Sekce {section} neexistuje.", "sections": sections})
+            return
+        path = os.path.join("output", matches[0])
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        with open(path, "rb") as file:
+            shutil.copyfileobj(file, self.wfile, _CHUNK_SIZE)
+        self.close_connection = True
+
+    def _send_zip(self, job_name, name, outputs):
+        # ZIP se zapisuje přímo do socketu (bez Content-Length, konec = uzavření spojení).
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", f'attachment; filename="{name}.zip"')
+        self.send_header("Connection", "close")
+        self.end_headers()
+        with zipfile.ZipFile(self.wfile, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for output in outputs:
+                archive.write(os.path.join("output", output), arcname=f"{name}{output[len(job_name):]}")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def serve(address, logger, options=None, workers=2, queue_size=16):
+    """
+    Spustí HTTP server pro převody (POST /convert, GET /health) a běží do Ctrl+C/SIGTERM.
+    Požadavky nad počet workerů čekají ve frontě (max. queue_size), další dostanou 503.
+    """
+    server = ConversionServer(address, logger, options=options, workers=workers, queue_size=queue_size)
+    host, port = server.server_address[:2]
+    logger.info("HTTP server naslouchá na http://%s:%s (workerů: %s, fronta: %s)", host, port, server.workers, server.queue_size)
+    try:
+        server.serve_forever()
+    finally:
+        logger.info("Ukončuji HTTP server, čekám na rozběhnuté převody.")
+        server.server_close()
@@ -0,0 +1,287 @@
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from xml.parsers import expat
+
+# local imports
+import bme_parser
+
+# Horní meze, aby profil nerostl bez omezení u nestandardních feedů.
+MAX_PATHS = 100_000
+MAX_ATTRIBUTE_VARIANTS = 1_000
+TOP_N = 50
+
+_PATH_FIELDS = ("PATH", "OCCURRENCES", "RECORDS", "MAX_PER_RECORD", "ATTRIBUTE_VARIANTS")
+# Elementy, jejichž text se sbírá do profilu: tag -> název počitadla.
+_TEXT_COUNTERS = {
+    "REFERENCE_FEATURE_GROUP_ID": "etim_classes",
+    "REFERENCE_FEATURE_SYSTEM_NAME": "feature_systems",
+    "MIME_CODE": "mime_codes",
+    "UDX.EDXF.MIME_CODE": "mime_codes",
+}
+
+
+def _local_name(name):
+    # "bmecat:PRODUCT" -> "PRODUCT" (expat bez zpracování namespace vrací prefixované názvy)
+    return name.rsplit(":", 1)[-1] if ":" in name and not name.startswith("xml:") else name
+
+
+# Uzel stromu cest. Počty na záznam se sledují přes pořadové číslo záznamu,
+# takže se na konci záznamu nic neslučuje.
+class _PathNode:
+    __slots__ = ("path", "children", "occurrences", "records", "max_per_record", "variants", "plain", "record_serial", "record_count")
+
+    def __init__(self, path):
+        self.path = path
+        self.children = {}
+        self.occurrences = 0
+        self.records = 0
+        self.max_per_record = 0
+        self.variants = None
+        # Element se vyskytl i bez atributů (samostatný sloupec bez @...).
+        self.plain = False
+        self.record_serial = 0
+        self.record_count = 0
+
+    def variant_count(self):
+        # Počet různých kombinací atributů = počet sloupců, které element vytvoří ve širokém výstupu.
+        return (len(self.variants) if self.variants else 0) + self.plain
+
+
+# Profil katalogu nad expat tokenizérem: počítají se jen tagy, atributy a několik
+# vybraných textů. Nevzniká strom elementů ani dict z parse_element().
+class CatalogProfiler:
+
+    def __init__(self, record_tags):
+        self.record_tags = set(record_tags)
+        self.record_counts = Counter()
+        self.features_per_record = Counter()
+        self.counters = {name: Counter() for name in ("etim_classes", "feature_systems", "mime_codes", "languages")}
+        self.path_count = 0
+        self.truncated_paths = 0
+
+        self._root = _PathNode("")
+        # Cesty uvnitř záznamu jsou relativní k záznamu - odpovídají sloupcům výstupu.
+        self._record_root = _PathNode("")
+        self._names = {}
+        self._stack = []
+        self._record_depth = None
+        self._record_serial = 0
+        self._record_features = 0
+        self._text_counter = None
+        self._text = []
+
+    def _child(self, parent, tag):
+        node = parent.children.get(tag)
+        if node is None:
+            if self.path_count >= MAX_PATHS:
+                self.truncated_paths += 1
+                return None
+            node = _PathNode(f"{parent.path}/{tag}" if parent.path else tag)
+            parent.children[tag] = node
+            self.path_count += 1
+        return node
+
+    def _touch(self, node):
+        node.occurrences += 1
+        serial = self._record_serial
+        if self._record_depth is not None:
+            if node.record_serial != serial:
+                node.record_serial = serial
+                node.records += 1
+                node.record_count = 1
+            else:
+                node.record_count += 1
+            if node.record_count > node.max_per_record:
+                node.max_per_record = node.record_count
+
+    def start(self, name, attrs):
+        tag = self._names.get(name)
+        if tag is None:
+            tag = self._names[name] = _local_name(name)
+
+        if self._record_depth is None and tag in self.record_tags:
+            self._record_depth = len(self._stack)
+            self._record_serial += 1
+            self._record_features = 0
+            self.record_counts[tag] += 1
+            parent = self._record_root
+        else:
+            parent = self._stack[-1] if self._stack else self._root
+
+        node = self._child(parent, tag) if parent is not None else None
+        self._stack.append(node)
+        if node is not None:
+            self._touch(node)
+            if attrs:
+                if node.variants is None:
+                    node.variants = set()
+                if len(node.variants) < MAX_ATTRIBUTE_VARIANTS:
+                    node.variants.add(tuple(sorted(attrs.items())))
+                for attr_name in attrs:
+                    attr_node = self._child(node, f"@{attr_name}")
+                    if attr_node is not None:
+                        self._touch(attr_node)
+            elif not node.plain:
+                node.plain = True
+
+        if attrs:
+            lang = attrs.get("lang") or attrs.get("xml:lang")
+            if lang:
+                self.counters["languages"][lang] += 1
+
+        if tag == "FEATURE" and self._record_depth is not None:
+            self._record_features += 1
+
+        counter_name = _TEXT_COUNTERS.get(tag)
+        if counter_name is not None:
+            self._text_counter = self.counters[counter_name]
+            self._text = []
+
+    def end(self, name):
+        self._stack.pop()
+        if self._text_counter is not None:
+            text = "".join(self._text).strip()
+            if text:
+                self._text_counter[text] += 1
+            self._text_counter = None
+
+        if self._record_depth == len(self._stack):
+            self.features_per_record[self._record_features] += 1
+            self._record_depth = None
+
+    def text(self, data):
+        if self._text_counter is not None:
+            self._text.append(data)
+
+    def parse_file(self, file_path):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.text
+        with open(file_path, "rb") as file:
+            parser.ParseFile(file)
+
+    def _iter_nodes(self):
+        pending = [self._root, self._record_root]
+        while pending:
+            node = pending.pop()
+            if node.path:
+                yield node
+            pending.extend(node.children.values())
+
+    def path_rows(self):
+        for node in sorted(self._iter_nodes(), key=lambda node: node.path):
+            yield {
+                "PATH": node.path,
+                "OCCURRENCES": node.occurrences,
+                "RECORDS": node.records,
+                "MAX_PER_RECORD": node.max_per_record,
+                "ATTRIBUTE_VARIANTS": node.variant_count(),
+            }
+
+    def summary(self):
+        # Odhad počtu sloupců širokých výstupů: každá varianta atributů elementu je vlastní sloupec.
+        record_nodes = [self._record_root]
+        column_variants = 0
+        while record_nodes:
+            node = record_nodes.pop()
+            for tag, child in node.children.items():
+                if not tag.startswith("@"):
+                    column_variants += child.variant_count()
+                    record_nodes.append(child)
+        return {
+            "records": dict(self.record_counts),
+            "records_total": sum(self.record_counts.values()),
+            "features_per_record": _distribution(self.features_per_record),
+            "etim_classes": _top(self.counters["etim_classes"]),
+            "feature_systems": _top(self.counters["feature_systems"]),
+            "languages": _top(self.counters["languages"]),
+            "mime_codes": _top(self.counters["mime_codes"]),
+            "distinct_paths": self.path_count,
+            "truncated_paths": self.truncated_paths,
+            "record_path_variants": column_variants,
+        }
+
+
+def _top(counter):
+    return {
+        "distinct": len(counter),
+        "total": sum(counter.values()),
+        "top": dict(counter.most_common(TOP_N)),
+    }
+
+
+def _distribution(counter):
+    total = sum(counter.values())
+    if not total:
+        return {"count": 0}
+
+    def percentile(fraction):
+        threshold = fraction * total
+        cumulative = 0
+        for value in sorted(counter):
+            cumulative += counter[value]
+            if cumulative >= threshold:
+                return value
+        return max(counter)
+
+    return {
+        "count": total,
+        "min": min(counter),
+        "max": max(counter),
+        "mean": round(sum(value * count for value, count in counter.items()) / total, 2),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "histogram": {str(value): counter[value] for value in sorted(counter)},
+    }
+
+
+def profile_catalog(file_path, file_name, logger, record_tags=("PRODUCT", "ARTICLE"), output_format="csv"):
+    """
+    Rychlý profil katalogu (--stats): zapíše output/{file_name}_statistiky.json
+    a tabulku cest elementů a atributů {file_name}_cesty.csv. Vrací souhrn jako dict.
+    """
+    start_time = time.perf_counter()
+    profiler = CatalogProfiler(record_tags)
+    try:
+        profiler.parse_file(file_path)
+    except expat.ExpatError as exc:
+        raise ET.ParseError(f"Chyba v XML souboru: {exc}") from exc
+    elapsed = time.perf_counter() - start_time
+
+    summary = profiler.summary()
+    summary["file_size"] = os.path.getsize(file_path)
+    summary["seconds"] = round(elapsed, 3)
+
+    os.makedirs("output", exist_ok=True)
+    json_file = os.path.join("output", f"{file_name}_statistiky.json")
+    with open(json_file, "w", encoding="utf-8") as file:
+        json.dump(summary, file, ensure_ascii=False, indent=2)
+    logger.info(f"Uložen soubor: {json_file}")
+
+    writer = bme_parser.DynamicCsvBuffer(f"{file_name}_cesty", logger, priority_fields=_PATH_FIELDS, output_format=output_format)
+    try:
+        writer.writerows(profiler.path_rows())
+        writer.finalize()
+    except BaseException:
+        writer.cleanup()
+        raise
+
+    if profiler.truncated_paths:
+        logger.warning("Profil: překročen limit %s cest, %s výskytů nezapočteno.", MAX_PATHS, profiler.truncated_paths)
+    logger.info(
+        "Profil: záznamů %s (%s), ETIM tříd %s, jazyků %s, MIME kódů %s, cest %s, %.2f s",
+        summary["records_total"],
+        ", ".join(f"{tag}={count}" for tag, count in summary["records"].items()) or "-",
+        summary["etim_classes"]["distinct"],
+        summary["languages"]["distinct"],
+        summary["mime_codes"]["distinct"],
+        summary["distinct_paths"],
+        elapsed,
+    )
+    return summary
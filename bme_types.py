@@ -0,0 +1,142 @@
+import json
+import os
+import re
+
+# Odvození typů sloupců během streamování (--typed).
+# Typ sloupce se zužuje jen směrem k obecnějšímu: int -> decimal -> text, date -> datetime -> text.
+# Jakmile je sloupec text, hodnoty se už netestují.
+
+_INT = re.compile(r"[+-]?(?:0|[1-9]\d*)\Z")
+# Bez oddělovačů tisíců; desetinná čárka i tečka. Úvodní nuly (kódy, PSČ) = text.
+# Čárka následovaná právě třemi číslicemi (1,234) může být oddělovač tisíců - nejednoznačné, tedy text.
+_DECIMAL = re.compile(
+    r"[+-]?(?:0(?:[.,]\d+)?|[1-9]\d*(?:\.\d+|,(?!\d{3}(?!\d))\d+)?|[.,]\d+)(?:[eE][+-]?\d+)?\Z"
+)
+_DATE_ISO = re.compile(r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])\Z")
+_DATE_DOTTED = re.compile(r"(0?[1-9]|[12]\d|3[01])\.\s?(0?[1-9]|1[0-2])\.\s?(\d{4})\Z")
+_DATETIME_ISO = re.compile(
+    r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?\Z"
+)
+_BOOLEANS = {"true", "false"}
+_WIDENING = {
+    ("int", "decimal"): "decimal",
+    ("decimal", "int"): "decimal",
+    ("date", "datetime"): "datetime",
+    ("datetime", "date"): "datetime",
+}
+NUMERIC_TYPES = ("int", "decimal")
+
+
+def classify(value):
+    # Typ jedné hodnoty; None = prázdná hodnota (typ sloupce neovlivní).
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "decimal"
+    if not isinstance(value, str):
+        return "text"
+    text = value.strip()
+    if not text:
+        return None
+    first = text[0]
+    if first.isdigit() or first in "+-.,":
+        if _INT.match(text):
+            return "int"
+        if _DECIMAL.match(text):
+            return "decimal"
+        if _DATE_ISO.match(text) or _DATE_DOTTED.match(text):
+            return "date"
+        if _DATETIME_ISO.match(text):
+            return "datetime"
+        return "text"
+    if text.lower() in _BOOLEANS:
+        return "bool"
+    return "text"
+
+
+def normalize(value, column_type):
+    # Hodnota v kanonickém tvaru pro daný typ sloupce (desetinná tečka, ISO datum, true/false).
+    if not isinstance(value, str):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return value
+    text = value.strip()
+    if not text:
+        return value
+    if column_type in NUMERIC_TYPES:
+        # Čárka je desetinná jen jako jediný oddělovač; jinak se hodnota ponechá beze změny.
+        if "," in text and ("." in text or text.count(",") > 1):
+            return value
+        return text.lstrip("+").replace(",", ".")
+    if column_type in ("date", "datetime"):
+        match = _DATE_DOTTED.match(text)
+        if match:
+            day, month, year = match.groups()
+            return f"{year}-{int(month):02d}-{int(day):02d}"
+        return text
+    if column_type == "bool":
+        return text.lower()
+    return value
+
+
+class ColumnTypeTracker:
+
+    def __init__(self):
+        # ID sloupce -> typ a počet neprázdných hodnot
+        self.types = {}
+        self.counts = {}
+
+    def observe(self, field_id, value):
+        # Prázdný řetězec je ve výstupu prázdná buňka - nepočítá se mezi vyplněné hodnoty.
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return
+        self.counts[field_id] = self.counts.get(field_id, 0) + 1
+        current = self.types.get(field_id)
+        if current == "text":
+            return
+        kind = classify(value)
+        if kind is None or kind == current:
+            return
+        self.types[field_id] = kind if current is None else _WIDENING.get((current, kind), "text")
+
+    def column_type(self, field_id):
+        # Sloupec jen s prázdnými hodnotami se popisuje jako text.
+        return self.types.get(field_id) or "text"
+
+    def iter_normalized(self, rows, field_ids):
+        # field_ids: ID sloupce pro každou pozici výstupního řádku
+        normalizers = [
+            (position, self.column_type(field_id))
+            for position, field_id in enumerate(field_ids)
+            if self.column_type(field_id) != "text"
+        ]
+        if not normalizers:
+            yield from rows
+            return
+        for row in rows:
+            for position, column_type in normalizers:
+                value = row[position]
+                if value is not None:
+                    row[position] = normalize(value, column_type)
+            yield row
+
+    def save_schema(self, output_file, fieldnames, field_ids, row_count, logger):
+        schema_file = f"{os.path.splitext(output_file)[0]}_schema.json"
+        schema = {
+            "output": os.path.basename(output_file),
+            "rows": row_count,
+            "columns": [
+                {
+                    "name": name,
+                    "type": self.column_type(field_id),
+                    "nullable": self.counts.get(field_id, 0) < row_count,
+                }
+                for name, field_id in zip(fieldnames, field_ids)
+            ],
+        }
+        with open(schema_file, "w", encoding="utf-8") as file:
+            json.dump(schema, file, ensure_ascii=False, indent=2)
+        logger.info("Uložen soubor: %s", schema_file)
+        return schema_file
@@ -0,0 +1,180 @@
+import hashlib
+import math
+import os
+import uuid
+
+# local imports
+import bme_parser
+
+
+# Popisy kontrol validačního režimu (--validate).
+_ISSUE_DESCRIPTIONS = {
+    "DUPLICATE_SUPPLIER_PID": "Duplicitní SUPPLIER_PID (počet opakovaných výskytů)",
+    "MISSING_SUPPLIER_PID": "Produkt bez SUPPLIER_PID",
+    "MISSING_EAN": "Produkt bez EAN/GTIN",
+    "UNKNOWN_MIME_CODE": "Neznámý MIME_CODE",
+    "EMPTY_FEATURE_BLOCK": "Prázdný blok PRODUCT_FEATURES (bez FEATURE)",
+}
+
+_EAN_TYPES = {"ean", "gtin"}
+_FEATURE_BLOCK_TAGS = {"PRODUCT_FEATURES", "ARTICLE_FEATURES"}
+_DETAILS_TAGS = {"PRODUCT_DETAILS", "ARTICLE_DETAILS"}
+
+
+# Bloom filtr nad bytearray - pevná paměť bez ohledu na počet vložených klíčů.
+class BloomFilter:
+
+    def __init__(self, expected_items, false_positive_rate=0.001):
+        expected_items = max(1, int(expected_items))
+        self.bit_count = max(64, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / expected_items * math.log(2)))
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k pozic z jednoho 128bitového digestu.
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, key):
+        # Vrací True, pokud klíč v filtru možná už byl (kandidát na duplicitu).
+        present = True
+        bits = self._bits
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                present = False
+                bits[position >> 3] |= mask
+        return present
+
+
+# Detekce duplicit s omezenou pamětí:
+# 1) Bloom filtr označí kandidáty, všechny PID se zapisují do spoolu na disk,
+# 2) potvrzovací průchod spoolem ověří jen kandidáty (pravé duplicity + falešné poplachy).
+class DuplicateDetector:
+
+    def __init__(self, name, logger, expected_items):
+        self.name = name
+        self.logger = logger
+        self._bloom = BloomFilter(expected_items)
+        self._candidates = bme_parser.DiskKeyIndex(f"{name}_kandidati", logger)
+        os.makedirs("output", exist_ok=True)
+        self._spool_file = os.path.join("output", f".{name}.{uuid.uuid4().hex}.pids.txt")
+        self._spool = open(self._spool_file, "w", encoding="utf-8", newline="\n")
+
+    def add(self, key):
+        key = key.replace("\n", " ").replace("\r", " ")
+        if self._bloom.add(key.encode("utf-8")):
+            self._candidates.add(key)
+        self._spool.write(key)
+        self._spool.write("\n")
+
+    def iter_duplicates(self):
+        # Vrací každý opakovaný výskyt (druhý a další) potvrzené duplicity.
+        self._spool.close()
+        seen = bme_parser.DiskKeyIndex(f"{self.name}_potvrzeni", self.logger)
+        try:
+            with open(self._spool_file, "r", encoding="utf-8", newline="\n") as spool:
+                for line in spool:
+                    key = line[:-1]
+                    if key in self._candidates and not seen.add(key):
+                        yield key
+        finally:
+            seen.cleanup()
+
+    def cleanup(self):
+        if not self._spool.closed:
+            self._spool.close()
+        self._candidates.cleanup()
+        try:
+            if os.path.exists(self._spool_file):
+                os.remove(self._spool_file)
+        except OSError as exc:
+            self.logger.warning("Nepodařilo se odstranit dočasný soubor %s: %s", self._spool_file, exc)
+
+
+# Validace katalogu bez CSV výstupů - kontroluje přímo XML elementy bez parse_element().
+class CatalogValidator:
+
+    def __init__(self, file_name, logger, expected_items=1_000_000, sample_limit=10):
+        self.file_name = file_name
+        self.logger = logger
+        self.sample_limit = sample_limit
+        self.record_count = 0
+        self.issues = {issue: {"count": 0, "samples": []} for issue in _ISSUE_DESCRIPTIONS}
+        self._duplicates = DuplicateDetector(f"{file_name}_validace", logger, expected_items)
+
+    def _report(self, issue, sample):
+        entry = self.issues[issue]
+        entry["count"] += 1
+        if len(entry["samples"]) < self.sample_limit:
+            entry["samples"].append(sample)
+
+    def check_product(self, product):
+        self.record_count += 1
+        supplier_pid = None
+        has_ean = False
+
+        for child in product:
+            tag = bme_parser.clean_tag(child.tag)
+            if tag in ("SUPPLIER_PID", "SUPPLIER_AID"):
+                supplier_pid = (child.text or "").strip() or supplier_pid
+            elif tag in _DETAILS_TAGS:
+                has_ean = _has_ean(child)
+            elif tag in _FEATURE_BLOCK_TAGS:
+                if not any(bme_parser.clean_tag(feature.tag) == "FEATURE" for feature in child):
+                    self._report("EMPTY_FEATURE_BLOCK", supplier_pid or "N/A")
+
+        label = supplier_pid or f"#{self.record_count}"
+        if supplier_pid:
+            self._duplicates.add(supplier_pid)
+        else:
+            self._report("MISSING_SUPPLIER_PID", label)
+        if not has_ean:
+            self._report("MISSING_EAN", label)
+
+        for mime_code in _iter_mime_codes(product):
+            if mime_code not in bme_parser._VALID_MIME_CODES:
+                self._report("UNKNOWN_MIME_CODE", f"{label} ({mime_code})")
+
+    def finalize(self):
+        for supplier_pid in self._duplicates.iter_duplicates():
+            self._report("DUPLICATE_SUPPLIER_PID", supplier_pid)
+        self._duplicates.cleanup()
+
+        summary = []
+        for issue, entry in self.issues.items():
+            summary.append({
+                "ISSUE": issue,
+                "DESCRIPTION": _ISSUE_DESCRIPTIONS[issue],
+                "COUNT": entry["count"],
+                "SAMPLE_SUPPLIER_PIDS": ", ".join(entry["samples"]),
+            })
+            if entry["count"]:
+                self.logger.warning("%s: %s× (např. %s)", _ISSUE_DESCRIPTIONS[issue], entry["count"], ", ".join(entry["samples"]))
+
+        bme_parser.save_to_csv(f"{self.file_name}_validace", summary, self.logger)
+        total = sum(entry["count"] for entry in self.issues.values())
+        self.logger.info("Zkontrolováno záznamů: %s, nalezeno problémů: %s", self.record_count, total)
+        return total
+
+    def cleanup(self):
+        self._duplicates.cleanup()
+
+
+def _has_ean(details):
+    for child in details:
+        tag = bme_parser.clean_tag(child.tag)
+        if tag.lower() == "ean" or (tag == "INTERNATIONAL_PID" and (child.attrib.get("type") or "").lower() in _EAN_TYPES):
+            if child.text and child.text.strip():
+                return True
+    return False
+
+
+def _iter_mime_codes(product):
+    # MIME_CODE z MIME_INFO i z UDX.EDXF.MIME_INFO (stejné zdroje jako parse_BME_mime).
+    for element in product.iter():
+        tag = bme_parser.clean_tag(element.tag)
+        if tag in ("MIME_CODE", "UDX.EDXF.MIME_CODE") and element.text and element.text.strip():
+            yield element.text.strip()
@@ -0,0 +1,124 @@
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _init_worker():
+    # Ctrl+C v konzoli i SIGTERM poslaný celé skupině procesů (systemd, docker stop) řeší
+    # hlavní proces (dokončí rozběhnuté soubory a ukončí pool), worker by jinak přerušil rozpracovaný soubor.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _scan_xml_files(directory):
+    # Vrací {cesta: (velikost, mtime)}, nebo None, pokud složku nelze přečíst.
+    files = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(".xml") and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    files[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return None
+    return files
+
+
+def _ready_files(files, pending, processed, running, stable_checks):
+    """
+    Jeden průchod výpisem složky: vrátí soubory připravené ke zpracování a aktualizuje
+    pending (cesta -> (podpis, počet stabilních kontrol)) a processed (cesta -> podpis).
+    Záznamy souborů, které ze složky zmizely, se odeberou, aby stav démona nerostl bez omezení.
+    """
+    for state in (pending, processed):
+        for file_path in [path for path in state if path not in files]:
+            del state[file_path]
+
+    ready = []
+    for file_path, signature in files.items():
+        if processed.get(file_path) == signature or file_path in running:
+            continue
+
+        previous = pending.get(file_path)
+        stable_count = previous[1] + 1 if previous and previous[0] == signature else 0
+        if stable_count < stable_checks:
+            pending[file_path] = (signature, stable_count)
+            continue
+
+        pending.pop(file_path, None)
+        processed[file_path] = signature
+        ready.append(file_path)
+    return ready
+
+
+def watch_folder(
+    directory,
+    logger,
+    job,
+    job_kwargs=None,
+    workers=2,
+    poll_interval=5.0,
+    stable_checks=2,
+):
+    """
+    Sleduje složku a nové XML soubory předává do poolu workerů.
+
+    Soubor se považuje za dokončený, když se jeho velikost a mtime nezmění
+    během stable_checks po sobě jdoucích kontrol (dodavatel ho už dopsal).
+    Workery jsou procesy, které žijí po celou dobu běhu, takže importy
+    a nastavení parseru se nenačítají znovu pro každý soubor.
+
+    job(file_path, **job_kwargs) se volá ve workeru a vrací návratový kód.
+    Při SIGTERM/Ctrl+C (SystemExit/KeyboardInterrupt z setup_signal_handler)
+    se nové soubory přestanou přijímat, čekající úlohy se zruší a rozběhnuté se dokončí.
+    """
+    job_kwargs = job_kwargs or {}
+    workers = max(1, int(workers))
+    # Kandidáti: cesta -> (podpis, počet stabilních kontrol).
+    pending = {}
+    # Již zpracované podpisy, aby se stejný soubor nezpracoval dvakrát.
+    processed = {}
+    running = {}
+
+    logger.info("Sleduji složku %s (workerů: %s, interval: %.1f s)", os.path.abspath(directory), workers, poll_interval)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    def on_done(file_path, future):
+        running.pop(file_path, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error("Zpracování souboru %s selhalo: %s", file_path, error)
+        elif future.result() == 0:
+            logger.info("Soubor zpracován: %s", file_path)
+        else:
+            logger.warning("Soubor %s dokončen s návratovým kódem %s", file_path, future.result())
+
+    try:
+        while True:
+            files = _scan_xml_files(directory)
+            if files is None:
+                logger.warning("Složku %s se nepodařilo přečíst, zkusím to znovu.", directory)
+                ready = []
+            else:
+                ready = _ready_files(files, pending, processed, running, stable_checks)
+            for file_path in ready:
+                logger.info("Nový soubor ve frontě: %s", file_path)
+                future = executor.submit(job, file_path, **job_kwargs)
+                running[file_path] = future
+                future.add_done_callback(lambda done, path=file_path: on_done(path, done))
+
+            time.sleep(poll_interval)
+
+    except (KeyboardInterrupt, SystemExit):
+        logger.warning(
+            "Ukončuji sledování složky: čekám na %s rozběhnutých úloh, čekající úlohy se ruší.",
+            len(running),
+        )
+        raise
+
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("Pool workerů ukončen.")
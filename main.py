@@ -8,6 +8,13 @@ import argparse
 sys.dont_write_bytecode = True
 
 # local imports
+import bme_estimate
+import bme_latency
+import bme_logging
+import bme_metrics
+import bme_parser
+import bme_server
+import bme_watch
 import xml_utils
 
 
@@ -22,17 +29,15 @@ def setup_signal_handler():
 
 
 # Set up logging to both console and a file.
-def setup_logging(log_file: str, log_level: int = logging.INFO) -> logging.Logger:
+def setup_logging(log_file: str, log_level: int = logging.INFO, name: str = "bme_parser") -> logging.Logger:
     # Create a logger
-    logger = logging.getLogger("bme_parser")
+    logger = logging.getLogger(name)
     # Set the logging level
     logger.setLevel(log_level)  # Set the logging level for the logger
     logger.propagate = False
     
-    # Clear handlers
-    for handler in logger.handlers[:]:
-        handler.close()
-        logger.removeHandler(handler)
+    # Clear handlers (včetně běžícího QueueListeneru z předchozího volání)
+    bme_logging.shutdown_logging(logger, summary=False)
 
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
     # Create a file handler with UTF-8 encoding
@@ -41,9 +46,8 @@ def setup_logging(log_file: str, log_level: int = logging.INFO) -> logging.Logge
     # Create a stream handler to output to console
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Konzole i soubor se zapisují z vlákna QueueListeneru, ne z parsovací smyčky.
+    bme_logging.attach_queue_listener(logger, [file_handler, console_handler])
     return logger
 
 
@@ -70,6 +74,276 @@ def create_arg_parser() -> argparse.ArgumentParser:
         help="Zapne detailní logování."
     )
     
+    parser.add_argument(
+        "--mime-assets",
+        action="store_true",
+        help=(
+            "Místo _soubory.csv zapíše unikátní soubory (_soubory_assety.csv) "
+            "a vazby produkt -> soubor (_soubory_vazby.csv)."
+        )
+    )
+
+    parser.add_argument(
+        "--normalize-features",
+        action="store_true",
+        help=(
+            "Zapíše features jako celočíselnou tabulku faktů a malé číselníky "
+            "(systémy, třídy, názvy features, jednotky)."
+        )
+    )
+
+    parser.add_argument(
+        "--finalize-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Počet vláken pro souběžné dopsání výstupních CSV (výchozí: jedno na výstup, 1 = sekvenčně)."
+    )
+
+    parser.add_argument(
+        "--sort-by",
+        default=None,
+        metavar="SLOUPEC",
+        help="Seřadí řádky všech výstupů podle zadaného sloupce, např. SUPPLIER_PID (externí merge sort)."
+    )
+
+    parser.add_argument(
+        "--sort-run-size",
+        type=int,
+        default=100_000,
+        metavar="N",
+        help="Počet řádků v jednom setříděném běhu v paměti při --sort-by (výchozí: 100000)."
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=("csv", "xlsx"),
+        default="csv",
+        help="Formát výstupních souborů (výchozí: csv). XLSX se zapisuje streamově s konstantní pamětí."
+    )
+
+    parser.add_argument(
+        "--columns",
+        default=None,
+        metavar="JSON",
+        help=(
+            "JSON soubor s výběrem, pořadím a přejmenováním sloupců pro jednotlivé výstupy "
+            "(klíč = přípona výstupu, např. produkty). Nenamapované sloupce se nezapisují."
+        )
+    )
+
+    parser.add_argument(
+        "--product-layout",
+        choices=("wide", "long"),
+        default="wide",
+        help=(
+            "Formát detailů produktu: wide = jeden řádek na produkt (_produkty), "
+            "long = řádky SUPPLIER_PID/atribut/kvalifikátory/hodnota (_produkty_eav)."
+        )
+    )
+
+    parser.add_argument(
+        "--langs",
+        default=None,
+        metavar="JAZYKY",
+        help=(
+            "Čárkou oddělené jazyky, např. cs,de (ISO 639-1 i 639-2). Texty v ostatních jazycích "
+            "se zahodí už při parsování; texty bez jazyka zůstávají."
+        )
+    )
+
+    parser.add_argument(
+        "--split-langs",
+        action="store_true",
+        help="S --langs zapíše v jednom průchodu samostatnou sadu výstupů pro každý jazyk ({soubor}_{jazyk}_...)."
+    )
+
+    parser.add_argument(
+        "--etim-dict",
+        default=None,
+        metavar="SOUBOR",
+        help=(
+            "Export slovníku ETIM (CSV/TSV se sloupci kód, jazyk, popis). Features dostanou popisy "
+            "tříd, features, jednotek a hodnot. Slovník se jednou zaindexuje do SOUBOR.idx.sqlite."
+        )
+    )
+
+    parser.add_argument(
+        "--etim-lang",
+        default=None,
+        metavar="JAZYK",
+        help="Jazyk popisů ze slovníku ETIM (výchozí: první jazyk z --langs, jinak en)."
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Vždy zpracuje soubor znovu. Jinak se při stejném obsahu vstupu, stejném nastavení "
+            "a stejné verzi nástroje použijí výstupy z předchozího běhu."
+        )
+    )
+
+    parser.add_argument(
+        "--typed",
+        action="store_true",
+        help=(
+            "Odvodí typ každého sloupce (int, decimal, date, datetime, bool, text), sjednotí zápis čísel "
+            "(desetinná tečka) a dat (ISO) a ke každému výstupu zapíše _schema.json. XLSX dostane číselné buňky."
+        )
+    )
+
+    parser.add_argument(
+        "--reference-index",
+        action="store_true",
+        help=(
+            "Uloží graf referencí mezi produkty do _reference.sqlite a reference na produkty, "
+            "které v katalogu nejsou, zapíše do _reference_neplatne."
+        )
+    )
+
+    parser.add_argument(
+        "--group-paths",
+        action="store_true",
+        help=(
+            "Doplní k mapování produktů na skupiny (_produkty_skupiny) celou cestu skupiny "
+            "z CATALOG_GROUP_SYSTEM. Strom skupin se drží v dočasném indexu na disku."
+        )
+    )
+
+    parser.add_argument(
+        "--recover",
+        action="store_true",
+        help=(
+            "Poškozený PRODUCT/ARTICLE nepřeruší celý převod: záznam se přeskočí, zapíše se i s bajtovým "
+            "offsetem do _odmitnute.csv a čtení pokračuje dalším záznamem. Jen pro BMEcat."
+        )
+    )
+
+    parser.add_argument(
+        "--slow-product-ms",
+        type=float,
+        default=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+        metavar="MS",
+        help="Práh pro varování o pomalém produktu v milisekundách (výchozí: 20)."
+    )
+
+    parser.add_argument(
+        "--slow-products",
+        type=int,
+        default=0,
+        metavar="N",
+        help=(
+            "Uloží XML N nejpomalejších produktů do _pomale_produkty.xml "
+            "pro reprodukci a měření mimo běh (výchozí: 0 = vypnuto)."
+        )
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        metavar="CESTA",
+        help=(
+            "Průběžně zapisuje metriky běhu v textovém formátu Prometheus (node_exporter textfile collector). "
+            "Je-li CESTA složka, vznikne v ní bme_<soubor>.prom pro každý vstup."
+        )
+    )
+
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=bme_metrics.DEFAULT_INTERVAL,
+        metavar="SEKUNDY",
+        help="Jak často se soubor metrik během běhu přepisuje (výchozí: 15 s)."
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help=(
+            "Pouze zkontroluje katalog (duplicitní SUPPLIER_PID, chybějící EAN, neznámé MIME kódy, "
+            "prázdné bloky features) a zapíše souhrn do _validace.csv. Při nálezu vrací kód 2."
+        )
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "Pouze rychle profiluje katalog bez převodu (počty PRODUCT/ARTICLE, features na produkt, "
+            "ETIM třídy, jazyky, MIME kódy, četnost cest) do _statistiky.json a _cesty.csv."
+        )
+    )
+
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help=(
+            "Pouze odhadne náklady převodu ze vzorku produktů z rovnoměrně rozložených míst souboru "
+            "(počet záznamů, doba běhu, paměť, spool, velikost a sloupce výstupů s 95%% intervalem) do _odhad.json."
+        )
+    )
+
+    parser.add_argument(
+        "--estimate-windows",
+        type=int,
+        default=bme_estimate.DEFAULT_WINDOWS,
+        metavar="N",
+        help="Počet míst souboru, ze kterých se při --estimate čtou vzorky (výchozí: 16)."
+    )
+
+    parser.add_argument(
+        "--watch",
+        default=None,
+        metavar="SLOŽKA",
+        help=(
+            "Dlouho běžící režim: sleduje složku a každý nový (dokončený) XML soubor "
+            "zpracuje v připraveném poolu workerů. Ukončení Ctrl+C nebo SIGTERM."
+        )
+    )
+
+    parser.add_argument(
+        "--watch-workers",
+        type=int,
+        default=2,
+        metavar="N",
+        help="Počet souběžně zpracovávaných souborů v režimu --watch (výchozí: 2)."
+    )
+
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=5.0,
+        metavar="SEKUNDY",
+        help="Interval kontroly složky v režimu --watch (výchozí: 5 s)."
+    )
+
+    parser.add_argument(
+        "--serve",
+        default=None,
+        metavar="HOST:PORT",
+        help=(
+            "Spustí lokální HTTP server pro převody: POST /convert (tělo = BMEcat XML, volitelně gzip) "
+            "vrací ZIP výstupů nebo jednu sekci (?section=features). Např. 127.0.0.1:8080."
+        )
+    )
+
+    parser.add_argument(
+        "--serve-workers",
+        type=int,
+        default=2,
+        metavar="N",
+        help="Počet souběžných převodů v režimu --serve (výchozí: 2)."
+    )
+
+    parser.add_argument(
+        "--serve-queue",
+        type=int,
+        default=16,
+        metavar="N",
+        help="Kolik požadavků může čekat na volného workera, další dostanou 503 (výchozí: 16)."
+    )
+
     parser.add_argument(
         "-h",
         "--help",
@@ -79,16 +353,102 @@ def create_arg_parser() -> argparse.ArgumentParser:
 
     return parser
 
+def create_diff_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="BME-tool diff",
+        description=(
+            "Porovná dvě verze BMEcat(ETIM) katalogu podle SUPPLIER_PID "
+            "a zapíše přidané, odebrané a změněné produkty."
+        ),
+        add_help=False
+    )
+
+    parser.add_argument("old_xml", help="Cesta ke starší verzi katalogu.")
+    parser.add_argument("new_xml", help="Cesta k novější verzi katalogu.")
+
+    parser.add_argument(
+        "-debug",
+        action="store_true",
+        help="Zapne detailní logování."
+    )
+
+    parser.add_argument(
+        "--run-size",
+        type=int,
+        default=50_000,
+        metavar="N",
+        help="Počet produktů v jednom setříděném běhu v paměti (výchozí: 50000)."
+    )
+
+    parser.add_argument(
+        "-h",
+        "--help",
+        action="help",
+        help="Zobrazí tuto nápovědu a ukončí program."
+    )
+
+    return parser
+
+
 def pause_on_windows():
     if os.name == "nt":
         print("Stiskněte libovolnou klávesu pro ukončení . . .")
         os.system("pause >nul")
 
+# Příkaz diff: python main.py diff stary.xml novy.xml
+def main_diff(argv):
+    parser = create_diff_arg_parser()
+    args = parser.parse_args(argv)
+
+    for file_path in (args.old_xml, args.new_xml):
+        if not os.path.isfile(file_path):
+            logger = setup_logging(log_file="error_log.txt")
+            logger.error("Soubor '%s' neexistuje nebo není soubor.", file_path)
+            parser.print_help()
+            return 1
+
+    os.makedirs("output", exist_ok=True)
+    old_name = os.path.splitext(os.path.basename(args.old_xml))[0]
+    new_name = os.path.splitext(os.path.basename(args.new_xml))[0]
+    log_file = os.path.join("output", f"{old_name}_vs_{new_name}_log.txt")
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    logger = setup_logging(log_file=log_file, log_level=log_level)
+
+    try:
+        xml_utils.xml_diff(args.old_xml, args.new_xml, logger, run_size=args.run_size)
+        logger.info("Porovnání dokončeno.")
+        return 0
+
+    except KeyboardInterrupt:
+        logger.warning("Zpracování přerušeno uživatelem.")
+        return 130
+
+    except SystemExit as exc:
+        logger.warning("Aplikace ukončena signálem.")
+        return exc.code if isinstance(exc.code, int) else 1
+
+    except Exception:
+        logger.exception("Při porovnání katalogů došlo k neočekávané chybě.")
+        return 1
+
+    finally:
+        bme_logging.shutdown_logging(logger)
+
+
 # Main & arg check
 def main():
+    if sys.argv[1:2] == ["diff"]:
+        return main_diff(sys.argv[2:])
+
     parser = create_arg_parser()
     args = parser.parse_args()
 
+    if args.watch:
+        return main_watch(args)
+
+    if args.serve:
+        return main_serve(args)
+
     if not args.xml_file:
         parser.print_help()
         pause_on_windows()
@@ -110,6 +470,67 @@ def main():
         parser.print_help()
         return 1
 
+    try:
+        options = conversion_options_from_args(args)
+    except (OSError, ValueError) as exc:
+        logger = setup_logging(log_file="error_log.txt")
+        logger.error("Neplatné nastavení: %s", exc)
+        return 1
+
+    return run_file(
+        dropped_file,
+        debug_mode=debug_mode,
+        validate=args.validate,
+        stats=args.stats,
+        estimate=args.estimate,
+        estimate_windows=args.estimate_windows,
+        options=options,
+    )
+
+
+def conversion_options_from_args(args) -> dict:
+    # Mapování sloupců se načte a zkompiluje jednou při startu (v --watch režimu pro všechny soubory).
+    column_mappings = bme_parser.load_column_mappings(args.columns) if args.columns else None
+    langs = bme_parser.parse_langs(args.langs) if args.langs is not None else None
+    if args.split_langs and not langs:
+        raise ValueError("--split-langs vyžaduje seznam jazyků v --langs.")
+    if args.etim_dict and not os.path.isfile(args.etim_dict):
+        raise ValueError(f"Slovník ETIM '{args.etim_dict}' neexistuje nebo není soubor.")
+    return {
+        "mime_assets": args.mime_assets,
+        "normalize_features": args.normalize_features,
+        "finalize_workers": args.finalize_workers,
+        "sort_by": args.sort_by,
+        "sort_run_size": args.sort_run_size,
+        "output_format": args.format,
+        "column_mappings": column_mappings,
+        "product_layout": args.product_layout,
+        "langs": langs,
+        "split_langs": args.split_langs,
+        "etim_dict": args.etim_dict,
+        "etim_lang": args.etim_lang or (langs[0] if langs else "en"),
+        "cache": not args.no_cache,
+        "slow_product_ms": args.slow_product_ms,
+        "slow_products": args.slow_products,
+        "recover": args.recover,
+        "group_paths": args.group_paths,
+        "reference_index": args.reference_index,
+        "typed": args.typed,
+        "metrics_file": args.metrics_file,
+        "metrics_interval": args.metrics_interval,
+    }
+
+
+# Zpracuje jeden soubor s vlastním logem v output/. Používá i --watch režim.
+def run_file(
+    dropped_file,
+    debug_mode=False,
+    validate=False,
+    stats=False,
+    estimate=False,
+    estimate_windows=bme_estimate.DEFAULT_WINDOWS,
+    options=None,
+) -> int:
     # Ensure the output directory exists
     os.makedirs("output", exist_ok=True)
 
@@ -119,8 +540,33 @@ def main():
     logger = setup_logging(log_file=log_file, log_level=log_level)
 
     try:
+        if stats:
+            logger.info("Spouštím profil souboru: %s", dropped_file)
+            xml_utils.xml_stats(dropped_file, logger, output_format=(options or {}).get("output_format", "csv"))
+            logger.info("Profil dokončen.")
+            return 0
+
+        if estimate:
+            logger.info("Spouštím odhad nákladů převodu: %s", dropped_file)
+            summary = xml_utils.xml_estimate(
+                dropped_file,
+                logger,
+                windows=estimate_windows,
+                product_layout=(options or {}).get("product_layout", "wide"),
+            )
+            if summary is None:
+                return 1
+            logger.info("Odhad dokončen.")
+            return 0
+
+        if validate:
+            logger.info("Spouštím validaci souboru: %s", dropped_file)
+            issue_count = xml_utils.xml_validate(dropped_file, logger)
+            logger.info("Validace dokončena.")
+            return 2 if issue_count else 0
+
         logger.info("Spouštím zpracování souboru: %s", dropped_file)
-        xml_utils.xml_parse(dropped_file, logger)
+        xml_utils.xml_parse(dropped_file, logger, **(options or {}))
         logger.info("Zpracování dokončeno.")
         return 0
 
@@ -136,6 +582,91 @@ def main():
         logger.exception("Při zpracování XML došlo k neočekávané chybě.")
         return 1
 
+    finally:
+        bme_logging.shutdown_logging(logger)
+
+
+# Režim --watch: dlouho běžící proces, který zpracovává nové soubory ve složce.
+def main_watch(args):
+    if not os.path.isdir(args.watch):
+        logger = setup_logging(log_file="error_log.txt")
+        logger.error("Složka '%s' neexistuje nebo není složka.", args.watch)
+        return 1
+
+    os.makedirs("output", exist_ok=True)
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    logger = setup_logging(log_file=os.path.join("output", "watch_log.txt"), log_level=log_level, name="bme_watch")
+
+    try:
+        options = conversion_options_from_args(args)
+    except (OSError, ValueError) as exc:
+        logger.error("Neplatné nastavení: %s", exc)
+        bme_logging.shutdown_logging(logger)
+        return 1
+
+    try:
+        bme_watch.watch_folder(
+            args.watch,
+            logger,
+            run_file,
+            job_kwargs={
+                "debug_mode": args.debug,
+                "validate": args.validate,
+                "stats": args.stats,
+                "estimate": args.estimate,
+                "estimate_windows": args.estimate_windows,
+                "options": options,
+            },
+            workers=args.watch_workers,
+            poll_interval=args.watch_interval,
+        )
+        return 0
+
+    except (KeyboardInterrupt, SystemExit):
+        # watch_folder už frontu i workery korektně ukončil.
+        logger.info("Sledování složky ukončeno signálem.")
+        return 0
+
+    finally:
+        bme_logging.shutdown_logging(logger)
+
+
+# Režim --serve: lokální HTTP server pro převody na vyžádání.
+def main_serve(args):
+    os.makedirs("output", exist_ok=True)
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    logger = setup_logging(log_file=os.path.join("output", "server_log.txt"), log_level=log_level, name="bme_server")
+
+    host, _, port = args.serve.rpartition(":")
+    try:
+        options = conversion_options_from_args(args)
+        address = (host or "127.0.0.1", int(port))
+    except (OSError, ValueError) as exc:
+        logger.error("Neplatné nastavení: %s", exc)
+        bme_logging.shutdown_logging(logger)
+        return 1
+
+    try:
+        bme_server.serve(
+            address,
+            logger,
+            options=options,
+            workers=args.serve_workers,
+            queue_size=args.serve_queue,
+        )
+        return 0
+
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("HTTP server ukončen signálem.")
+        return 0
+
+    except OSError as exc:
+        logger.error("HTTP server nelze spustit na %s: %s", args.serve, exc)
+        return 1
+
+    finally:
+        bme_logging.shutdown_logging(logger)
+
 
 if __name__ == "__main__":
     setup_signal_handler()
@@ -0,0 +1,21 @@
+import logging
+import os
+import sys
+
+import pytest
+
+# Moduly nástroje leží v kořeni repozitáře (bez balíčku).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger("bme_test")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Nástroj zapisuje do ./output, testy proto běží v dočasné složce.
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    return tmp_path
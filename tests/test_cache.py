@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import bme_cache
+import xml_utils
+
+_BMECAT = """<?xml version="1.0" encoding="UTF-8"?>
+<BMECAT version="2005" xmlns="http://www.bmecat.org/bmecat/2005">
+<HEADER><CATALOG><LANGUAGE>ces</LANGUAGE><CATALOG_ID>C1</CATALOG_ID><CATALOG_VERSION>1</CATALOG_VERSION></CATALOG></HEADER>
+<T_NEW_CATALOG>
+<PRODUCT><SUPPLIER_PID>P1</SUPPLIER_PID></PRODUCT>
+<PRODUCT><SUPPLIER_PID>P2</SUPPLIER_PID></PRODUCT>
+</T_NEW_CATALOG>
+</BMECAT>
+
+"""
+_GENERIC = "<feed><item><id>1</id></item><item><id>2</id></item></feed>\n\n"
+
+
+def _make_run(workdir, file_name="katalog", content=b"<BMECAT/>"):
+    input_file = workdir / f"{file_name}.xml"
+    input_file.write_bytes(content)
+    (workdir / "output" / f"{file_name}_produkty.csv").write_text("SUPPLIER_PID\nP1\n", encoding="utf-8")
+    return str(input_file)
+
+
+def _store(input_file, file_name, options, logger):
+    output_file = os.path.join("output", f"{file_name}_produkty.csv")
+    bme_cache.store(input_file, file_name, options, bme_cache.file_digest(input_file), [output_file], logger)
+
+
+def test_cache_hit_for_same_input_and_options(workdir, logger):
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {"typed": False}, logger)
+    assert bme_cache.lookup(input_file, "katalog", {"typed": False}, logger)
+
+
+def test_cache_miss_on_changed_options(workdir, logger):
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {"typed": False}, logger)
+    assert not bme_cache.lookup(input_file, "katalog", {"typed": True}, logger)
+
+
+def test_cache_miss_on_changed_input(workdir, logger):
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {}, logger)
+    with open(input_file, "wb") as file:
+        file.write(b"<BMECAT version='2005'/>")
+    assert not bme_cache.lookup(input_file, "katalog", {}, logger)
+
+
+def test_cache_miss_on_missing_output(workdir, logger):
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {}, logger)
+    os.remove(workdir / "output" / "katalog_produkty.csv")
+    assert not bme_cache.lookup(input_file, "katalog", {}, logger)
+
+
+def test_invalidate_removes_manifest(workdir, logger):
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {}, logger)
+    bme_cache.invalidate("katalog")
+    assert not bme_cache.lookup(input_file, "katalog", {}, logger)
+
+
+def test_cache_miss_after_module_source_change(workdir, logger, monkeypatch):
+    # Kopie zdrojů nástroje, ve které se změní modul mimo hlavní pipeline.
+    source_dir = workdir / "src"
+    source_dir.mkdir()
+    for name in os.listdir(bme_cache._SOURCE_DIR):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(bme_cache._SOURCE_DIR, name), source_dir / name)
+    monkeypatch.setattr(bme_cache, "_SOURCE_DIR", str(source_dir))
+    monkeypatch.setattr(bme_cache, "_tool_version", None)
+
+    input_file = _make_run(workdir)
+    _store(input_file, "katalog", {}, logger)
+    assert bme_cache.lookup(input_file, "katalog", {}, logger)
+
+    for module in ("bme_types.py", "bme_etim.py"):
+        with open(source_dir / module, "a", encoding="utf-8") as file:
+            file.write("\n# změna\n")
+        monkeypatch.setattr(bme_cache, "_tool_version", None)
+        assert not bme_cache.lookup(input_file, "katalog", {}, logger)
+        _store(input_file, "katalog", {}, logger)
+        assert bme_cache.lookup(input_file, "katalog", {}, logger)
+
+
+@pytest.mark.parametrize(
+    "content, options",
+    [(_BMECAT, {}), (_BMECAT, {"recover": True}), (_GENERIC, {})],
+    ids=["bmecat", "recover", "generic"],
+)
+def test_input_hash_computed_while_parsing(workdir, logger, monkeypatch, content, options):
+    input_file = workdir / "katalog.xml"
+    input_file.write_text(content, encoding="utf-8")
+    expected = bme_cache.file_digest(str(input_file))
+
+    def fail(file_path):
+        raise AssertionError("vstup se nesmí kvůli hashi číst podruhé")
+
+    monkeypatch.setattr(bme_cache, "file_digest", fail)
+    xml_utils.xml_parse(str(input_file), logger, **options)
+
+    with open(bme_cache.manifest_path("katalog"), encoding="utf-8") as file:
+        manifest = json.load(file)
+    assert manifest["input"]["sha256"] == expected
+    assert [output["name"] for output in manifest["outputs"]]
+
+
+def test_manifest_lists_only_files_written_by_the_run(workdir, logger, monkeypatch):
+    # V --watch běží katalog.xml a katalog_2.xml souběžně; výstupy druhého nesmí
+    # skončit v manifestu prvního, i když se zapisovaly během jeho běhu.
+    input_file = workdir / "katalog.xml"
+    input_file.write_text(_BMECAT, encoding="utf-8")
+    sibling_output = workdir / "output" / "katalog_2_produkty.csv"
+    real_stream = xml_utils.stream_bmecat_to_csv
+
+    def stream_with_sibling(*args, **kwargs):
+        sibling_output.write_text("SUPPLIER_PID\n", encoding="utf-8")
+        output_files = real_stream(*args, **kwargs)
+        sibling_output.write_text("SUPPLIER_PID\nX1\n", encoding="utf-8")
+        return output_files
+
+    monkeypatch.setattr(xml_utils, "stream_bmecat_to_csv", stream_with_sibling)
+    xml_utils.xml_parse(str(input_file), logger)
+
+    with open(bme_cache.manifest_path("katalog"), encoding="utf-8") as file:
+        names = {output["name"] for output in json.load(file)["outputs"]}
+    assert "katalog_2_produkty.csv" not in names
+    assert {"katalog_hlavicka.csv", "katalog_produkty.csv"} <= names
+
+    # Dopsání souběžného výstupu cache prvního katalogu nezneplatní.
+    sibling_output.write_text("SUPPLIER_PID\nX1\nX2\n", encoding="utf-8")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("očekáván zásah cache")
+
+    monkeypatch.setattr(xml_utils, "stream_bmecat_to_csv", fail)
+    xml_utils.xml_parse(str(input_file), logger)
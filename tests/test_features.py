@@ -0,0 +1,22 @@
+import bme_parser
+
+
+def _row(**values):
+    return {"SUPPLIER_PID": "P1", "FNAME": "EF000001", "FVALUE": "1", **values}
+
+
+def test_normalize_row_keeps_system_without_group():
+    dimensions = bme_parser.FeatureDimensions()
+    row = dimensions.normalize_row(_row(REFERENCE_FEATURE_SYSTEM_NAME="ETIM-9.0"))
+    assert row["CLASS_ID"] == 1
+    assert dimensions.systems == {"ETIM-9.0": 1}
+    assert dimensions.classes == {(1, None): 1}
+
+
+def test_normalize_row_shares_class_ids():
+    dimensions = bme_parser.FeatureDimensions()
+    first = dimensions.normalize_row(_row(REFERENCE_FEATURE_SYSTEM_NAME="ETIM-9.0", REFERENCE_FEATURE_GROUP_ID="EC000001"))
+    second = dimensions.normalize_row(_row(REFERENCE_FEATURE_SYSTEM_NAME="ETIM-9.0", REFERENCE_FEATURE_GROUP_ID="EC000001"))
+    without_reference = dimensions.normalize_row(_row())
+    assert first["CLASS_ID"] == second["CLASS_ID"] == 1
+    assert without_reference["CLASS_ID"] is None
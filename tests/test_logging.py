@@ -0,0 +1,32 @@
+import logging
+import threading
+
+import bme_logging
+
+
+def test_listeners_are_released_between_jobs(tmp_path):
+    logger = logging.getLogger("bme_test_listeners")
+    logger.propagate = False
+    threads_before = threading.active_count()
+    for job in range(20):
+        handler = logging.FileHandler(tmp_path / f"job{job}.log", encoding="utf-8")
+        listener = bme_logging.attach_queue_listener(logger, [handler])
+        logger.warning("úloha %s", job)
+        bme_logging.shutdown_logging(logger)
+        assert not listener.running
+    assert not bme_logging._active_listeners
+    assert threading.active_count() == threads_before
+    assert (tmp_path / "job19.log").read_text(encoding="utf-8").strip() == "úloha 19"
+
+
+def test_log_limited_suppresses_repeats(tmp_path):
+    logger = logging.getLogger("bme_test_limited")
+    logger.propagate = False
+    handler = logging.FileHandler(tmp_path / "limited.log", encoding="utf-8")
+    bme_logging.attach_queue_listener(logger, [handler], rate_limit=3)
+    for index in range(10):
+        bme_logging.log_limited(logger, logging.WARNING, "klíč", "zpráva %s", index)
+    bme_logging.shutdown_logging(logger, summary=False)
+    lines = (tmp_path / "limited.log").read_text(encoding="utf-8").splitlines()
+    assert lines[:3] == ["zpráva 0", "zpráva 1", "zpráva 2"]
+    assert len(lines) == 4
@@ -0,0 +1,26 @@
+import threading
+import time
+
+import bme_metrics
+
+
+def _stage_seconds(path):
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.startswith("bme_stage_seconds_total"):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_metrics_are_flushed_during_stage_without_products(tmp_path, logger):
+    path = tmp_path / "bme.prom"
+    metrics = bme_metrics.RunMetrics(str(path), "katalog", logger, interval=1)
+    metrics.start_stage("finalize")
+    first = _stage_seconds(path)
+    deadline = time.monotonic() + 5
+    while _stage_seconds(path) == first and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _stage_seconds(path) > first
+
+    metrics.finish(True)
+    assert not any(thread.name == "bme-metrics-katalog" for thread in threading.enumerate())
+    assert "bme_last_run_success{file=\"katalog\"} 1" in path.read_text(encoding="utf-8")
@@ -0,0 +1,23 @@
+import bme_parser
+
+
+def _entry(pid, source="img/a.jpg", **values):
+    return {"SUPPLIER_PID": pid, "MIME_SOURCE": source, "MIME_CODE": "MD01", **values}
+
+
+def test_asset_id_is_shared_by_identical_files():
+    first_asset, first_link = bme_parser.split_mime_asset(_entry("P1"))
+    second_asset, second_link = bme_parser.split_mime_asset(_entry("P2"))
+    assert len(first_asset["ASSET_ID"]) == 32
+    assert first_asset == second_asset
+    assert first_link["ASSET_ID"] == second_link["ASSET_ID"]
+    assert (first_link["SUPPLIER_PID"], second_link["SUPPLIER_PID"]) == ("P1", "P2")
+
+
+def test_asset_id_differs_by_source_and_description():
+    ids = {
+        bme_parser.mime_asset_id(_entry("P1")),
+        bme_parser.mime_asset_id(_entry("P1", source="img/b.jpg")),
+        bme_parser.mime_asset_id(_entry("P1", **{"MIME_DESCR @lang:deu": "Bild"})),
+    }
+    assert len(ids) == 3
@@ -0,0 +1,89 @@
+import csv
+import os
+
+import pytest
+
+import xml_utils
+
+_CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<BMECAT version="2005" xmlns="http://www.bmecat.org/bmecat/2005">
+<HEADER><CATALOG><LANGUAGE>ces</LANGUAGE><CATALOG_ID>C1</CATALOG_ID><CATALOG_VERSION>1</CATALOG_VERSION></CATALOG></HEADER>
+<T_NEW_CATALOG>
+<PRODUCT><SUPPLIER_PID>P1</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Šroub</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>
+<PRODUCT><SUPPLIER_PID>P2</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Matice & podložka</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>
+<PRODUCT><SUPPLIER_PID>P3</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Bez konce</DESCRIPTION_SHORT></PRODUCT_DETAILS>
+<PRODUCT><SUPPLIER_PID>P4</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Hřebík</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>
+</T_NEW_CATALOG>
+</BMECAT>
+"""
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8", newline="") as handle:
+        return list(csv.DictReader(handle))
+
+
+def test_recover_skips_malformed_records(workdir, logger):
+    (workdir / "katalog.xml").write_text(_CATALOG, encoding="utf-8")
+    xml_utils.stream_bmecat_to_csv("katalog.xml", "katalog", logger, recover=True)
+
+    products = _read_csv(os.path.join("output", "katalog_produkty.csv"))
+    assert [row["SUPPLIER_PID"] for row in products] == ["P1", "P4"]
+
+    rejects = _read_csv(os.path.join("output", "katalog_odmitnute.csv"))
+    assert [row["TAG"] for row in rejects] == ["PRODUCT", "PRODUCT"]
+    data = _CATALOG.encode("utf-8")
+    for row, pid in zip(rejects, ("P2", "P3")):
+        offset = int(row["OFFSET"])
+        assert data[offset:offset + int(row["LENGTH"])].decode("utf-8") == row["FRAGMENT"]
+        assert f"<SUPPLIER_PID>{pid}</SUPPLIER_PID>" in row["FRAGMENT"]
+
+
+def test_recover_without_errors_writes_no_rejects(workdir, logger):
+    catalog = _CATALOG.replace(" & podložka", "").replace(
+        "Bez konce</DESCRIPTION_SHORT></PRODUCT_DETAILS>",
+        "Bez konce</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>",
+    )
+    (workdir / "katalog.xml").write_text(catalog, encoding="utf-8")
+    xml_utils.stream_bmecat_to_csv("katalog.xml", "katalog", logger, recover=True)
+
+    products = _read_csv(os.path.join("output", "katalog_produkty.csv"))
+    assert [row["SUPPLIER_PID"] for row in products] == ["P1", "P2", "P3", "P4"]
+    assert not os.path.exists(os.path.join("output", "katalog_odmitnute.csv"))
+
+
+def test_recover_requires_file_on_disk(workdir, logger):
+    with open(workdir / "katalog.xml", "w", encoding="utf-8") as handle:
+        handle.write(_CATALOG)
+    with open(workdir / "katalog.xml", "rb") as source, pytest.raises(ValueError):
+        xml_utils.stream_bmecat_to_csv("katalog.xml", "katalog", logger, recover=True, source=source)
+
+
+def test_recover_ignores_markup_in_comments_and_cdata(workdir, logger):
+    catalog = _CATALOG.replace(" & podložka", "").replace(
+        "Bez konce</DESCRIPTION_SHORT></PRODUCT_DETAILS>",
+        "Bez konce</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>",
+    )
+    catalog = catalog.replace(
+        "<T_NEW_CATALOG>",
+        "<T_NEW_CATALOG>\n<!-- <PRODUCT><SUPPLIER_PID>X</SUPPLIER_PID></PRODUCT> -->\n<?tool <ARTICLE/>?>",
+    ).replace(
+        "<DESCRIPTION_SHORT>Šroub</DESCRIPTION_SHORT>",
+        "<DESCRIPTION_SHORT>Šroub</DESCRIPTION_SHORT>"
+        "<DESCRIPTION_LONG><![CDATA[<b>Pozor</b> <PRODUCT > </PRODUCT>]]></DESCRIPTION_LONG>",
+    )
+    (workdir / "katalog.xml").write_text(catalog, encoding="utf-8")
+
+    outputs = {}
+    for recover in (False, True):
+        xml_utils.stream_bmecat_to_csv("katalog.xml", "katalog", logger, recover=recover)
+        outputs[recover] = {
+            name: (workdir / "output" / name).read_bytes()
+            for name in sorted(os.listdir(workdir / "output"))
+            if name.endswith(".csv")
+        }
+    assert "katalog_odmitnute.csv" not in outputs[True]
+    assert outputs[True] == outputs[False]
+    products = _read_csv(os.path.join("output", "katalog_produkty.csv"))
+    assert [row["SUPPLIER_PID"] for row in products] == ["P1", "P2", "P3", "P4"]
+    assert "<PRODUCT > </PRODUCT>" in products[0]["DESCRIPTION_LONG"]
@@ -0,0 +1,141 @@
+import csv
+import gzip
+import http.client
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+import bme_server
+
+
+def test_upload_name_is_ascii_for_headers():
+    for value in ("目录", "katalog 2024/ü", "../etc", ""):
+        name = bme_server.upload_name(value)
+        name.encode("latin-1")
+        assert all(char.isascii() and (char.isalnum() or char in "._-") for char in name)
+    assert bme_server.upload_name("katalog-2024.v1") == "katalog-2024.v1"
+    assert bme_server.upload_name("") == "upload"
+
+
+_CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<BMECAT version="2005" xmlns="http://www.bmecat.org/bmecat/2005">
+<HEADER><CATALOG><LANGUAGE>ces</LANGUAGE><CATALOG_ID>C1</CATALOG_ID><CATALOG_VERSION>1</CATALOG_VERSION></CATALOG></HEADER>
+<T_NEW_CATALOG>
+<PRODUCT><SUPPLIER_PID>P1</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Šroub</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>
+<PRODUCT><SUPPLIER_PID>P2</SUPPLIER_PID><PRODUCT_DETAILS><DESCRIPTION_SHORT>Matice</DESCRIPTION_SHORT></PRODUCT_DETAILS></PRODUCT>
+</T_NEW_CATALOG>
+</BMECAT>
+""".encode("utf-8")
+
+
+@pytest.fixture
+def server(workdir, logger):
+    server = bme_server.ConversionServer(("127.0.0.1", 0), logger, workers=1, queue_size=0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def _zip_members(body):
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def _products(data):
+    return [row["SUPPLIER_PID"] for row in csv.DictReader(io.StringIO(data.decode("utf-8")))]
+
+
+def _job_files():
+    return [name for name in os.listdir("output") if name.startswith("katalog-")]
+
+
+def test_health(server):
+    status, _, body = _request(server, "GET", "/health")
+    assert status == 200
+    assert json.loads(body) == {"workers": 1, "running": 0, "waiting": 0}
+
+
+@pytest.mark.parametrize("encoding", ["plain", "gzip", "chunked"])
+def test_convert_returns_zip(server, encoding):
+    headers = {"Content-Type": "application/xml"}
+    body = _CATALOG
+    if encoding == "gzip":
+        body = gzip.compress(_CATALOG)
+        headers["Content-Encoding"] = "gzip"
+    elif encoding == "chunked":
+        # Iterovatelné tělo bez Content-Length posílá http.client jako Transfer-Encoding: chunked.
+        body = iter([_CATALOG[:100], _CATALOG[100:]])
+
+    status, response_headers, response = _request(server, "POST", "/convert?name=katalog", body, headers)
+
+    assert status == 200
+    assert response_headers["Content-Type"] == "application/zip"
+    assert response_headers["Content-Disposition"] == 'attachment; filename="katalog.zip"'
+    members = _zip_members(response)
+    assert {"katalog_hlavicka.csv", "katalog_produkty.csv"} <= set(members)
+    assert _products(members["katalog_produkty.csv"]) == ["P1", "P2"]
+    assert not _job_files()
+
+
+def test_convert_section(server):
+    status, headers, body = _request(server, "POST", "/convert?name=katalog&section=produkty", _CATALOG)
+    assert status == 200
+    assert headers["Content-Type"] == "text/csv; charset=utf-8"
+    assert _products(body) == ["P1", "P2"]
+
+    status, _, body = _request(server, "POST", "/convert?name=katalog&section=neexistuje", _CATALOG)
+    assert status == 404
+    assert {"hlavicka", "produkty"} <= set(json.loads(body)["sections"])
+    assert not _job_files()
+
+
+def test_convert_rejects_non_bmecat(server):
+    status, _, body = _request(server, "POST", "/convert?name=katalog", b"<feed><item>1</item></feed>")
+    assert status == 422
+    assert "error" in json.loads(body)
+    assert not _job_files()
+
+
+def test_convert_returns_503_when_queue_is_full(server):
+    # První převod drží jediný worker, dokud nedorazí zbytek chunked těla.
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    try:
+        connection.putrequest("POST", "/convert?name=katalog")
+        connection.putheader("Transfer-Encoding", "chunked")
+        connection.endheaders()
+        connection.send(b"%x\r\n%s\r\n" % (100, _CATALOG[:100]))
+        deadline = time.monotonic() + 10
+        while server.running == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert server.running == 1
+
+        status, _, body = _request(server, "POST", "/convert?name=katalog", _CATALOG)
+        assert status == 503
+        assert "error" in json.loads(body)
+
+        rest = _CATALOG[100:]
+        connection.send(b"%x\r\n%s\r\n0\r\n\r\n" % (len(rest), rest))
+        response = connection.getresponse()
+        assert response.status == 200
+        assert "katalog_produkty.csv" in _zip_members(response.read())
+    finally:
+        connection.close()
+    assert server.running == 0
@@ -0,0 +1,69 @@
+import csv
+import glob
+import os
+import random
+from operator import itemgetter
+
+import bme_diff
+import bme_parser
+
+
+def _sorter(logger, run_size=7, max_fan_in=3):
+    sorter = bme_parser.ExternalSorter("test", logger, key=itemgetter(0), run_size=run_size)
+    sorter.max_fan_in = max_fan_in
+    return sorter
+
+
+def test_external_sort_across_spill_runs(workdir, logger):
+    records = [[f"P{random.Random(index).randrange(50):02d}", index] for index in range(200)]
+    sorter = _sorter(logger)
+    for record in records:
+        sorter.add(record)
+    try:
+        result = list(sorter.iter_sorted())
+        # Stabilní řazení: shodné klíče v pořadí přidání i přes více průchodů slévání.
+        assert result == sorted(records, key=itemgetter(0))
+        assert len(sorter._run_files) <= sorter.max_fan_in
+    finally:
+        sorter.cleanup()
+    assert not glob.glob(os.path.join("output", ".test.*"))
+
+
+def test_external_sort_in_memory_without_runs(workdir, logger):
+    sorter = _sorter(logger, run_size=100)
+    for key in ("c", "a", "b"):
+        sorter.add([key])
+    assert list(sorter.iter_sorted()) == [["a"], ["b"], ["c"]]
+    assert not os.listdir("output")
+
+
+def test_flatten_bundle_ignores_order_of_repeated_values():
+    first = {"keywords": [{"keyword_tag": "KEYWORD", "keyword_value": value} for value in ("b", "a")]}
+    second = {"keywords": [{"keyword_tag": "KEYWORD", "keyword_value": value} for value in ("a", "b")]}
+    assert bme_diff.flatten_bundle(first) == bme_diff.flatten_bundle(second)
+    assert bme_diff.flatten_bundle(first)["keywords"] == {"KEYWORD": "a | b"}
+
+
+def _flat(pid, description):
+    return [pid, {"product": {"DESCRIPTION_SHORT": description}}]
+
+
+def test_diff_sorted_catalogs_across_spill_runs(workdir, logger):
+    old_sorter = _sorter(logger, run_size=2)
+    new_sorter = _sorter(logger, run_size=2)
+    for index in reversed(range(20)):
+        old_sorter.add(_flat(f"P{index:02d}", "stary" if index == 5 else "popis"))
+    for index in range(1, 21):
+        new_sorter.add(_flat(f"P{index:02d}", "popis"))
+    try:
+        counts = bme_diff.diff_sorted_catalogs(old_sorter, new_sorter, "diff", logger)
+    finally:
+        old_sorter.cleanup()
+        new_sorter.cleanup()
+
+    assert counts == {"added": 1, "removed": 1, "changed": 1, "unchanged": 18}
+    with open(os.path.join("output", "diff.csv"), encoding="utf-8", newline="") as handle:
+        rows = list(csv.reader(handle))[1:]
+    assert ["P00", "removed", "", "", "", ""] in rows
+    assert ["P20", "added", "", "", "", ""] in rows
+    assert ["P05", "changed", "product", "DESCRIPTION_SHORT", "stary", "popis"] in rows
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import bme_types
+
+
+@pytest.mark.parametrize(
+    "value, kind",
+    [
+        ("42", "int"),
+        ("-7", "int"),
+        ("007", "text"),
+        ("1.5", "decimal"),
+        ("1,5", "decimal"),
+        ("0,125", "decimal"),
+        ("1,2345", "decimal"),
+        ("1e3", "decimal"),
+        ("1,234", "text"),
+        ("1.234,5", "text"),
+        ("1,234.5", "text"),
+        ("1,2,3", "text"),
+        ("2024-02-29", "date"),
+        ("1. 2. 2024", "date"),
+        ("2024-02-29T10:00:00Z", "datetime"),
+        ("TRUE", "bool"),
+        ("", None),
+        ("  ", None),
+    ],
+)
+def test_classify(value, kind):
+    assert bme_types.classify(value) == kind
+
+
+def test_normalize_numeric_and_dates():
+    assert bme_types.normalize("+1,5", "decimal") == "1.5"
+    assert bme_types.normalize("1.234,5", "decimal") == "1.234,5"
+    assert bme_types.normalize("1. 2. 2024", "date") == "2024-02-01"
+    assert bme_types.normalize("True", "bool") == "true"
+
+
+def test_column_widening():
+    tracker = bme_types.ColumnTypeTracker()
+    for value in ("1", "2,5"):
+        tracker.observe(0, value)
+    for value in ("1", "1,234"):
+        tracker.observe(1, value)
+    for value in ("2024-01-01", "2024-01-01 10:00"):
+        tracker.observe(2, value)
+    assert tracker.column_type(0) == "decimal"
+    assert tracker.column_type(1) == "text"
+    assert tracker.column_type(2) == "datetime"
+    assert tracker.column_type(3) == "text"
+
+
+def test_empty_strings_make_column_nullable(tmp_path, logger):
+    tracker = bme_types.ColumnTypeTracker()
+    for value in ("1", "", "  ", "2"):
+        tracker.observe(0, value)
+        tracker.observe(1, "x")
+    tracker.save_schema(str(tmp_path / "out.csv"), ["A", "B"], [0, 1], 4, logger)
+    schema = (tmp_path / "out_schema.json").read_text(encoding="utf-8")
+    columns = {column["name"]: column for column in json.loads(schema)["columns"]}
+    assert columns["A"] == {"name": "A", "type": "int", "nullable": True}
+    assert columns["B"]["nullable"] is False
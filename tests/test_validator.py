@@ -0,0 +1,35 @@
+import bme_validator
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = bme_validator.BloomFilter(5_000)
+    keys = [f"P{index:06d}".encode("utf-8") for index in range(5_000)]
+    for key in keys:
+        bloom.add(key)
+    # Každý vložený klíč musí být hlášen jako (možná) přítomný.
+    assert all(bloom.add(key) for key in keys)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = bme_validator.BloomFilter(10_000, false_positive_rate=0.01)
+    for index in range(10_000):
+        bloom.add(f"P{index}".encode("utf-8"))
+    bits = bytes(bloom._bits)
+
+    def present(key):
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in bloom._positions(key))
+
+    false_positives = sum(present(f"X{index}".encode("utf-8")) for index in range(10_000))
+    assert false_positives < 300
+
+
+def test_duplicate_detector_reports_every_repeat(workdir, logger):
+    # Malý filtr zaručí falešné poplachy - potvrzovací průchod je musí odfiltrovat.
+    detector = bme_validator.DuplicateDetector("test", logger, expected_items=10)
+    keys = [f"P{index}" for index in range(500)] + ["P7", "P7", "P42", "řádek\nzalomený"]
+    try:
+        for key in keys:
+            detector.add(key)
+        assert sorted(detector.iter_duplicates()) == ["P42", "P7", "P7"]
+    finally:
+        detector.cleanup()
@@ -0,0 +1,25 @@
+import bme_watch
+
+
+def test_file_is_ready_after_stable_checks_and_only_once():
+    pending, processed, running = {}, {}, {}
+    files = {"/in/a.xml": (10, 1)}
+    assert bme_watch._ready_files(files, pending, processed, running, 2) == []
+    assert bme_watch._ready_files(files, pending, processed, running, 2) == []
+    assert bme_watch._ready_files(files, pending, processed, running, 2) == ["/in/a.xml"]
+    assert bme_watch._ready_files(files, pending, processed, running, 2) == []
+
+
+def test_growing_file_waits():
+    pending, processed, running = {}, {}, {}
+    for size in range(5):
+        assert bme_watch._ready_files({"/in/a.xml": (size, size)}, pending, processed, running, 1) == []
+
+
+def test_removed_files_are_pruned():
+    pending, processed, running = {}, {}, {}
+    for _ in range(3):
+        bme_watch._ready_files({"/in/a.xml": (1, 1), "/in/b.xml": (2, 2)}, pending, processed, running, 1)
+    bme_watch._ready_files({"/in/c.xml": (3, 3)}, pending, processed, running, 1)
+    assert set(processed) == set()
+    assert set(pending) == {"/in/c.xml"}
@@ -0,0 +1,96 @@
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+import xlsx_writer
+
+_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def _column_index(reference):
+    letters = re.match(r"[A-Z]+", reference).group()
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _read_xlsx(path):
+    # Načte listy zpět jako {název listu: [řádky]}; hodnoty buněk jako text.
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        names = set(archive.namelist())
+        assert {"[Content_Types].xml", "_rels/.rels", "xl/workbook.xml", "xl/styles.xml"} <= names
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        sheets = {}
+        for index, sheet in enumerate(workbook.iterfind("m:sheets/m:sheet", _NS), start=1):
+            root = ET.fromstring(archive.read(f"xl/worksheets/sheet{index}.xml"))
+            rows = []
+            for row in root.iterfind("m:sheetData/m:row", _NS):
+                values = {}
+                for cell in row.iterfind("m:c", _NS):
+                    text = cell.find("m:is/m:t", _NS) if cell.get("t") == "inlineStr" else cell.find("m:v", _NS)
+                    values[_column_index(cell.get("r"))] = text.text or ""
+                rows.append([values.get(position) for position in range(max(values, default=-1) + 1)])
+            sheets[sheet.get("name")] = rows
+        return sheets
+
+
+def test_xlsx_round_trip(tmp_path):
+    path = tmp_path / "out.xlsx"
+    rows = [
+        ["P1", "Šroub <M6> & matice", None, "  mezery  "],
+        ["P2", "řídicí\x01znak", "x", None],
+    ]
+    with xlsx_writer.XlsxStreamWriter(str(path), ["SUPPLIER_PID", "POPIS", "X", "Y"]) as writer:
+        for row in rows:
+            writer.writerow(row)
+
+    sheets = _read_xlsx(str(path))
+    assert sheets == {
+        "Data": [
+            ["SUPPLIER_PID", "POPIS", "X", "Y"],
+            ["P1", "Šroub <M6> & matice", None, "  mezery  "],
+            ["P2", "řídicíznak", "x"],
+        ]
+    }
+
+
+def test_xlsx_typed_cells(tmp_path):
+    path = tmp_path / "typed.xlsx"
+    with xlsx_writer.XlsxStreamWriter(
+        str(path), ["EAN", "CENA", "SKLADEM", "KOD"], column_types=["int", "decimal", "bool", "text"]
+    ) as writer:
+        writer.writerow(["4000000000001", "12.5", "true", "007"])
+        writer.writerow(["12345678901234567890", "1.5", "false", "A"])
+
+    with zipfile.ZipFile(path) as archive:
+        sheet = ET.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+    cells = {cell.get("r"): cell for cell in sheet.iter(f"{{{_NS['m']}}}c")}
+    assert cells["A2"].get("t") is None and cells["A2"].get("s") == "2"
+    assert cells["B2"].get("t") is None
+    assert cells["C2"].get("t") == "b"
+    assert cells["D2"].get("t") == "inlineStr"
+    # Číslo delší než 15 číslic by Excel zaokrouhlil - zůstává textem.
+    assert cells["A3"].get("t") == "inlineStr"
+    assert _read_xlsx(str(path))["Data"][1] == ["4000000000001", "12.5", "1", "007"]
+
+
+def test_xlsx_rolls_over_to_next_sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlsx_writer, "MAX_ROWS", 3)
+    path = tmp_path / "sheets.xlsx"
+    with xlsx_writer.XlsxStreamWriter(str(path), ["A"]) as writer:
+        for index in range(5):
+            writer.writerow([str(index)])
+
+    sheets = _read_xlsx(str(path))
+    assert list(sheets) == ["Data", "Data 2", "Data 3"]
+    assert [row for rows in sheets.values() for row in rows[1:]] == [["0"], ["1"], ["2"], ["3"], ["4"]]
+    assert writer.row_count == 5
+
+
+def test_xlsx_empty_output_has_header(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    with xlsx_writer.XlsxStreamWriter(str(path), ["A", "B"]):
+        pass
+    assert _read_xlsx(str(path)) == {"Data": [["A", "B"]]}
@@ -0,0 +1,233 @@
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Limity formátu XLSX (Excel 2007+).
+MAX_ROWS = 1_048_576
+MAX_COLUMNS = 16_384
+MAX_CELL_CHARS = 32_767
+# Excel drží čísla s přesností 15 platných číslic, delší hodnoty zůstávají textem.
+MAX_EXACT_DIGITS = 15
+
+# Znaky, které XML 1.0 nepovoluje (řídicí znaky kromě tabulátoru a konců řádků).
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="1" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def column_letter(index):
+    # 0 -> A, 25 -> Z, 26 -> AA ...
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell_text(value):
+    text = value if isinstance(value, str) else str(value)
+    text = _ILLEGAL_XML_CHARS.sub("", text)
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS]
+    return escape(text)
+
+
+def _typed_cell(reference, value, column_type):
+    text = value if isinstance(value, str) else str(value)
+    if column_type == "int" and len(text.lstrip("-")) <= MAX_EXACT_DIGITS:
+        # Formát "0", aby se dlouhá čísla (EAN) nezobrazovala v exponentu.
+        return f'<c r="{reference}" s="2"><v>{text}</v></c>'
+    if column_type == "decimal" and len(text) <= MAX_EXACT_DIGITS + 2:
+        return f'<c r="{reference}"><v>{text}</v></c>'
+    if column_type == "bool":
+        return f'<c r="{reference}" t="b"><v>{1 if text == "true" else 0}</v></c>'
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{_cell_text(value)}</t></is></c>'
+
+
+# Streamový zápis XLSX přes zipfile: každý list se zapisuje po řádcích přímo do ZIPu,
+# v paměti je vždy jen aktuální řádek. Texty jsou inline (bez sdílené tabulky řetězců),
+# takže paměť nezávisí na počtu řádků. Po dosažení limitu řádků se založí další list.
+class XlsxStreamWriter:
+
+    def __init__(self, path, header, sheet_prefix="Data", logger=None, column_types=None):
+        """
+        column_types: volitelné typy sloupců (bme_types) - int/decimal se zapisují jako čísla,
+        bool jako logická hodnota, ostatní jako text.
+        """
+        self.path = path
+        self.header = list(header)
+        self.sheet_prefix = sheet_prefix
+        self.logger = logger
+        self.sheet_count = 0
+        self.row_count = 0
+
+        if len(self.header) > MAX_COLUMNS:
+            if logger is not None:
+                logger.warning(
+                    "XLSX %s: %s sloupců přesahuje limit %s, nadbytečné sloupce se vynechají.",
+                    path,
+                    len(self.header),
+                    MAX_COLUMNS,
+                )
+            self.header = self.header[:MAX_COLUMNS]
+        self._width = len(self.header)
+        self._letters = [column_letter(index) for index in range(self._width)]
+        self._column_types = list(column_types[:self._width]) if column_types else None
+
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self._sheet = None
+        self._sheet_rows = 0
+
+    def _open_sheet(self):
+        self._close_sheet()
+        self.sheet_count += 1
+        self._sheet = self._zip.open(f"xl/worksheets/sheet{self.sheet_count}.xml", "w", force_zip64=True)
+        self._sheet.write(_SHEET_HEAD.encode("utf-8"))
+        self._sheet_rows = 0
+        self._write_row(self.header, style=' s="1"', typed=False)
+
+    def _close_sheet(self):
+        if self._sheet is not None:
+            self._sheet.write(_SHEET_TAIL.encode("utf-8"))
+            self._sheet.close()
+            self._sheet = None
+
+    def _write_row(self, values, style="", typed=True):
+        self._sheet_rows += 1
+        row_number = self._sheet_rows
+        letters = self._letters
+        if typed and self._column_types is not None:
+            cells = [
+                _typed_cell(f"{letters[index]}{row_number}", value, self._column_types[index])
+                for index, value in enumerate(values[:self._width])
+                if value is not None and value != ""
+            ]
+        else:
+            cells = [
+                f'<c r="{letters[index]}{row_number}" t="inlineStr"{style}><is><t xml:space="preserve">{_cell_text(value)}</t></is></c>'
+                for index, value in enumerate(values[:self._width])
+                if value is not None and value != ""
+            ]
+        self._sheet.write(f'<row r="{row_number}">{"".join(cells)}</row>'.encode("utf-8"))
+
+    def writerow(self, values):
+        if self._sheet is None or self._sheet_rows >= MAX_ROWS:
+            self._open_sheet()
+        self._write_row(values)
+        self.row_count += 1
+
+    def close(self):
+        if self._zip is None:
+            return
+        if self._sheet is None and not self.sheet_count:
+            # Prázdný výstup - list jen s hlavičkou.
+            self._open_sheet()
+        self._close_sheet()
+
+        sheet_names = [
+            self.sheet_prefix if index == 1 else f"{self.sheet_prefix} {index}"
+            for index in range(1, self.sheet_count + 1)
+        ]
+        content_types = _CONTENT_TYPES_HEAD + "".join(
+            f'<Override PartName="/xl/worksheets/sheet{index}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for index in range(1, self.sheet_count + 1)
+        ) + "</Types>"
+        workbook = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{escape(name)}" sheetId="{index}" r:id="rId{index}"/>'
+                for index, name in enumerate(sheet_names, start=1)
+            )
+            + "</sheets></workbook>"
+        )
+        workbook_rels = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{index}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{index}.xml"/>'
+                for index in range(1, self.sheet_count + 1)
+            )
+            + f'<Relationship Id="rId{self.sheet_count + 1}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>'
+            '</Relationships>'
+        )
+
+        self._zip.writestr("[Content_Types].xml", content_types)
+        self._zip.writestr("_rels/.rels", _ROOT_RELS)
+        self._zip.writestr("xl/workbook.xml", workbook)
+        self._zip.writestr("xl/_rels/workbook.xml.rels", workbook_rels)
+        self._zip.writestr("xl/styles.xml", _STYLES)
+        self._zip.close()
+        self._zip = None
+
+    def abort(self):
+        if self._zip is None:
+            return
+        try:
+            if self._sheet is not None:
+                self._sheet.close()
+                self._sheet = None
+        finally:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
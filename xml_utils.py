@@ -1,56 +1,367 @@
 import csv
+import hashlib
+import logging
+import mmap
 import os
 import re
+import time
 import traceback
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
 
 # local imports
+import bme_cache
+import bme_diff
+import bme_estimate
+import bme_etim
+import bme_latency
+import bme_metrics
 import bme_parser
+import bme_stats
+import bme_validator
+from bme_logging import log_limited
 
 
 # Main Process XML data.
-def xml_parse(file_path, logger):
+def xml_parse(
+    file_path,
+    logger,
+    mime_assets=False,
+    normalize_features=False,
+    finalize_workers=None,
+    sort_by=None,
+    sort_run_size=100_000,
+    output_format="csv",
+    column_mappings=None,
+    product_layout="wide",
+    langs=None,
+    split_langs=False,
+    etim_dict=None,
+    etim_lang="en",
+    slow_product_ms=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+    slow_products=0,
+    group_paths=False,
+    reference_index=False,
+    typed=False,
+    recover=False,
+    cache=True,
+    metrics_file=None,
+    metrics_interval=bme_metrics.DEFAULT_INTERVAL,
+):
     file_name = os.path.splitext(os.path.basename(file_path))[0]
     logger.info(f"Spuštění nové úlohy")
     logger.info(f"Zpracovávání souboru: {file_name}")
 
-    # Get encoding
+    # Nastavení, která ovlivňují výstupy - součást klíče cache.
+    conversion_options = {
+        "mime_assets": mime_assets,
+        "normalize_features": normalize_features,
+        "sort_by": sort_by,
+        "output_format": output_format,
+        "column_mappings": column_mappings,
+        "product_layout": product_layout,
+        "langs": langs,
+        "split_langs": split_langs,
+        "etim_dict": bme_etim.dictionary_signature(etim_dict) if etim_dict else None,
+        "etim_lang": etim_lang if etim_dict else None,
+        "slow_products": slow_products,
+        "recover": recover,
+        "group_paths": group_paths,
+        "reference_index": reference_index,
+        "typed": typed,
+    }
+    metrics = None
+    if metrics_file:
+        metrics_target = bme_metrics.metrics_path(metrics_file, file_name)
+        metrics = bme_metrics.RunMetrics(metrics_target, file_name, logger, metrics_interval)
+    success = False
+    try:
+        if cache and bme_cache.lookup(file_path, file_name, conversion_options, logger):
+            if metrics is not None:
+                metrics.cache_hit = True
+            success = True
+            return
+        if cache:
+            bme_cache.invalidate(file_name)
+        input_sha256 = None
+        output_files = []
+
+        # Get encoding
+        encoding = get_xml_declared_encoding(file_path, logger)
+        logger.debug(f"Znaková sada XML souboru: {encoding}")
+
+        xml_kind = detect_xml_kind(file_path, logger)
+        if xml_kind == "invalid":
+            raise ET.ParseError("Soubor není validní XML nebo je poškozený.")
+
+        # Check doctype and bmecat tags
+        if check_bmecat_and_doctype(file_path, logger, encoding):
+            # Hash vstupu se počítá z bajtů, které čte parser - soubor se nečte dvakrát.
+            # Režim --recover čte soubor přes mmap a hashuje přečtené úseky.
+            source = bme_cache.HashingReader(file_path) if cache and not recover else None
+            recovery = None
+            if recover:
+                recovery = RecoveringRecordReader(
+                    file_path, file_name, logger, output_format=output_format, encoding=encoding, hash_input=cache
+                )
+            try:
+                output_files = stream_bmecat_to_csv(
+                    file_path=file_path,
+                    source=source,
+                    file_name=file_name,
+                    logger=logger,
+                    mime_assets=mime_assets,
+                    normalize_features=normalize_features,
+                    finalize_workers=finalize_workers,
+                    sort_by=sort_by,
+                    sort_run_size=sort_run_size,
+                    output_format=output_format,
+                    column_mappings=column_mappings,
+                    product_layout=product_layout,
+                    langs=langs,
+                    split_langs=split_langs,
+                    etim_dict=etim_dict,
+                    etim_lang=etim_lang,
+                    slow_product_ms=slow_product_ms,
+                    slow_products=slow_products,
+                    group_paths=group_paths,
+                    reference_index=reference_index,
+                    typed=typed,
+                    metrics=metrics,
+                    encoding=encoding,
+                    recovery=recovery,
+                )
+                if source:
+                    input_sha256 = source.hexdigest()
+                elif recovery is not None:
+                    input_sha256 = recovery.hexdigest()
+            except ET.ParseError as e:
+                logger.error(f"Chyba v XML souboru: {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Chyba funkce xml_parse: {e}")
+                logger.error(traceback.format_exc())
+                raise
+            finally:
+                if source:
+                    source.close()
+        else:
+            # BMECAT root s neplatnou strukturou/verzí je chyba, ne generic fallback.
+            if xml_kind == "bmecat":
+                raise ValueError("Soubor je BMECAT, ale neprošel strukturální kontrolou.")
+            logger.warning(f"Pokus jako obecný xml soubor")
+            if metrics is not None:
+                metrics.start_stage("parse")
+            source = bme_cache.HashingReader(file_path) if cache else None
+            try:
+                output_files = save_generic_xml_stream(
+                    file_path,
+                    file_name,
+                    logger,
+                    sort_by=sort_by,
+                    sort_run_size=sort_run_size,
+                    output_format=output_format,
+                    column_mappings=column_mappings,
+                    typed=typed,
+                    source=source,
+                )
+                if source:
+                    input_sha256 = source.hexdigest()
+            except ET.ParseError as e:
+                logger.error(f"Chyba v XML souboru: {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Chyba funkce save_generic_xml_stream: {e}")
+                logger.error(traceback.format_exc())
+                raise
+            finally:
+                if source:
+                    source.close()
+
+        if input_sha256:
+            bme_cache.store(file_path, file_name, conversion_options, input_sha256, output_files, logger)
+        success = True
+    finally:
+        if metrics is not None:
+            metrics.finish(success)
+
+# Souborový objekt, který nejdřív vrátí již přečtený začátek a pak pokračuje v původním streamu.
+class PrefixedReader:
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size=-1):
+        if self._prefix:
+            if size is None or size < 0:
+                data, self._prefix = self._prefix + self._stream.read(), b""
+                return data
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            return data
+        return self._stream.read(size)
+
+
+def read_stream_root(stream, max_bytes=1024 * 1024):
+    """
+    Přečte ze streamu začátek dokumentu až po root element.
+    Vrací (přečtené bajty, root element) - bajty se pak parseru předají přes PrefixedReader.
+    """
+    parser = ET.XMLPullParser(events=("start",))
+    head = bytearray()
+    while len(head) < max_bytes:
+        chunk = stream.read(65536)
+        if not chunk:
+            break
+        head += chunk
+        parser.feed(chunk)
+        for _, root in parser.read_events():
+            return bytes(head), root
+    raise ET.ParseError("Root element nenalezen na začátku streamu.")
+
+
+# Převod BMEcat katalogu ze streamu (např. HTTP upload) bez uložení vstupu na disk.
+def xml_parse_stream(
+    stream,
+    file_name,
+    logger,
+    mime_assets=False,
+    normalize_features=False,
+    finalize_workers=None,
+    sort_by=None,
+    sort_run_size=100_000,
+    output_format="csv",
+    column_mappings=None,
+    product_layout="wide",
+    langs=None,
+    split_langs=False,
+    etim_dict=None,
+    etim_lang="en",
+    slow_product_ms=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+    slow_products=0,
+    group_paths=False,
+    reference_index=False,
+    typed=False,
+    metrics_file=None,
+    metrics_interval=bme_metrics.DEFAULT_INTERVAL,
+    metrics_name=None,
+):
+    # metrics_name: štítek a název souboru metrik (server předává jméno uploadu, ne unikátní jméno úlohy).
+    logger.info(f"Zpracovávání streamu: {file_name}")
+    metrics = None
+    if metrics_file:
+        metrics_name = metrics_name or file_name
+        metrics = bme_metrics.RunMetrics(bme_metrics.metrics_path(metrics_file, metrics_name), metrics_name, logger, metrics_interval)
+    success = False
+    try:
+        head, root = read_stream_root(stream)
+        if not check_bmecat_root(root, logger):
+            raise ValueError("Stream není podporovaný BMECAT katalog.")
+
+        stream_bmecat_to_csv(
+            file_path=file_name,
+            source=PrefixedReader(head, stream),
+            file_name=file_name,
+            logger=logger,
+            mime_assets=mime_assets,
+            normalize_features=normalize_features,
+            finalize_workers=finalize_workers,
+            sort_by=sort_by,
+            sort_run_size=sort_run_size,
+            output_format=output_format,
+            column_mappings=column_mappings,
+            product_layout=product_layout,
+            langs=langs,
+            split_langs=split_langs,
+            etim_dict=etim_dict,
+            etim_lang=etim_lang,
+            slow_product_ms=slow_product_ms,
+            slow_products=slow_products,
+            group_paths=group_paths,
+            reference_index=reference_index,
+            typed=typed,
+            metrics=metrics,
+        )
+        success = True
+    finally:
+        if metrics is not None:
+            metrics.finish(success)
+
+
+# Validace BMEcat souboru bez CSV výstupů (--validate).
+# Vrací počet nalezených problémů.
+def xml_validate(file_path, logger):
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    logger.info(f"Validace souboru: {file_name}")
+
     encoding = get_xml_declared_encoding(file_path, logger)
-    logger.debug(f"Znaková sada XML souboru: {encoding}")
+    if detect_xml_kind(file_path, logger) != "bmecat" or not check_bmecat_and_doctype(file_path, logger, encoding):
+        raise ValueError("Soubor není validní BMECAT, validaci nelze provést.")
+
+    # Odhad počtu produktů pro dimenzování Bloom filtru (produkt má typicky stovky bajtů a víc).
+    expected_items = max(100_000, os.path.getsize(file_path) // 256)
+    validator = bme_validator.CatalogValidator(file_name, logger, expected_items=expected_items)
+    try:
+        for _, element in iter_end_elements(file_path, {"PRODUCT", "ARTICLE"}, logger):
+            validator.check_product(element)
+        return validator.finalize()
+    except BaseException:
+        validator.cleanup()
+        raise
+
+
+# Rychlý profil katalogu bez převodu (--stats).
+def xml_stats(file_path, logger, output_format="csv"):
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    logger.info(f"Profil souboru: {file_name}")
 
     xml_kind = detect_xml_kind(file_path, logger)
     if xml_kind == "invalid":
         raise ET.ParseError("Soubor není validní XML nebo je poškozený.")
-
-    # Check doctype and bmecat tags
-    if check_bmecat_and_doctype(file_path, logger, encoding):
-        try:
-            stream_bmecat_to_csv(
-                file_path=file_path,
-                file_name=file_name,
-                logger=logger,
-            )
-        except ET.ParseError as e:
-            logger.error(f"Chyba v XML souboru: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Chyba funkce xml_parse: {e}")
-            logger.error(traceback.format_exc())
-            raise
+    if xml_kind == "bmecat":
+        record_tags = ("PRODUCT", "ARTICLE")
     else:
-        # BMECAT root s neplatnou strukturou/verzí je chyba, ne generic fallback.
-        if xml_kind == "bmecat":
-            raise ValueError("Soubor je BMECAT, ale neprošel strukturální kontrolou.")
-        logger.warning(f"Pokus jako obecný xml soubor")
-        try:
-            save_generic_xml_stream(file_path, file_name, logger)
-        except ET.ParseError as e:
-            logger.error(f"Chyba v XML souboru: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Chyba funkce save_generic_xml_stream: {e}")
-            logger.error(traceback.format_exc())
-            raise
+        record_tag, _ = detect_generic_record_tag(file_path, logger)
+        record_tags = (record_tag,) if record_tag else tuple(_GENERIC_RECORD_TAGS)
+    return bme_stats.profile_catalog(file_path, file_name, logger, record_tags=record_tags, output_format=output_format)
+
+
+# Rychlý odhad nákladů převodu ze vzorku záznamů (--estimate).
+def xml_estimate(file_path, logger, windows=bme_estimate.DEFAULT_WINDOWS, window_records=bme_estimate.DEFAULT_WINDOW_RECORDS, product_layout="wide"):
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    logger.info(f"Odhad nákladů převodu: {file_name}")
+
+    encoding = get_xml_declared_encoding(file_path, logger)
+    # Kontroluje se jen začátek souboru - celý soubor se při odhadu nečte.
+    if not check_bmecat_and_doctype(file_path, logger, encoding):
+        logger.error("Odhad je podporován jen pro BMECAT soubory.")
+        return None
+    reader = SampledRecordReader(file_path, file_name, logger, windows=windows, window_records=window_records, encoding=encoding)
+    return bme_estimate.estimate_catalog(reader, file_name, logger, product_layout=product_layout)
+
+
+# Porovnání dvou verzí BMEcat katalogu (příkaz diff).
+def xml_diff(old_file_path, new_file_path, logger, run_size=50_000):
+    old_name = os.path.splitext(os.path.basename(old_file_path))[0]
+    new_name = os.path.splitext(os.path.basename(new_file_path))[0]
+    logger.info(f"Porovnání katalogů: {old_name} -> {new_name}")
+
+    for file_path in (old_file_path, new_file_path):
+        encoding = get_xml_declared_encoding(file_path, logger)
+        if detect_xml_kind(file_path, logger) != "bmecat" or not check_bmecat_and_doctype(file_path, logger, encoding):
+            raise ValueError(f"Soubor {file_path} není validní BMECAT, porovnání nelze provést.")
+
+    sorters = []
+    try:
+        for name, file_path in ((old_name, old_file_path), (new_name, new_file_path)):
+            logger.info(f"Řazení produktů podle SUPPLIER_PID: {name}")
+            elements = (element for _, element in iter_end_elements(file_path, {"PRODUCT", "ARTICLE"}, logger))
+            sorters.append(bme_diff.sort_catalog(elements, f"{name}_diff", logger, run_size=run_size))
+        return bme_diff.diff_sorted_catalogs(sorters[0], sorters[1], f"{old_name}_vs_{new_name}_diff", logger)
+    finally:
+        for sorter in sorters:
+            sorter.cleanup()
+
 
 # Vrátí encoding deklarovaný v XML prologu.
 # Pokud encoding není uveden, vrátí encoding odvozený z BOM nebo výchozí UTF-8.
@@ -177,34 +488,7 @@ def check_bmecat_and_doctype(
         # Ověření BMECAT rootu a jeho atributů nad skutečným XML elementem.
         context = ET.iterparse(file_path, events=("start",))
         _, root = next(context)
-        root_tag = bme_parser.clean_tag(root.tag)
-
-        if root_tag != "BMECAT":
-            logger.error("Nenalezen tag <BMECAT>")
-            return False
-
-        version = (root.attrib.get("version") or "").strip()
-        if not version:
-            logger.error("BMECAT tag neobsahuje atribut version")
-            return False
-
-        logger.debug("BMECAT root nalezen, atributy: %s", root.attrib)
-
-        if allow_any_version:
-            logger.info("BMECAT verze: %s", version)
-            return True
-
-        allowed_versions_set = set(allowed_versions or ())
-        if version not in allowed_versions_set:
-            logger.error(
-                "Nepodporovana BMECAT verze: %s. Povolene verze: %s",
-                version,
-                ", ".join(sorted(allowed_versions_set)) or "zadne",
-            )
-            return False
-
-        logger.info("BMECAT verze: %s", version)
-        return True
+        return check_bmecat_root(root, logger, allowed_versions, allow_any_version)
 
     except ET.ParseError as e:
         logger.error(f"Chyba XML parseru při kontrole BMECAT: {e}")
@@ -220,6 +504,43 @@ def check_bmecat_and_doctype(
         return False
 
 
+def check_bmecat_root(
+    root,
+    logger,
+    allowed_versions=("1.2", "2005", "2013"),
+    allow_any_version: bool = False,
+):
+    # Kontrola root elementu BMECAT a jeho verze (sdílí ji kontrola souboru i streamu).
+    root_tag = bme_parser.clean_tag(root.tag)
+
+    if root_tag != "BMECAT":
+        logger.error("Nenalezen tag <BMECAT>")
+        return False
+
+    version = (root.attrib.get("version") or "").strip()
+    if not version:
+        logger.error("BMECAT tag neobsahuje atribut version")
+        return False
+
+    logger.debug("BMECAT root nalezen, atributy: %s", root.attrib)
+
+    if allow_any_version:
+        logger.info("BMECAT verze: %s", version)
+        return True
+
+    allowed_versions_set = set(allowed_versions or ())
+    if version not in allowed_versions_set:
+        logger.error(
+            "Nepodporovana BMECAT verze: %s. Povolene verze: %s",
+            version,
+            ", ".join(sorted(allowed_versions_set)) or "zadne",
+        )
+        return False
+
+    logger.info("BMECAT verze: %s", version)
+    return True
+
+
 def _safe_remove_child(parent, element, logger):
     """
     Bezpečně odebere XML element z jeho rodiče.
@@ -247,7 +568,7 @@ def _safe_remove_child(parent, element, logger):
         logger.debug("Nepodařilo se uvolnit element z rodiče: %s", exc)
 
 
-def iter_end_elements(file_path, wanted_tags, logger):
+def iter_end_elements(file_path, wanted_tags, logger, record_depth=None):
     """
     Streamově prochází XML soubor a vrací pouze vybrané elementy.
 
@@ -256,6 +577,11 @@ def iter_end_elements(file_path, wanted_tags, logger):
 
     Po zpracování volajícím kódem se element vyčistí a odebere z rodiče,
     aby se v paměti nedržely již zpracované produkty.
+
+    Pokud je zadáno record_depth, vrací se jen elementy v této hloubce
+    (root má hloubku 1), takže stejnojmenné vnořené elementy se nevrací zvlášť.
+    Bez record_depth se nevrací vybraný element vnořený v jiném vybraném elementu
+    (např. PRODUCT_TO_CATALOGGROUP_MAP uvnitř PRODUCT) - zůstane součástí vnějšího.
     """
     # Převod na set kvůli rychlejšímu testování, zda tag patří mezi požadované.
     wanted_tags = set(wanted_tags)
@@ -295,7 +621,11 @@ def iter_end_elements(file_path, wanted_tags, logger):
         # Rodič aktuálního elementu je předposlední položka ve stacku.
         parent = stack[-2] if len(stack) > 1 else None
 
-        if tag in wanted_tags:
+        if tag in wanted_tags and (
+            len(stack) == record_depth
+            if record_depth is not None
+            else not any(bme_parser.clean_tag(ancestor.tag) in wanted_tags for ancestor in stack[:-1])
+        ):
             # Vrátíme volajícímu kódu název tagu a celý XML element.
             yield tag, elem
 
@@ -312,54 +642,516 @@ def iter_end_elements(file_path, wanted_tags, logger):
             stack.pop()
 
 
-def stream_bmecat_to_csv(file_path, file_name, logger):
+# Elementy BMEcat, které se zpracovávají a hned uvolňují z paměti.
+_BMECAT_RECORD_TAGS = {"HEADER", "CATALOG_STRUCTURE", "PRODUCT", "ARTICLE", *bme_parser.CATALOG_GROUP_MAP_TAGS}
+
+# Komentáře, CDATA a instrukce pro zpracování (bez úvodního "<") - značky uvnitř nich nejsou záznamy.
+# Vzory záznamů je obsahují jako alternativu bez skupiny, _search_markup je přeskočí.
+# Společné "<" na začátku vzoru nechává regex rychle přeskakovat text mezi značkami.
+_SKIPPED_MARKUP = rb"!--.*?-->|!\[CDATA\[.*?\]\]>|\?.*?\?>"
+# Začátek záznamu pro --recover: <PRODUCT / <ARTICLE, volitelně s prefixem namespace.
+_RECORD_START = re.compile(
+    rb"<(?:((?:[A-Za-z_][\w.-]*:)?(PRODUCT|ARTICLE))(?=[\s/>])|" + _SKIPPED_MARKUP + rb")",
+    re.DOTALL,
+)
+_GAP_RECORD_START = re.compile(
+    rb"<(?:((?:[A-Za-z_][\w.-]*:)?(PRODUCT_TO_CATALOGGROUP_MAP|ARTICLE_TO_CATALOGGROUP_MAP))(?=[\s/>])|"
+    + _SKIPPED_MARKUP
+    + rb")",
+    re.DOTALL,
+)
+_REJECT_FIELDS = ("OFFSET", "LENGTH", "TAG", "ERROR", "FRAGMENT")
+
+
+def _search_markup(pattern, data, start=0, end=None):
+    # První shoda vzoru mimo komentáře, CDATA a instrukce pro zpracování (skupina 1), jinak None.
+    end = len(data) if end is None else end
+    while True:
+        match = pattern.search(data, start, end)
+        if match is None or match.group(1) is not None:
+            return match
+        start = match.end()
+
+
+class RecoveringRecordReader:
+    """
+    Čtení záznamů v režimu --recover.
+
+    Soubor se prochází po bajtech (mmap) od jedné hranice <PRODUCT>/<ARTICLE> k další
+    a každý záznam (i samostatné mapování na skupinu mezi produkty) se parsuje samostatně. Poškozený záznam se zapíše i s bajtovým offsetem
+    do output/{file_name}_odmitnute.csv a čtení pokračuje dalším záznamem.
+    Záznam bez koncového tagu končí tam, kde začíná další záznam.
+    Značky uvnitř komentářů, CDATA a instrukcí pro zpracování se za hranice záznamů nepovažují.
+    Prolog (root, HEADER, ...) před prvním záznamem musí být validní, jinak se běh ukončí.
+    """
+
+    mode = "--recover"
+
+    def __init__(self, file_path, file_name, logger, output_format="csv", encoding=None, hash_input=False):
+        self.file_path = file_path
+        self.file_name = file_name
+        self.logger = logger
+        self.output_format = output_format
+        encoding = (encoding or get_xml_declared_encoding(file_path, logger)).lower()
+        if encoding.startswith("utf-16") or encoding.startswith("utf-32"):
+            raise ValueError(f"Režim {self.mode} nepodporuje kódování {encoding}.")
+        self.encoding = "utf-8" if encoding == "utf-8-sig" else encoding
+        # Pro metriky (stejně jako bme_metrics.CountingReader).
+        self.bytes_read = 0
+        # hash_input: sha256 vstupu pro cache z přečtených úseků mmap (jako bme_cache.HashingReader).
+        self._digest = hashlib.sha256() if hash_input else None
+        self._hashed = 0
+        self.reject_count = 0
+        self._rejects = None
+        self._end_patterns = {}
+        self._wrapper_start = None
+
+    def __iter__(self):
+        with open(self.file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            match = _search_markup(_RECORD_START, data)
+            prolog_end = match.start() if match else len(data)
+            namespaces = {}
+            yield from self._iter_prolog(data, prolog_end, namespaces)
+
+            self._set_namespaces(namespaces)
+
+            while match is not None:
+                next_match = _search_markup(_RECORD_START, data, match.end())
+                limit = next_match.start() if next_match else len(data)
+                element, end = self._parse_record(data, match, limit)
+                if element is not None:
+                    yield match.group(2).decode("ascii"), element
+                # Samostatná mapování na skupiny leží mezi produkty (obvykle za posledním).
+                gap_match = _search_markup(_GAP_RECORD_START, data, end, limit)
+                while gap_match is not None:
+                    element, gap_end = self._parse_record(data, gap_match, limit)
+                    if element is not None:
+                        yield gap_match.group(2).decode("ascii"), element
+                    gap_match = _search_markup(_GAP_RECORD_START, data, gap_end, limit)
+                self._consume(data, limit)
+                match = next_match
+            self._consume(data, len(data))
+
+    def _consume(self, data, end):
+        # Úseky se hashují v pořadí čtení, takže soubor se kvůli cache nečte podruhé.
+        if self._digest is not None and end > self._hashed:
+            self._digest.update(data[self._hashed:end])
+            self._hashed = end
+        self.bytes_read = end
+
+    def hexdigest(self):
+        # sha256 celého vstupu; platí až po dočtení (jinak None).
+        if self._digest is None or self._hashed < os.path.getsize(self.file_path):
+            return None
+        return self._digest.hexdigest()
+
+    def _set_namespaces(self, namespaces):
+        # Záznam se parsuje uvnitř obalu s deklaracemi namespace z prologu,
+        # aby tagy vyšly stejně jako při běžném parsování ({ns}PRODUCT).
+        declarations = " ".join(
+            f"xmlns:{prefix}={quoteattr(uri)}" if prefix else f"xmlns={quoteattr(uri)}"
+            for prefix, uri in namespaces.items()
+        )
+        self._wrapper_start = f'<?xml version="1.0" encoding="{self.encoding}"?><RECOVER {declarations}>'.encode(self.encoding)
+
+    def _iter_prolog(self, data, prolog_end, namespaces, chunk_size=1024 * 1024):
+        # Prolog se čte po částech a zpracované skupiny se uvolňují, paměť nezávisí na velikosti CATALOG_GROUP_SYSTEM.
+        parser = ET.XMLPullParser(events=("start-ns", "end"))
+        for offset in range(0, prolog_end, chunk_size):
+            parser.feed(data[offset:min(offset + chunk_size, prolog_end)])
+            for event, item in parser.read_events():
+                if event == "start-ns":
+                    prefix, uri = item
+                    namespaces.setdefault(prefix, uri)
+                    continue
+                tag = bme_parser.clean_tag(item.tag)
+                if tag in _BMECAT_RECORD_TAGS:
+                    yield tag, item
+                    item.clear()
+            self._consume(data, min(offset + chunk_size, prolog_end))
+
+    def _parse_record(self, data, match, limit):
+        # Vrací (element nebo None při odmítnutí, konec záznamu).
+        start = match.start()
+        tag = match.group(2).decode("ascii")
+        end = self._record_end(data, match, limit)
+        if end is None:
+            self._reject(data, start, limit, tag, "Element není ukončen před dalším záznamem nebo koncem souboru.")
+            return None, limit
+        try:
+            return ET.fromstring(self._wrapper_start + data[start:end] + b"</RECOVER>")[0], end
+        except ET.ParseError as exc:
+            self._reject(data, start, end, tag, str(exc))
+            return None, end
+
+    def _record_end(self, data, match, limit):
+        # Konec záznamu: prázdný element <PRODUCT/> nebo koncový tag se stejným (prefixovaným) názvem.
+        start_tag_end = data.find(b">", match.end(), limit)
+        if start_tag_end == -1:
+            return None
+        if data[start_tag_end - 1:start_tag_end] == b"/":
+            return start_tag_end + 1
+        qualified_name = match.group(1)
+        pattern = self._end_patterns.get(qualified_name)
+        if pattern is None:
+            pattern = self._end_patterns[qualified_name] = re.compile(
+                rb"<(?:(/" + re.escape(qualified_name) + rb"\s*>)|" + _SKIPPED_MARKUP + rb")",
+                re.DOTALL,
+            )
+        end_match = _search_markup(pattern, data, start_tag_end, limit)
+        return end_match.end() if end_match else None
+
+    def _reject(self, data, start, end, tag, error):
+        self.reject_count += 1
+        log_limited(self.logger, logging.WARNING, "Odmítnutý záznam", "Odmítnut záznam %s na bajtu %s: %s", tag, start, error)
+        if self._rejects is None:
+            self._rejects = bme_parser.DynamicCsvBuffer(
+                f"{self.file_name}_odmitnute",
+                self.logger,
+                priority_fields=_REJECT_FIELDS,
+                output_format=self.output_format,
+            )
+        self._rejects.writerow({
+            "OFFSET": start,
+            "LENGTH": end - start,
+            "TAG": tag,
+            "ERROR": error,
+            "FRAGMENT": data[start:end].decode(self.encoding, errors="replace"),
+        })
+
+    def finalize(self):
+        if self._rejects is None:
+            self.logger.info("Režim --recover: všechny záznamy načteny bez chyby.")
+            return
+        self._rejects.finalize()
+        self.logger.warning("Režim --recover: odmítnuto záznamů %s, viz %s", self.reject_count, self._rejects.output_file)
+
+    @property
+    def output_files(self):
+        return self._rejects.written_files if self._rejects is not None else []
+
+    def cleanup(self):
+        if self._rejects is not None:
+            self._rejects.cleanup()
+
+
+class SampledRecordReader(RecoveringRecordReader):
+    """
+    Vzorek záznamů pro --estimate: z rovnoměrně rozložených bajtových offsetů souboru (mmap)
+    se vždy najde nejbližší začátek <PRODUCT>/<ARTICLE> a přečte se několik záznamů za sebou.
+    Hranice záznamů se hledají stejně jako v --recover, zbytek souboru se nečte.
+
+    Po iteraci jsou k dispozici file_size, region_start a region_end (bajty od začátku prvního
+    do konce posledního záznamu), sampled_bytes a reject_count.
+    """
+
+    mode = "--estimate"
+
+    def __init__(self, file_path, file_name, logger, windows=16, window_records=100, encoding=None):
+        super().__init__(file_path, file_name, logger, encoding=encoding)
+        self.windows = max(1, int(windows))
+        self.window_records = max(1, int(window_records))
+        self.file_size = 0
+        self.region_start = 0
+        self.region_end = 0
+        self.sampled_bytes = 0
+
+    def __iter__(self):
+        """
+        Vrací (okno, tag, element, bajty záznamu, doba parsování v s).
+        Bajty záznamu sahají až k začátku dalšího záznamu, takže součet přes celý soubor
+        je přesně oblast region_start..region_end.
+        """
+        with open(self.file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self.file_size = len(data)
+            first = _search_markup(_RECORD_START, data)
+            if first is None:
+                return
+            self._set_namespaces(self._root_namespaces(data, first.start()))
+            self.region_start = first.start()
+            self.region_end = self._last_record_end(data)
+            span = self.region_end - self.region_start
+
+            position = self.region_start
+            for window in range(self.windows):
+                offset = max(position, self.region_start + span * window // self.windows)
+                next_offset = self.region_start + span * (window + 1) // self.windows
+                match = _search_markup(_RECORD_START, data, offset, self.region_end)
+                count = 0
+                while match is not None and count < self.window_records:
+                    next_match = _search_markup(_RECORD_START, data, match.end(), self.region_end)
+                    limit = next_match.start() if next_match else self.region_end
+                    start_time = time.perf_counter()
+                    element, _ = self._parse_record(data, match, limit)
+                    seconds = time.perf_counter() - start_time
+                    self.sampled_bytes += limit - match.start()
+                    if element is not None:
+                        yield window, match.group(2).decode("ascii"), element, limit - match.start(), seconds
+                    count += 1
+                    position = limit
+                    # Okno nesmí přesáhnout do dalšího - malé soubory se tak přečtou celé, ale jen jednou.
+                    if limit >= next_offset and window + 1 < self.windows:
+                        break
+                    match = next_match
+                self.bytes_read = position
+
+    def _root_namespaces(self, data, prolog_end, chunk_size=64 * 1024):
+        # Stačí deklarace do startu rootu - prolog (HEADER, CATALOG_GROUP_SYSTEM) se nečte.
+        namespaces = {}
+        parser = ET.XMLPullParser(events=("start-ns", "start"))
+        for offset in range(0, prolog_end, chunk_size):
+            parser.feed(data[offset:min(offset + chunk_size, prolog_end)])
+            for event, item in parser.read_events():
+                if event == "start":
+                    return namespaces
+                prefix, uri = item
+                namespaces.setdefault(prefix, uri)
+        return namespaces
+
+    def _last_record_end(self, data, tail_size=1024 * 1024):
+        # Poslední začátek záznamu se hledá v konci souboru, okno se zvětšuje, dokud ho nenajde.
+        size = len(data)
+        while True:
+            tail_start = max(self.region_start, size - tail_size)
+            last = None
+            for candidate in _RECORD_START.finditer(data, tail_start, size):
+                if candidate.group(1) is not None:
+                    last = candidate
+            if last is not None:
+                end = self._record_end(data, last, size)
+                return end if end is not None else size
+            if tail_start == self.region_start:
+                return size
+            tail_size *= 4
+
+    def _reject(self, data, start, end, tag, error):
+        # Poškozený záznam ve vzorku se jen započítá, odhad nezapisuje žádné výstupy.
+        self.reject_count += 1
+        log_limited(self.logger, logging.DEBUG, "Odmítnutý záznam vzorku", "Záznam %s na bajtu %s nelze načíst: %s", tag, start, error)
+
+
+def stream_bmecat_to_csv(
+    file_path,
+    file_name,
+    logger,
+    mime_assets=False,
+    normalize_features=False,
+    finalize_workers=None,
+    sort_by=None,
+    sort_run_size=100_000,
+    output_format="csv",
+    column_mappings=None,
+    product_layout="wide",
+    langs=None,
+    split_langs=False,
+    etim_dict=None,
+    etim_lang="en",
+    slow_product_ms=bme_latency.DEFAULT_SLOW_PRODUCT_MS,
+    slow_products=0,
+    group_paths=False,
+    reference_index=False,
+    typed=False,
+    source=None,
+    metrics=None,
+    recover=False,
+    encoding=None,
+    recovery=None,
+):
     """
     Streamově převede BMEcat XML soubor do CSV výstupu.
 
     XML se zpracovává postupně přes iterparse, takže se celé nenačítá do RAM.
     Produkty se zpracovávají sekvenčně po jednotlivých elementech.
+    Při langs se uzly v ostatních jazycích zahazují už při parsování,
+    při split_langs vznikne jedna sada výstupů pro každý jazyk.
+    source je volitelný souborový objekt, ze kterého se čte místo file_path.
+    metrics (bme_metrics.RunMetrics) průběžně dostává počty, bajty vstupu a doby fází.
+    recover přeskakuje poškozené záznamy (RecoveringRecordReader), vyžaduje soubor na disku.
+    recovery je volitelná předem vytvořená čtečka pro --recover (např. s hashováním vstupu).
+    Vrací seznam souborů, které běh zapsal do output/ (pro manifest cache).
     """
+    if recover or recovery is not None:
+        if source is not None:
+            raise ValueError("Režim --recover vyžaduje vstup jako soubor na disku.")
+        if recovery is None:
+            recovery = RecoveringRecordReader(file_path, file_name, logger, output_format=output_format, encoding=encoding)
 
     # Processor zajišťuje zpracování hlavičky, produktů a finální zápis.
-    processor = bme_parser.BMEStreamProcessor(file_name, logger)
+    processor_kwargs = dict(
+        mime_assets=mime_assets,
+        normalize_features=normalize_features,
+        finalize_workers=finalize_workers,
+        sort_by=sort_by,
+        sort_run_size=sort_run_size,
+        output_format=output_format,
+        column_mappings=column_mappings,
+        product_layout=product_layout,
+        etim_dict=etim_dict,
+        etim_lang=etim_lang,
+        slow_product_ms=slow_product_ms,
+        slow_products=slow_products,
+        group_paths=group_paths,
+        reference_index=reference_index,
+        typed=typed,
+    )
+    if split_langs:
+        processor = bme_parser.LanguageSplitProcessor(file_name, logger, langs, metrics=metrics, **processor_kwargs)
+    else:
+        processor = bme_parser.BMEStreamProcessor(file_name, logger, langs=langs, metrics=metrics, **processor_kwargs)
+
+    input_file = None
+    if metrics is not None:
+        if recovery is not None:
+            metrics.attach(processor=processor, source=recovery)
+        else:
+            if source is None:
+                source = input_file = open(file_path, "rb")
+            source = bme_metrics.CountingReader(source)
+            metrics.attach(processor=processor, source=source)
+        metrics.start_stage("parse")
+
+    if recovery is not None:
+        records = recovery
+    else:
+        records = iter_end_elements(source or file_path, _BMECAT_RECORD_TAGS, logger)
     
     try:
         # Sekvenční režim.
         # Vše se zpracovává v jednom procesu bez dávkování.
-        for tag, element in iter_end_elements(file_path, {"HEADER", "PRODUCT", "ARTICLE"}, logger):
+        for tag, element in records:
             if tag == "HEADER":
                 processor.process_header(element)
                 #logger.debug(f"processor.process_header_element: {ET.tostring(element, encoding="unicode")}")
+            elif tag == "CATALOG_STRUCTURE":
+                processor.process_catalog_group(element)
+            elif tag in bme_parser.CATALOG_GROUP_MAP_TAGS:
+                processor.process_group_map(element)
             else:
                 processor.process_product_element(element)
                 #logger.debug(f"processor.process_product_element: {ET.tostring(element, encoding="unicode")}")
 
         # Uzavření výstupů, dopsání souborů, případné finální operace.
+        if metrics is not None:
+            metrics.start_stage("finalize")
         processor.finalize()
+        output_files = list(processor.output_files)
+        if recovery is not None:
+            recovery.finalize()
+            output_files += recovery.output_files
 
         logger.info("Strukturální kontrola BMEcat ověřena.")
+        return output_files
 
     except BaseException:
         # Při chybě se provede úklid rozpracovaných výstupů.
         processor.cleanup()
+        if recovery is not None:
+            recovery.cleanup()
 
         # Chyba se znovu vyvolá, aby ji mohl řešit nadřazený kód.
         raise
 
+    finally:
+        if input_file is not None:
+            input_file.close()
+
+
+# Výchozí záznamové tagy obecných feedů, pokud se opakující element nepodaří odhadnout.
+_GENERIC_RECORD_TAGS = {"item", "ITEM", "SHOPITEM", "PRODUCT"}
+
+
+def detect_generic_record_tag(file_path, logger, sample_bytes=4 * 1024 * 1024):
+    """
+    Levný předprůchod přes prvních sample_bytes souboru.
+
+    Spočítá výskyty elementů podle cesty od rootu a jako záznam zvolí
+    opakující se element s potomky v nejmenší hloubce (při shodě ten častější).
+    Vrací (tag, hloubka) nebo (None, None), pokud se nic nenašlo.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    path = []
+    counts = {}
+    with_children = set()
+    read_bytes = 0
+
+    with open(file_path, "rb") as file:
+        while read_bytes < sample_bytes:
+            chunk = file.read(min(65536, sample_bytes - read_bytes))
+            if not chunk:
+                break
+            read_bytes += len(chunk)
+            try:
+                parser.feed(chunk)
+                events = list(parser.read_events())
+            except ET.ParseError as exc:
+                logger.debug("Vzorkování generického XML ukončeno: %s", exc)
+                break
+            for event, elem in events:
+                if event == "start":
+                    if path:
+                        with_children.add(tuple(path))
+                    path.append(bme_parser.clean_tag(elem.tag))
+                else:
+                    key = tuple(path)
+                    counts[key] = counts.get(key, 0) + 1
+                    path.pop()
+                    elem.clear()
+
+    candidates = [key for key, count in counts.items() if count >= 2 and len(key) >= 2 and key in with_children]
+    if not candidates:
+        return None, None
+
+    best = min(candidates, key=lambda key: (len(key), -counts[key]))
+    logger.info(
+        "Odhadnutý záznamový element: %s (hloubka %s, %s× ve vzorku %s kB)",
+        "/".join(best),
+        len(best),
+        counts[best],
+        read_bytes // 1024,
+    )
+    return best[-1], len(best)
+
 
-def save_generic_xml_stream(file_path, output_csv, logger):
+def save_generic_xml_stream(
+    file_path,
+    output_csv,
+    logger,
+    sort_by=None,
+    sort_run_size=100_000,
+    output_format="csv",
+    column_mappings=None,
+    typed=False,
+    source=None,
+):
+    # source: volitelný souborový objekt místo file_path (např. bme_cache.HashingReader).
     output_name = output_csv
-    writer = bme_parser.DynamicCsvBuffer(output_name, logger)
-    product_tags = {"item", "ITEM", "SHOPITEM", "PRODUCT"}
+    column_mappings = column_mappings or {}
+    writer = bme_parser.DynamicCsvBuffer(
+        output_name,
+        logger,
+        sort_by=sort_by,
+        sort_run_size=sort_run_size,
+        output_format=output_format,
+        # Výstup obecného feedu nemá příponu, mapuje se pod klíčem "generic" nebo celým názvem.
+        column_map=column_mappings.get("generic") or column_mappings.get(output_name),
+        typed=typed,
+    )
+    record_tag, record_depth = detect_generic_record_tag(file_path, logger)
+    if record_tag:
+        product_tags = {record_tag}
+    else:
+        logger.warning("Záznamový element nerozpoznán, použijí se výchozí tagy: %s", ", ".join(sorted(_GENERIC_RECORD_TAGS)))
+        product_tags = _GENERIC_RECORD_TAGS
 
     try:
-        for tag, product in iter_end_elements(file_path, product_tags, logger):
-            product_data = {}
-            for element in product:
-                product_data[bme_parser.clean_tag(element.tag)] = element.text.strip() if element.text else ""
+        for tag, product in iter_end_elements(source or file_path, product_tags, logger, record_depth=record_depth):
+            # Atributy záznamu + vnořená data zploštělá stejně jako hlavička (flatten_dict).
+            product_data = {f"@{bme_parser.clean_tag(key)}": value for key, value in product.attrib.items()}
+            product_data.update(bme_parser.flatten_dict(bme_parser.parse_element(product, logger)))
             writer.writerow(product_data)
 
         writer.finalize()
     except BaseException:
         writer.cleanup()
         raise
+    return writer.written_files